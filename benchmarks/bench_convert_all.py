@@ -0,0 +1,109 @@
+"""
+Whole `py3to2 convert-all` runs over a synthetic corpus (see `corpus.py`): wall time,
+files/sec and the peak RSS of the largest process (the command or one of its workers).
+
+    python benchmarks/bench_convert_all.py [--files N] [--blocks N] [--mix ...] [--seed S]
+                                           [--jobs N] [--repeat N] [--json FILE]
+
+Each run converts a fresh copy of the corpus with an empty cache. A second run over
+another copy then measures the cached case. The fastest of `--repeat` runs counts.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from corpus import add_corpus_arguments, generate_corpus  # noqa: E402
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+# 在一个小的中间进程里运行命令：fork 出来的子进程会继承父进程的 ru_maxrss，
+# 而 suite.py 自己已经加载了 pytype
+_RUNNER = '''
+import json, resource, subprocess, sys, time
+start = time.perf_counter()
+process = subprocess.run(sys.argv[1:], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+elapsed = time.perf_counter() - start
+sys.stderr.buffer.write(process.stderr)
+print(json.dumps([process.returncode, elapsed, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss]))
+'''
+
+
+def run_command(args, env):
+    """
+    Runs `args` and returns (seconds, peak RSS in bytes). The peak covers the waited-for
+    descendants of the command too, so a worker pool is included.
+    """
+    process = subprocess.run([sys.executable, '-c', _RUNNER] + list(args), stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE, env=env)
+    returncode, elapsed, peak = json.loads(process.stdout) if process.returncode == 0 else (process.returncode, 0, 0)
+    if returncode != 0:
+        raise RuntimeError('%s failed:\n%s' % (' '.join(args), process.stderr.decode('utf8', 'replace')))
+    # ru_maxrss 的单位：Linux 是 KiB，macOS 是字节
+    if sys.platform != 'darwin':
+        peak *= 1024
+    return elapsed, peak
+
+
+def measure_convert_all(corpus_directory, n_files, jobs=1, repeat=1, extra_args=()):
+    """
+    Returns {'cold': {...}, 'cached': {...}} with the seconds, files/sec and peak RSS of
+    converting copies of `corpus_directory`, first with an empty cache, then with the
+    cache the first run filled.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    work_directory = tempfile.mkdtemp(prefix='py3to2-convert-all-')
+    results = {}
+    try:
+        for _ in range(repeat):
+            cache_directory = os.path.join(work_directory, 'cache')
+            shutil.rmtree(cache_directory, ignore_errors=True)
+            for case in ('cold', 'cached'):
+                copy = os.path.join(work_directory, case)
+                shutil.rmtree(copy, ignore_errors=True)
+                shutil.copytree(corpus_directory, copy)
+                args = [sys.executable, '-m', 'py3to2', 'convert-all', copy, '--jobs', str(jobs),
+                        '--cache-dir', cache_directory] + list(extra_args)
+                elapsed, peak = run_command(args, env)
+                best = results.get(case)
+                if best is None or elapsed < best['seconds']:
+                    results[case] = {'seconds': elapsed, 'files_per_second': n_files / elapsed,
+                                     'peak_rss': peak}
+    finally:
+        shutil.rmtree(work_directory, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_corpus_arguments(parser)
+    parser.add_argument('--jobs', '-j', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--json', type=str, default=None, help='also write the results to this file')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='py3to2-corpus-')
+    try:
+        paths = generate_corpus(directory, args.files, args.blocks, args.mix, args.seed)
+        results = measure_convert_all(directory, len(paths), args.jobs, args.repeat)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print('files: %d, jobs: %d' % (len(paths), args.jobs))
+    for case, result in results.items():
+        print('%-7s %8.3fs  %7.1f files/s  peak RSS %.1f MiB' % (
+            case, result['seconds'], result['files_per_second'], result['peak_rss'] / 2 ** 20))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'files': len(paths), 'jobs': args.jobs, 'runs': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Per-file cost of a warm `Converter` session against the one-shot functions,
+and the peak RSS of converting each file.
+
+    python benchmarks/bench_converter.py [--files N]
+"""
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from py3to2.convert import Converter, apply_libcst_change, apply_lib3to2_change  # noqa: E402
+
+
+SOURCE = '''\
+from typing import Dict, Generic, List, Optional, TypeVar
+
+T = TypeVar('T')
+
+
+class Box{i}(Generic[T]):
+    def __init__(self, value: T) -> None:
+        self.value: T = value
+
+    def get(self, default: Optional[T] = None) -> Optional[T]:
+        return self.value if self.value is not None else default
+
+
+class IntBox{i}(Box{i}[int]):
+    pass
+
+
+def count{i}(items: List[str]) -> Dict[str, int]:
+    counts: Dict[str, int] = {{}}
+    for item in items:
+        counts[item] = counts.get(item, 0) + 1
+    return counts
+'''
+
+
+def one_shot(code, path, directory):
+    code = apply_libcst_change(code, path, directory)
+    return apply_lib3to2_change(code)
+
+
+def reset_peak_rss():
+    # Linux: 把 VmHWM 重置为当前的 RSS
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # 重置不了的时候只能拿到整个进程的峰值
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def run(files, convert):
+    timings = []
+    peaks = []
+    outputs = []
+    for path, code in files:
+        reset_peak_rss()
+        start = time.perf_counter()
+        outputs.append(convert(code, path))
+        timings.append(time.perf_counter() - start)
+        peaks.append(peak_rss())
+    return timings, peaks, outputs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=20)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='py3to2-bench-')
+    files = [(os.path.join(directory, 'mod%d.py' % i), SOURCE.format(i=i)) for i in range(args.files)]
+
+    one_shot_timings, _, one_shot_outputs = run(files, lambda code, path: one_shot(code, path, directory))
+
+    start = time.perf_counter()
+    converter = Converter(directory)
+    setup_time = time.perf_counter() - start
+    session_timings, session_peaks, session_outputs = run(files, converter.convert)
+
+    assert one_shot_outputs == session_outputs, 'Converter output differs from the one-shot functions'
+
+    def mean(xs):
+        return sum(xs) / len(xs) if xs else 0.0
+
+    print('files: %d' % args.files)
+    print('one-shot   first file %.3fs, later files %.3fs/file' % (one_shot_timings[0], mean(one_shot_timings[1:])))
+    print('Converter  setup %.3fs, first file %.3fs, later files %.3fs/file' % (
+        setup_time, session_timings[0], mean(session_timings[1:])))
+    print('saved per file after the first: %.3fs' % (mean(one_shot_timings[1:]) - mean(session_timings[1:])))
+    print('Converter  peak RSS per file: max %.1f MiB, mean %.1f MiB' % (
+        max(session_peaks) / 2 ** 20, mean(session_peaks) / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""
+Import time of the converted modules under Python 2, with and without `--strip-typing`.
+A synthetic corpus (see `corpus.py`) is converted with `convert-tree` both ways, then
+every converted module is imported in a fresh Python 2 interpreter, and the typing
+shims are imported on their own. A module using the runtime forms of typing the shims
+must keep working (`NamedTuple(...)`, `TypedDict(...)`, `class A(Any)`, ...) is
+converted and imported as well, and the benchmark fails if it does not import.
+
+    python benchmarks/bench_import_time.py [--python PYTHON2] [--files N] [--blocks N] [--mix ...]
+                                           [--seed S] [--resolver {pytype,syntactic}] [--repeat N]
+                                           [--json FILE]
+
+The corpus is converted with `--resolver=syntactic` by default, so that the subscripts
+of its generic classes are stripped without running pytype. The fastest of `--repeat`
+interpreters counts, after a first one that writes the `.pyc` files.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from corpus import add_corpus_arguments, generate_corpus  # noqa: E402
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+PACKAGE = 'corpus'
+
+SHIM_MODULES = ('_py3to2_typing', '_py3to2_typing_extensions')
+
+MODES = (('default', []), ('strip-typing', ['--strip-typing']))
+
+# 在运行时用到 typing 的写法，转换之后 shim 要能接住
+SHIM_FORMS = '''\
+from typing import Any, Dict, Generic, NamedTuple, Optional, TypeVar
+from typing_extensions import TypedDict
+
+T = TypeVar('T')
+Point = NamedTuple('Point', [('x', int), ('y', int)])
+ORIGIN = Point(0, 0)
+Movie = TypedDict('Movie', {'title': str, 'year': int}, total=False)
+MOVIE = Movie(title='Brazil', year=1985)
+Table = Dict[str, Optional[int]]
+
+
+class Anything(Any):
+    pass
+
+
+class Pair(NamedTuple):
+    first: int
+    second: int
+
+
+class Box(Generic[T]):
+    def __init__(self, item: T) -> None:
+        self.item = item
+
+
+BOX = Box(Anything())
+PAIR = Pair(1, 2)
+'''
+
+# Python 2 里运行：import 给出的模块，输出耗时和 import 了的 shim
+_IMPORTER = '''
+import json, sys, timeit
+modules = sys.argv[1:]
+__import__(%r)
+start = timeit.default_timer()
+for name in modules:
+    __import__(name)
+elapsed = timeit.default_timer() - start
+shims = sorted(name.split('.')[-1] for name in sys.modules if name.split('.')[-1] in %r)
+print(json.dumps([elapsed, shims]))
+''' % (PACKAGE, SHIM_MODULES)
+
+
+def find_python2():
+    for name in ('python2', 'python2.7'):
+        path = shutil.which(name)
+        if path is not None:
+            return path
+    return None
+
+
+def import_time(python, directory, modules, repeat):
+    """
+    Returns (the smallest seconds to import `modules` from `directory`, the shims they
+    imported).
+    """
+    # 和部署的时候一样，从 .pyc 加载
+    env = {name: value for name, value in os.environ.items() if name != 'PYTHONDONTWRITEBYTECODE'}
+    best = None
+    shims = []
+    for i in range(repeat + 1):
+        process = subprocess.run([python, '-c', _IMPORTER] + list(modules), cwd=directory, env=env,
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if process.returncode != 0:
+            raise RuntimeError('importing the converted modules failed:\n%s'
+                               % process.stderr.decode('utf8', 'replace'))
+        elapsed, shims = json.loads(process.stdout)
+        if i:
+            best = elapsed if best is None else min(best, elapsed)
+    return best, shims
+
+
+def check_shim_forms(python, directory):
+    process = subprocess.run([python, '-c', 'import %s.shim_forms' % PACKAGE], cwd=directory,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if process.returncode != 0:
+        raise RuntimeError('importing the runtime typing forms failed:\n%s'
+                           % process.stderr.decode('utf8', 'replace'))
+
+
+def module_names(directory):
+    names = []
+    for path in sorted(os.listdir(directory)):
+        folder = os.path.join(directory, path)
+        if not os.path.isdir(folder):
+            continue
+        for file in sorted(os.listdir(folder)):
+            if file.endswith('.py') and file != '__init__.py':
+                names.append('%s.%s.%s' % (PACKAGE, path, file[:-len('.py')]))
+    return names
+
+
+def convert(source, target, resolver, extra_args):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    process = subprocess.run([sys.executable, '-m', 'py3to2', 'convert-tree', source, target, '--no-cache',
+                              '--resolver', resolver] + list(extra_args),
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, env=env)
+    if process.returncode != 0:
+        raise RuntimeError('convert-tree failed:\n%s' % process.stderr.decode('utf8', 'replace'))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--python', type=str, default=None, help='the Python 2 interpreter (default: python2)')
+    add_corpus_arguments(parser)
+    parser.add_argument('--resolver', choices=('pytype', 'syntactic'), default='syntactic')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--json', type=str, default=None, help='also write the results to this file')
+    args = parser.parse_args()
+
+    python = args.python or find_python2()
+    if python is None:
+        print('no Python 2 interpreter found, give one with --python')
+        sys.exit(2)
+
+    work_directory = tempfile.mkdtemp(prefix='py3to2-import-time-')
+    results = {}
+    try:
+        source = os.path.join(work_directory, 'src', PACKAGE)
+        generate_corpus(source, args.files, args.blocks, args.mix, args.seed)
+        # 相对 import 的 shim 在 corpus 这一层，它自己也要是一个包
+        with open(os.path.join(source, '__init__.py'), 'w') as f:
+            f.write('')
+        with open(os.path.join(source, 'shim_forms.py'), 'w') as f:
+            f.write(SHIM_FORMS)
+        modules = module_names(source)
+
+        for mode, extra_args in MODES:
+            directory = os.path.join(work_directory, mode)
+            target = os.path.join(directory, PACKAGE)
+            convert(source, target, args.resolver, extra_args)
+            n_importing = sum(1 for name in modules if any(
+                shim in line for shim in SHIM_MODULES
+                for line in open(os.path.join(directory, *name.split('.')) + '.py', encoding='utf8')))
+            check_shim_forms(python, directory)
+            seconds, shims = import_time(python, directory, modules, args.repeat)
+            results[mode] = {'modules': len(modules), 'importing_shims': n_importing, 'seconds': seconds,
+                             'shims': shims}
+        shim_directory = os.path.join(work_directory, MODES[0][0])
+        results['shims'] = {name: import_time(python, shim_directory, ['%s.%s' % (PACKAGE, name)], args.repeat)[0]
+                            for name in SHIM_MODULES}
+    finally:
+        shutil.rmtree(work_directory, ignore_errors=True)
+
+    print('python 2: %s' % python)
+    for mode, _ in MODES:
+        result = results[mode]
+        print('%-14s %3d modules, %3d import a shim, import %7.2f ms (%.0f us/module), shims loaded: %s' % (
+            mode, result['modules'], result['importing_shims'], result['seconds'] * 1000,
+            result['seconds'] * 1e6 / max(result['modules'], 1), ', '.join(result['shims']) or 'none'))
+    for name, seconds in results['shims'].items():
+        print('%-28s import %7.2f ms' % (name, seconds * 1000))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Time and peak memory of the libcst rewrite, fused into one traversal vs one pass per transformer.
+
+    python benchmarks/bench_libcst_passes.py [--lines N]
+
+The type map is left empty so that only the CST work is measured. Times exclude
+`cst.parse_module`; peak memory is measured in a second run under tracemalloc.
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import libcst as cst  # noqa: E402
+
+from py3to2.convert import (  # noqa: E402
+    AddHeader, AddImports, Annotate, RemoveName, RemoveTypehint, create_libcst_transformer,
+)
+
+
+BLOCK = '''\
+class Node{i}(Base):
+    name: str = 'node{i}'
+
+    def visit(self, items: List[int], default: Optional[int] = None) -> Dict[str, int]:
+        # pyc: skip
+        log(items)
+        __cskip_debug = items
+        result: Dict[str, int] = {{}}
+        for item in items:
+            result[str(item)] = item + (default or 0)
+        return result
+
+'''
+
+
+def sequential(module):
+    tree = cst.MetadataWrapper(module)
+    tree = tree.visit(RemoveTypehint(relative_dots=1, type_info={}))
+    for transformer in (AddHeader(), AddImports(), Annotate(), RemoveName()):
+        tree = tree.visit(transformer)
+    return tree.code
+
+
+def fused(module):
+    tree = cst.MetadataWrapper(module)
+    return tree.visit(create_libcst_transformer(1, {})).code
+
+
+def measure(func, module):
+    start = time.perf_counter()
+    output = func(module)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    func(module)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return output, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lines', type=int, default=20000)
+    args = parser.parse_args()
+
+    n_blocks = max(1, args.lines // BLOCK.count('\n'))
+    code = 'from typing import Dict, List, Optional\n\n' + ''.join(BLOCK.format(i=i) for i in range(n_blocks))
+
+    start = time.perf_counter()
+    module = cst.parse_module(code)
+    parse_time = time.perf_counter() - start
+
+    seq_output, seq_time, seq_peak = measure(sequential, module)
+    fused_output, fused_time, fused_peak = measure(fused, module)
+    assert seq_output == fused_output, 'fused output differs from the sequential passes'
+
+    print('lines: %d, parse %.2fs' % (code.count('\n'), parse_time))
+    print('sequential  %.2fs  peak %.1f MiB' % (seq_time, seq_peak / 2 ** 20))
+    print('fused       %.2fs  peak %.1f MiB' % (fused_time, fused_peak / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Time of each stage of the conversion over a synthetic corpus (see `corpus.py`):
+the libcst parse, the search for type queries, the pytype trace, the annotation
+map, each transformer of `apply_libcst_change` run as its own pass, the fused pass
+the converter actually runs, and the lib3to2 fixers (all of them, and only those
+`FixerSet` selects).
+
+    python benchmarks/bench_stages.py [--files N] [--blocks N] [--mix ...] [--seed S] [--json FILE]
+
+pytype only runs on the files the converter would run it on; the pytype options and
+loader are created once, before timing. Times are summed over the corpus.
+"""
+import argparse
+import ast
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import libcst as cst  # noqa: E402
+
+from corpus import add_corpus_arguments, generate_corpus  # noqa: E402
+from py3to2.convert import (  # noqa: E402
+    AddHeader, AddImports, Annotate, Converter, RemoveName, RemoveTypehint, apply_lib3to2_change,
+    create_libcst_transformer, create_refactoring_tool, find_type_queries, get_relative_dots,
+)
+from py3to2.type_index import TypeIndex  # noqa: E402
+
+STAGES = (
+    'parse', 'type_queries', 'pytype_trace', 'annotation_map',
+    'RemoveTypehint', 'AddHeader', 'AddImports', 'Annotate', 'RemoveName', 'libcst_fused',
+    'lib3to2', 'lib3to2_selected',
+)
+
+
+class Timer:
+    def __init__(self):
+        self.totals = {stage: 0.0 for stage in STAGES}
+
+    def __call__(self, stage, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        self.totals[stage] += time.perf_counter() - start
+        return result
+
+
+def measure_stages(paths, directory):
+    """
+    Returns ({stage: seconds}, number of files that ran pytype) for the modules at `paths`.
+    """
+    converter = Converter(directory)
+    expression_type = converter.pytype.load()
+    options, loader = converter.pytype.options, converter.pytype.loader
+    tool = create_refactoring_tool()
+    timer = Timer()
+    n_inferred = 0
+
+    for path in paths:
+        with open(path, encoding='utf8') as f:
+            code = f.read()
+        relative_dots = get_relative_dots(path, directory)
+
+        module = timer('parse', cst.parse_module, code)
+        wrapper = cst.MetadataWrapper(module)
+        queries = timer('type_queries', find_type_queries, wrapper)
+
+        types = TypeIndex()
+        if converter.needs_type_inference(queries):
+            n_inferred += 1
+            source_code, _ = timer('pytype_trace', expression_type.infer_and_trace, code, options, loader)
+
+            def annotation_map():
+                annotated = expression_type.annotate_source(code, source_code, ast, options,
+                                                            frozenset(queries.positions))
+                return expression_type.type_index_from_types(expression_type.generate_annotation_map(annotated))
+            types = timer('annotation_map', annotation_map)
+
+        # 每个 transformer 单独一遍，和 apply_libcst_change 的顺序相同
+        tree = timer('RemoveTypehint', cst.MetadataWrapper(module).visit,
+                     RemoveTypehint(relative_dots=relative_dots, type_info=types))
+        for transformer in (AddHeader(), AddImports(), Annotate(), RemoveName()):
+            tree = timer(type(transformer).__name__, tree.visit, transformer)
+
+        fused = timer('libcst_fused', wrapper.visit, create_libcst_transformer(relative_dots, types)).code
+        assert fused == tree.code, 'fused pass differs from the sequential passes for %s' % path
+
+        timer('lib3to2', apply_lib3to2_change, fused, tool)
+        timer('lib3to2_selected', converter.fixers.refactor, fused)
+
+    return timer.totals, n_inferred
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_corpus_arguments(parser)
+    parser.add_argument('--json', type=str, default=None, help='also write the results to this file')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='py3to2-stages-')
+    try:
+        paths = generate_corpus(directory, args.files, args.blocks, args.mix, args.seed)
+        totals, n_inferred = measure_stages(paths, directory)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print('files: %d (%d with pytype)' % (len(paths), n_inferred))
+    for stage in STAGES:
+        print('%-18s %8.3fs  %7.2f ms/file' % (stage, totals[stage], totals[stage] * 1000 / len(paths)))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'files': len(paths), 'inferred': n_inferred, 'stages': totals}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,7 @@
+# 小写的类也可以下标：prefilter 不能只看大写开头的名字
+from collections import defaultdict, deque
+
+q = deque[int]()
+d = defaultdict[str, list](list)
+counts = {'a': 1}
+n = counts['a']
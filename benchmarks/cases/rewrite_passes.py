@@ -0,0 +1,40 @@
+# 五个 libcst pass 都会动到的写法
+from __future__ import annotations, division
+import typing, os
+from typing import Dict, Generic, List, Optional, TypeVar
+
+T = TypeVar('T')
+
+
+class Box(Generic[T]):
+    label: str = 'box'
+    size: int
+
+    def __init__(self, item: T, default: Optional[T] = None) -> None:
+        self.item = item
+        self.default = default
+
+    def get(self) -> T:
+        # pyc: skip
+        log(self.item)
+        __cskip_debug = self.item
+        return self.item
+
+
+class __cskip_Debug(Box[int]):
+    pass
+
+
+class IntBox(Box[int], __cskip_Mixin):
+    pass
+
+
+def count(items: typing.List[str]) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for item in items:
+        counts[item] = counts.get(item, 0) + 1
+    return counts
+
+
+Table = Dict[str, List[int]]
+path = os.path.join('a', 'b')
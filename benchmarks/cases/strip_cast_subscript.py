@@ -0,0 +1,7 @@
+# --strip-typing 内联 cast 的值是一个下标
+from typing import List, cast
+
+a = [1]
+y = cast(int, a[0])
+rows: List[List[int]] = [[1, 2]]
+first = cast(List[int], rows[0])[1:]
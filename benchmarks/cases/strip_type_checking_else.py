@@ -0,0 +1,14 @@
+# --strip-typing 把 TYPE_CHECKING 的 else 里的类留下来
+from typing import TYPE_CHECKING, Generic, TypeVar
+
+T = TypeVar('T')
+
+if TYPE_CHECKING:
+    from collections import OrderedDict
+else:
+    class A(object):
+        pass
+
+    class Box(Generic[T]):
+        def __init__(self, item: T) -> None:
+            self.item = item
@@ -0,0 +1,39 @@
+# --strip-typing 删除的每一种写法
+from typing import TYPE_CHECKING, Any, Callable, Generic, NewType, Optional, TypeVar, cast, overload
+import typing as t
+
+__all__ = ['Exported', 'make']
+
+T = TypeVar('T')
+K = TypeVar('K', bound=Optional[int])
+Exported = TypeVar('Exported')
+UserId = NewType('UserId', int)
+F = TypeVar('F', bound=Callable[..., Any])
+
+if TYPE_CHECKING:
+    from collections import OrderedDict
+elif t.TYPE_CHECKING:
+    pass
+else:
+    OrderedDict = dict
+
+
+class Pair(Generic[T, K], t.Generic[T]):
+    def first(self, x: T) -> T:
+        return cast(T, x)
+
+
+@overload
+def make(x: int) -> int: ...
+@overload
+def make(x: str) -> str: ...
+def make(x):
+    value = cast('Pair[int, int]', x) or cast(int, x + 1) * 2
+    return t.cast(Any, value)
+
+
+def identity(func: F) -> F:
+    return func
+
+
+uid = UserId(5)
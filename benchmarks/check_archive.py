@@ -0,0 +1,76 @@
+"""
+Import check of `convert-all --output-archive`: a synthetic corpus (see `corpus.py`) is
+converted into a zip and into a wheel, and every converted module is imported under
+Python 2 with the archive on `sys.path`, as `zipimport` loads an installed wheel.
+
+    python benchmarks/check_archive.py [--python PYTHON2] [--files N] [--blocks N] [--mix ...] [--seed S]
+
+Exits with status 1 if an archive is not written or a module fails to import.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_import_time import PACKAGE, find_python2, module_names  # noqa: E402
+from corpus import add_corpus_arguments, generate_corpus  # noqa: E402
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+ARCHIVES = ('%s.zip' % PACKAGE, '%s-1.0-py2-none-any.whl' % PACKAGE)
+
+# Python 2 里运行：archive 放进 sys.path，import 给出的模块
+_IMPORTER = '''
+import sys
+sys.path.insert(0, sys.argv[1])
+for name in sys.argv[2:]:
+    __import__(name)
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--python', type=str, default=None, help='the Python 2 interpreter (default: python2)')
+    add_corpus_arguments(parser)
+    args = parser.parse_args()
+
+    python = args.python or find_python2()
+    if python is None:
+        print('no Python 2 interpreter found, give one with --python')
+        sys.exit(2)
+
+    work_directory = tempfile.mkdtemp(prefix='py3to2-archive-')
+    failed = False
+    try:
+        # 不写 __init__.py：archive 里要补上
+        source = os.path.join(work_directory, PACKAGE)
+        generate_corpus(source, args.files, args.blocks, args.mix, args.seed)
+        modules = module_names(source)
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+        for name in ARCHIVES:
+            archive = os.path.join(work_directory, name)
+            process = subprocess.run([sys.executable, '-m', 'py3to2', 'convert-all', source, '--no-cache',
+                                      '--output-archive', archive], stdout=subprocess.DEVNULL,
+                                     stderr=subprocess.PIPE, env=env)
+            if process.returncode != 0:
+                print('%-28s FAILED to convert\n%s' % (name, process.stderr.decode('utf8', 'replace')))
+                failed = True
+                continue
+            process = subprocess.run([python, '-c', _IMPORTER, archive] + modules, cwd=work_directory,
+                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            if process.returncode != 0:
+                print('%-28s FAILED to import\n%s' % (name, process.stderr.decode('utf8', 'replace')))
+                failed = True
+            else:
+                print('%-28s %3d modules import  ok' % (name, len(modules)))
+    finally:
+        shutil.rmtree(work_directory, ignore_errors=True)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
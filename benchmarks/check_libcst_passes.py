@@ -0,0 +1,109 @@
+"""
+Checks that the fused libcst rewrite gives the same code as one pass per transformer,
+on the modules of `benchmarks/cases` (or of `--directory`), with and without
+`--strip-typing`. The type map comes from `--resolver=syntactic`, so that the
+subscripts and bases `RemoveTypehint` acts on are there without running pytype.
+
+    python benchmarks/check_libcst_passes.py [--directory DIR]
+
+The separate passes re-derive the positions and the typing removals from the tree
+they are given, so they do not depend on the node identities the fused pass keeps.
+With `--strip-typing`, `UnwrapTyping` runs first and `StripTyping` second: the
+`typing` imports are still there when each of them looks for what to remove.
+Exits with status 1 if an output differs or a pass raises.
+"""
+import argparse
+import difflib
+import os
+import sys
+import traceback
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import libcst as cst  # noqa: E402
+
+from py3to2.convert import (  # noqa: E402
+    AddHeader, AddImports, Annotate, RemoveName, RemoveTypehint, apply_libcst_change, find_type_queries,
+    get_relative_dots,
+)
+from py3to2.resolver import ClassIndex, resolve_type_index  # noqa: E402
+from py3to2.stamp import create_stamp  # noqa: E402
+from py3to2.strip_typing import StripTyping, UnwrapTyping, find_typing_removals  # noqa: E402
+
+CASES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cases')
+
+
+def type_index(wrapper, code, path, directory, index):
+    positions = find_type_queries(wrapper).positions
+    return resolve_type_index(wrapper, code, positions, index, path, directory)
+
+
+def fused(code, path, directory, index, strip_typing):
+    wrapper = cst.MetadataWrapper(cst.parse_module(code))
+    types = type_index(wrapper, code, path, directory, index)
+    return apply_libcst_change(code, path, directory, types, wrapper, strip_typing)
+
+
+def sequential(code, path, directory, index, strip_typing):
+    tree = cst.parse_module(code)
+    if strip_typing:
+        # 每一遍都在自己的树上重新找要删的东西；typing 的 import 要到 StripTyping 才删，
+        # 所以先 UnwrapTyping，后面的 TypingUsage 还认得出 typing 的名字
+        for transformer in (UnwrapTyping, StripTyping):
+            wrapper = cst.MetadataWrapper(tree)
+            _, removals = find_typing_removals(wrapper, type_index(wrapper, tree.code, path, directory, index))
+            tree = wrapper.visit(transformer(removals))
+    wrapper = cst.MetadataWrapper(tree)
+    types = type_index(wrapper, tree.code, path, directory, index)
+    if strip_typing:
+        types, _ = find_typing_removals(wrapper, types)
+    relative_dots = get_relative_dots(path, directory)
+    tree = wrapper.visit(RemoveTypehint(relative_dots=relative_dots, type_info=types))
+    for transformer in (AddHeader(create_stamp(code, relative_dots)), AddImports(), Annotate(), RemoveName()):
+        tree = tree.visit(transformer)
+    return tree.code
+
+
+def run(func, *args):
+    try:
+        return func(*args), None
+    except Exception:
+        return None, traceback.format_exc()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--directory', type=str, default=CASES)
+    args = parser.parse_args()
+
+    directory = args.directory
+    paths = sorted(os.path.join(folder, file) for folder, _, files in os.walk(directory)
+                   for file in files if file.endswith('.py'))
+    index = ClassIndex.build(directory, paths)
+    n_failed = 0
+    for path in paths:
+        with open(path, encoding='utf8') as f:
+            code = f.read()
+        name = os.path.relpath(path, directory)
+        for strip_typing in (False, True):
+            mode = 'strip-typing' if strip_typing else 'default'
+            expected, expected_error = run(sequential, code, path, directory, index, strip_typing)
+            actual, actual_error = run(fused, code, path, directory, index, strip_typing)
+            if expected_error is None and actual_error is None and expected == actual:
+                print('%-40s %-13s ok' % (name, mode))
+                continue
+            n_failed += 1
+            print('%-40s %-13s FAILED' % (name, mode))
+            if expected_error is not None:
+                print('separate passes raised:\n' + expected_error)
+            if actual_error is not None:
+                print('fused pass raised:\n' + actual_error)
+            if expected_error is None and actual_error is None:
+                sys.stdout.writelines(difflib.unified_diff(expected.splitlines(True), actual.splitlines(True),
+                                                           'separate passes', 'fused pass'))
+    print('%d case(s), %d failed' % (len(paths) * 2, n_failed))
+    sys.exit(1 if n_failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Checks that skipping pytype on the files the prefilter finds nothing in does not change
+the output: the modules of `benchmarks/cases` (or of `--directory`) are converted with
+and without the prefilter, and both results must be the same. Needs pytype.
+
+    python benchmarks/check_prefilter.py [--directory DIR]
+
+Exits with status 1 if an output differs or a conversion raises.
+"""
+import argparse
+import difflib
+import os
+import sys
+import traceback
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import libcst as cst  # noqa: E402
+
+from py3to2.convert import Converter, find_type_queries  # noqa: E402
+
+CASES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cases')
+
+
+def run(converter, code, path):
+    try:
+        return converter.convert(code, path), None
+    except Exception:
+        return None, traceback.format_exc()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--directory', type=str, default=CASES)
+    args = parser.parse_args()
+
+    directory = args.directory
+    paths = sorted(os.path.join(folder, file) for folder, _, files in os.walk(directory)
+                   for file in files if file.endswith('.py'))
+    prefiltered = Converter(directory, prefilter=True)
+    inferred = Converter(directory, prefilter=False)
+    n_failed = n_skipped = 0
+    for path in paths:
+        with open(path, encoding='utf8') as f:
+            code = f.read()
+        name = os.path.relpath(path, directory)
+        expected, expected_error = run(inferred, code, path)
+        actual, actual_error = run(prefiltered, code, path)
+        if expected_error is None and actual_error is None and expected == actual:
+            queries = find_type_queries(cst.MetadataWrapper(cst.parse_module(code)))
+            skipped = not prefiltered.needs_type_inference(queries)
+            n_skipped += skipped
+            print('%-40s ok%s' % (name, '  (pytype skipped)' if skipped else ''))
+            continue
+        n_failed += 1
+        print('%-40s FAILED' % name)
+        if expected_error is not None:
+            print('without the prefilter:\n' + expected_error)
+        if actual_error is not None:
+            print('with the prefilter:\n' + actual_error)
+        if expected_error is None and actual_error is None:
+            sys.stdout.writelines(difflib.unified_diff(expected.splitlines(True), actual.splitlines(True),
+                                                       'without the prefilter', 'with the prefilter'))
+    print('%d file(s), %d without pytype, %d failed' % (len(paths), n_skipped, n_failed))
+    sys.exit(1 if n_failed else 0)
+
+
+if __name__ == '__main__':
+    main()
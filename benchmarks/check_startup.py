@@ -0,0 +1,127 @@
+"""
+Startup budget of the command line: runs each light command under `python -X importtime`,
+checks the cumulative import time of `py3to2.main` against a budget and checks that the
+heavy dependencies a command does not need are never imported.
+
+    python benchmarks/check_startup.py [--budget-ms MS] [--repeat N]
+
+Exits with status 1 if a command is over budget or imports a forbidden module.
+"""
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+HEAVY = ('libcst', 'lib2to3', 'lib3to2', 'pytype')
+
+SOURCE = '''\
+from typing import Dict, List
+
+
+def count(items: List[str]) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for item in items:
+        counts[item] = counts.get(item, 0) + 1
+    return counts
+'''
+
+_IMPORT_TIME_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$')
+
+
+def parse_importtime(stderr: str):
+    """
+    Returns {module: cumulative microseconds} from `-X importtime` output.
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        match = _IMPORT_TIME_RE.match(line)
+        if match:
+            modules[match.group(4)] = int(match.group(2))
+    return modules
+
+
+def import_times(args, repeat, prepare, returncodes=(0,)):
+    """
+    Runs `python -m py3to2 ARGS` `repeat` times, calling `prepare` before each run, and
+    returns the imported modules of the last run and the smallest cumulative import
+    time of `py3to2.main` in ms.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    best = None
+    modules = {}
+    for _ in range(repeat):
+        prepare()
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-m', 'py3to2'] + args,
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, env=env,
+                                 universal_newlines=True)
+        if process.returncode not in returncodes:
+            raise RuntimeError('py3to2 %s failed:\n%s' % (' '.join(args), process.stderr))
+        modules = parse_importtime(process.stderr)
+        total = modules.get('py3to2.main', 0) / 1000
+        best = total if best is None else min(best, total)
+    return modules, best
+
+
+def forbidden_imports(modules, forbidden):
+    return sorted(name for name in modules if name.split('.')[0] in forbidden)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--budget-ms', type=float, default=150.0,
+                        help='budget of the cumulative import time of py3to2.main for light commands')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per command; the fastest one counts')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='py3to2-startup-')
+    source_directory = os.path.join(directory, 'src')
+    source_path = os.path.join(source_directory, 'mod.py')
+    output_directory = os.path.join(directory, 'out')
+
+    def prepare():
+        # convert-all converts in place, so every run starts from a fresh copy
+        for folder in (source_directory, output_directory):
+            shutil.rmtree(folder, ignore_errors=True)
+            os.makedirs(folder)
+        with open(source_path, 'w') as f:
+            f.write(SOURCE)
+
+    # (name, arguments, forbidden top-level packages, budget in ms or None)
+    checks = [
+        ('--help', ['--help'], HEAVY, args.budget_ms),
+        ('convert --help', ['convert', '--help'], HEAVY, args.budget_ms),
+        ('initialize', ['initialize', output_directory], HEAVY, args.budget_ms),
+        ('check', ['check', source_directory, output_directory], HEAVY, args.budget_ms),
+        ('convert --no-infer', ['convert', '--no-infer', source_directory, source_path,
+                                os.path.join(output_directory, 'mod.py')], ('pytype',), None),
+        ('convert-all --no-infer', ['convert-all', '--no-infer', '--no-cache', '-j', '1', source_directory],
+         ('pytype',), None),
+    ]
+
+    try:
+        failed = False
+        for name, command, forbidden, budget in checks:
+            # check exits with 1 here: the output directory is empty
+            returncodes = (0, 1) if command[0] == 'check' else (0,)
+            modules, total = import_times(command, args.repeat, prepare, returncodes)
+            problems = []
+            if budget is not None and total > budget:
+                problems.append('over budget (%.0f ms)' % budget)
+            imported = forbidden_imports(modules, forbidden)
+            if imported:
+                problems.append('imports %s' % ', '.join(imported[:5]) + (' ...' if len(imported) > 5 else ''))
+            failed = failed or bool(problems)
+            print('%-24s %8.1f ms  %s' % (name, total, '; '.join(problems) or 'ok'))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""
+Differential check of `--resolver=syntactic` against pytype: for every expression
+`RemoveTypehint` looks up (the subscript values outside of annotations and the class
+bases), compares the two decisions it takes from the type map, whether `X[...]` is
+stripped to `X` and whether a base is dropped as `Generic[...]`, and lists the
+positions where the resolvers disagree.
+
+    python benchmarks/compare_resolvers.py [--directory DIR] [--files N] [--blocks N] [--mix ...] [--seed S]
+                                           [--max-disagreements N] [--json FILE]
+
+Without `--directory`, the synthetic corpus of `corpus.py` is used. pytype analyzes
+each file on its own, as `convert-all` without `--project` does, so classes imported
+from other modules of the directory are only known to the syntactic resolver; these
+show up as `syntactic` only decisions. Exits with status 1 if there are more than
+`--max-disagreements` (default 0) disagreements.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import libcst as cst  # noqa: E402
+import libcst.metadata  # noqa: E402
+
+from corpus import add_corpus_arguments, generate_corpus  # noqa: E402
+from py3to2.convert import Converter, find_type_queries  # noqa: E402
+from py3to2.resolver import ClassIndex, resolve_type_index  # noqa: E402
+from py3to2.type_index import CodePosition  # noqa: E402
+
+
+class BasePositions(cst.CSTVisitor):
+    METADATA_DEPENDENCIES = (cst.metadata.PositionProvider, )
+
+    def __init__(self):
+        super().__init__()
+        self.positions = set()
+
+    def visit_ClassDef(self, node):
+        for base in node.bases:
+            position = self.get_metadata(cst.metadata.PositionProvider, base.value)
+            self.positions.add(CodePosition(position.start.line, position.start.column,
+                                            position.end.line, position.end.column))
+
+
+def decisions(tag, is_base):
+    """
+    (strip the subscript, drop the base) as `RemoveTypehint` would take them from `tag`.
+    Only class bases can be dropped.
+    """
+    if tag is None or tag.generic_base != 'builtins.type':
+        return False, False
+    return True, is_base and tag.first_parameter == 'typing.Generic'
+
+
+def describe(decision):
+    strip, drop = decision
+    return 'drop' if drop else 'strip' if strip else 'keep'
+
+
+def source_of(lines, position):
+    if position.lineno != position.end_lineno:
+        return lines[position.lineno - 1][position.col_offset:].strip() + ' ...'
+    return lines[position.lineno - 1][position.col_offset:position.end_col_offset]
+
+
+def compare(paths, directory):
+    """
+    Returns (per-resolver seconds, number of positions, disagreements), where each
+    disagreement is a dict with the path, the position, the source and both decisions.
+    """
+    converter = Converter(directory, prefilter=False)
+    index = ClassIndex.build(directory, paths)
+    seconds = {'pytype': 0.0, 'syntactic': 0.0}
+    n_positions = 0
+    disagreements = []
+
+    for path in paths:
+        with open(path, encoding='utf8') as f:
+            code = f.read()
+        wrapper = cst.MetadataWrapper(cst.parse_module(code))
+        positions = find_type_queries(wrapper).positions
+        if not positions:
+            continue
+        bases = BasePositions()
+        wrapper.visit(bases)
+        n_positions += len(positions)
+
+        start = time.perf_counter()
+        pytype_types = converter.get_type_index(code, positions, path)
+        seconds['pytype'] += time.perf_counter() - start
+        start = time.perf_counter()
+        syntactic_types = resolve_type_index(wrapper, code, positions, index, path, directory)
+        seconds['syntactic'] += time.perf_counter() - start
+
+        lines = code.splitlines()
+        for position in sorted(positions):
+            is_base = position in bases.positions
+            expected = decisions(pytype_types.get(position), is_base)
+            actual = decisions(syntactic_types.get(position), is_base)
+            if expected != actual:
+                disagreements.append({
+                    'path': os.path.relpath(path, directory),
+                    'line': position.lineno,
+                    'column': position.col_offset,
+                    'source': source_of(lines, position),
+                    'pytype': describe(expected),
+                    'syntactic': describe(actual),
+                })
+    return seconds, n_positions, disagreements
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--directory', type=str, default=None,
+                        help='compare on the modules of this directory instead of a synthetic corpus')
+    add_corpus_arguments(parser)
+    parser.add_argument('--max-disagreements', type=int, default=0)
+    parser.add_argument('--json', type=str, default=None, help='also write the disagreements to this file')
+    args = parser.parse_args()
+
+    temporary = None
+    if args.directory is not None:
+        directory = args.directory
+        paths = sorted(os.path.join(folder, file) for folder, _, files in os.walk(directory)
+                       for file in files if file.endswith('.py'))
+    else:
+        directory = temporary = tempfile.mkdtemp(prefix='py3to2-resolvers-')
+    try:
+        if temporary is not None:
+            paths = generate_corpus(directory, args.files, args.blocks, args.mix, args.seed)
+        seconds, n_positions, disagreements = compare(paths, directory)
+    finally:
+        if temporary is not None:
+            shutil.rmtree(temporary, ignore_errors=True)
+
+    for item in disagreements:
+        print('%(path)s:%(line)d:%(column)d: pytype %(pytype)s, syntactic %(syntactic)s: %(source)s' % item)
+    n_pytype_only = sum(1 for item in disagreements if item['pytype'] != 'keep' and item['syntactic'] == 'keep')
+    n_syntactic_only = sum(1 for item in disagreements if item['syntactic'] != 'keep' and item['pytype'] == 'keep')
+    print('files: %d, positions: %d, agreed: %d, pytype only: %d, syntactic only: %d, other: %d' % (
+        len(paths), n_positions, n_positions - len(disagreements), n_pytype_only, n_syntactic_only,
+        len(disagreements) - n_pytype_only - n_syntactic_only))
+    print('pytype %.3fs, syntactic %.3fs' % (seconds['pytype'], seconds['syntactic']))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'positions': n_positions, 'seconds': seconds, 'disagreements': disagreements}, f, indent=2)
+    if len(disagreements) > args.max_disagreements:
+        print('%d disagreement(s), more than --max-disagreements %d' % (len(disagreements), args.max_disagreements))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""
+Synthetic Python 3 corpora for the benchmarks. A corpus is a package of `--files`
+modules of `--blocks` blocks each; every block is drawn from the feature mix:
+
+    annotations  annotated functions and variables
+    generics     `Generic[T]` classes and subscripted bases
+    typing       typing imports, aliases and `cast`
+    skip         `# pyc: skip` lines
+    cskip        `__cskip_` names and classes
+    plain        untyped code that only the lib3to2 fixers touch
+
+    python benchmarks/corpus.py OUTPUT_DIR [--files N] [--blocks N] [--mix generics=2,plain=1] [--seed S]
+
+The same arguments always produce the same corpus.
+"""
+import argparse
+import os
+import random
+
+FEATURES = ('annotations', 'generics', 'typing', 'skip', 'cskip', 'plain')
+
+DEFAULT_MIX = {'annotations': 3, 'generics': 1, 'typing': 1, 'skip': 1, 'cskip': 1, 'plain': 2}
+
+HEADER = '''\
+import os
+import typing
+from typing import Callable, Dict, Generic, List, Optional, Tuple, TypeVar, cast
+
+T = TypeVar('T')
+K = TypeVar('K')
+'''
+
+BLOCKS = {
+    'annotations': '''\
+
+def summarize_{i}(items: List[int], scale: float = 1.0, label: Optional[str] = None) -> Dict[str, float]:
+    total: float = 0.0
+    counts: Dict[str, int] = {{}}
+    for item in items:
+        total += item * scale
+        key: str = label or str(item % 7)
+        counts[key] = counts.get(key, 0) + 1
+    ratio: Tuple[float, int] = (total, len(counts))
+    return {{k: v / ratio[1] for k, v in counts.items()}}
+''',
+    'generics': '''\
+
+class Box_{i}(Generic[T]):
+    def __init__(self, value: T) -> None:
+        self.value: T = value
+
+    def map(self, func: Callable[[T], T]) -> 'Box_{i}[T]':
+        return Box_{i}(func(self.value))
+
+
+class IntBox_{i}(Box_{i}[int]):
+    def double(self) -> int:
+        return self.value * 2
+
+
+class Registry_{i}(Generic[K], dict):
+    def lookup(self, key: K, default: Optional[int] = None) -> Optional[int]:
+        return self.get(key, default)
+
+
+boxes_{i} = [Box_{i}[int](n) for n in range(3)]
+''',
+    'typing': '''\
+
+Table_{i} = Dict[str, List[int]]
+Pair_{i} = typing.Tuple[int, str]
+
+
+def lookup_{i}(table: 'Table_{i}', key: str) -> List[int]:
+    rows = cast(List[int], table.get(key, []))
+    pair = cast(typing.Tuple[int, str], (len(rows), key))
+    return rows + [pair[0]]
+''',
+    'skip': '''\
+
+def debug_{i}(values: List[int]) -> int:
+    # pyc: skip
+    print(*values, sep=', ', end='\\n')
+    result = 0
+    for value in values:
+        # pyc: skip
+        assert value >= 0, f'{{value}}'
+        result += value
+    return result
+''',
+    'cskip': '''\
+
+class __cskip_Protocol_{i}(object):
+    def check(self) -> bool:
+        return True
+
+
+class Handler_{i}(__cskip_Protocol_{i}):
+    def handle(self, data: bytes) -> int:
+        __cskip_view = memoryview(data)
+        size = len(data)
+        return size
+''',
+    'plain': '''\
+
+class Plain_{i}:
+    def __init__(self, name, *args, mode='r', **kwargs):
+        super().__init__()
+        self.name = name
+        self.args = list(range(len(args)))
+        self.mode = mode
+
+    def read(self):
+        with open(os.path.join('data', self.name), self.mode) as f:
+            text = f.read()
+        return {{c for c in text if c.isalpha()}}, 1 << 4, 3 / 2
+''',
+}
+
+
+def parse_mix(value: str):
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in FEATURES:
+            raise argparse.ArgumentTypeError('unknown feature %r (expected one of %s)' % (name, ', '.join(FEATURES)))
+        mix[name] = float(weight) if weight else 1.0
+    return mix
+
+
+def generate_module(index: int, blocks: int, mix, rng: random.Random) -> str:
+    names = [name for name in FEATURES if mix.get(name, 0) > 0]
+    weights = [mix[name] for name in names]
+    parts = [HEADER]
+    for j in range(blocks):
+        feature = rng.choices(names, weights)[0]
+        parts.append(BLOCKS[feature].format(i='%d_%d' % (index, j)))
+    return ''.join(parts)
+
+
+def generate_corpus(directory: str, files: int = 50, blocks: int = 8, mix=None, seed: int = 0):
+    """
+    Writes the corpus to `directory` (a package of `files` modules spread over a few
+    subpackages) and returns the paths of the modules.
+    """
+    mix = dict(DEFAULT_MIX if mix is None else mix)
+    rng = random.Random(seed)
+    paths = []
+    for i in range(files):
+        folder = os.path.join(directory, 'pkg%d' % (i % 4))
+        os.makedirs(folder, exist_ok=True)
+        init_path = os.path.join(folder, '__init__.py')
+        if not os.path.exists(init_path):
+            with open(init_path, 'w') as f:
+                f.write('')
+            paths.append(init_path)
+        path = os.path.join(folder, 'mod%d.py' % i)
+        with open(path, 'w', encoding='utf8') as f:
+            f.write(generate_module(i, blocks, mix, rng))
+        paths.append(path)
+    return paths
+
+
+def add_corpus_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--files', type=int, default=50, help='number of modules')
+    parser.add_argument('--blocks', type=int, default=8, help='blocks per module')
+    parser.add_argument('--mix', type=parse_mix, default=None,
+                        help='feature weights, e.g. generics=2,plain=1 (default: %s)' % ','.join(
+                            '%s=%d' % item for item in DEFAULT_MIX.items()))
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('output', type=str)
+    add_corpus_arguments(parser)
+    args = parser.parse_args()
+    paths = generate_corpus(args.output, args.files, args.blocks, args.mix, args.seed)
+    print('wrote %d modules to %s' % (len(paths), args.output))
+
+
+if __name__ == '__main__':
+    main()
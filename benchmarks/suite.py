@@ -0,0 +1,123 @@
+"""
+The benchmark suite: generates one synthetic corpus (see `corpus.py`), times each
+stage of the conversion on it (`bench_stages.py`) and whole `convert-all` runs
+(`bench_convert_all.py`), and compares the results against a saved baseline.
+
+    python benchmarks/suite.py [--files N] [--blocks N] [--mix ...] [--seed S] [--jobs N]
+                               [--output RESULTS.json] [--baseline BASELINE.json]
+                               [--save-baseline BASELINE.json] [--threshold 0.2]
+
+A metric regresses if it is worse than the baseline by more than `--threshold`
+(relative). Metrics only compare against a baseline of the same corpus and jobs.
+Exits with status 1 on a regression.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_convert_all import measure_convert_all  # noqa: E402
+from bench_stages import measure_stages  # noqa: E402
+from corpus import add_corpus_arguments, generate_corpus  # noqa: E402
+
+# 越小越好的指标，除了这里列出的
+HIGHER_IS_BETTER = ('files_per_second',)
+
+
+def run_suite(args):
+    config = {'files': args.files, 'blocks': args.blocks, 'mix': args.mix, 'seed': args.seed, 'jobs': args.jobs}
+    metrics = {}
+    directory = tempfile.mkdtemp(prefix='py3to2-suite-')
+    try:
+        paths = generate_corpus(directory, args.files, args.blocks, args.mix, args.seed)
+        if not args.skip_stages:
+            totals, n_inferred = measure_stages(paths, directory)
+            config['inferred'] = n_inferred
+            for stage, seconds in totals.items():
+                metrics['stage.%s.seconds' % stage] = seconds
+        # measure_stages 不修改 corpus，convert-all 转换的是它的拷贝
+        runs = measure_convert_all(directory, len(paths), args.jobs, args.repeat)
+        for case, result in runs.items():
+            for name, value in result.items():
+                metrics['convert_all.%s.%s' % (case, name)] = value
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return {'config': config, 'metrics': metrics}
+
+
+def higher_is_better(name):
+    return name.rsplit('.', 1)[-1] in HIGHER_IS_BETTER
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns [(metric, baseline value, value, relative change, regressed)], where a
+    positive change is a slowdown (or more memory).
+    """
+    rows = []
+    for name, value in sorted(results['metrics'].items()):
+        old = baseline['metrics'].get(name)
+        if not old:
+            continue
+        change = (old - value) / old if higher_is_better(name) else (value - old) / old
+        rows.append((name, old, value, change, change > threshold))
+    return rows
+
+
+def format_value(name, value):
+    if name.endswith('peak_rss'):
+        return '%.1f MiB' % (value / 2 ** 20)
+    if name.endswith('files_per_second'):
+        return '%.1f/s' % value
+    return '%.3fs' % value
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_corpus_arguments(parser)
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='--jobs of the convert-all runs')
+    parser.add_argument('--repeat', type=int, default=1, help='convert-all runs; the fastest one counts')
+    parser.add_argument('--skip-stages', action='store_true', help='only time whole convert-all runs')
+    parser.add_argument('--output', '-o', type=str, default=None, help='write the results to this file')
+    parser.add_argument('--baseline', type=str, default=None, help='compare against these saved results')
+    parser.add_argument('--save-baseline', type=str, default=None, help='save the results as a baseline')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative slowdown above which a metric regresses (default: 0.2)')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = run_suite(args)
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if baseline is None:
+        for name, value in sorted(results['metrics'].items()):
+            print('%-40s %12s' % (name, format_value(name, value)))
+        return
+
+    old_config = {key: value for key, value in baseline['config'].items() if key != 'inferred'}
+    new_config = {key: value for key, value in results['config'].items() if key != 'inferred'}
+    if old_config != new_config:
+        print('baseline was measured with %s, not %s' % (old_config, new_config))
+        sys.exit(2)
+
+    regressed = False
+    for name, old, value, change, is_regression in compare(results, baseline, args.threshold):
+        regressed = regressed or is_regression
+        print('%-40s %12s -> %12s  %+6.1f%%  %s' % (
+            name, format_value(name, old), format_value(name, value), change * 100,
+            'REGRESSION' if is_regression else 'ok'))
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == '__main__':
+    main()
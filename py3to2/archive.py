@@ -0,0 +1,94 @@
+from typing import *
+import base64
+import hashlib
+import os
+import time
+import zipfile
+
+
+# ==========================================
+# --output-archive: 转换结果直接写进 zip / wheel，不经过磁盘上的目录
+#
+# Entries are added in the order the caller gives (sorted by name in `convert-all`)
+# with a fixed timestamp, SOURCE_DATE_EPOCH if it is set and 1980-01-01 otherwise,
+# and fixed permissions, so the same sources always give the same archive bytes.
+
+# zip 能表示的最早的时间
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+
+def archive_date_time() -> Tuple[int, int, int, int, int, int]:
+    epoch = os.environ.get('SOURCE_DATE_EPOCH')
+    if not epoch:
+        return ZIP_EPOCH
+    return max(ZIP_EPOCH, tuple(time.gmtime(int(epoch))[:6]))
+
+
+def parse_wheel_name(path: str) -> Tuple[str, str, str]:
+    """
+    Returns (distribution, version, tag) of a wheel file name such as
+    `pkg-1.0-py2-none-any.whl`. Raises ValueError if it is not one.
+    """
+    parts = os.path.basename(path)[:-len('.whl')].split('-')
+    if len(parts) not in (5, 6) or not all(parts):
+        raise ValueError('%s is not a wheel file name (NAME-VERSION-PYTHON-ABI-PLATFORM.whl)'
+                         % os.path.basename(path))
+    return parts[0], parts[1], '-'.join(parts[-3:])
+
+
+class ArchiveWriter:
+    """
+    A zip archive written to a temporary file next to `path` and moved to `path` by
+    `close`; `abort` leaves `path` untouched. If `path` ends with `.whl`, the
+    `.dist-info` metadata and the RECORD of a pure-Python wheel are added on `close`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.wheel = parse_wheel_name(path) if path.endswith('.whl') else None
+        self.date_time = archive_date_time()
+        self.names: Set[str] = set()
+        self._record: List[Tuple[str, str, int]] = []
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        self.tmp_path = os.path.join(folder, '.tmp-%d-%s' % (os.getpid(), os.path.basename(path)))
+        self._zip = zipfile.ZipFile(self.tmp_path, 'w', zipfile.ZIP_DEFLATED)
+
+    def add(self, name: str, data: bytes, executable: bool = False):
+        if name in self.names:
+            raise ValueError('duplicate archive entry %s' % name)
+        self.names.add(name)
+        info = zipfile.ZipInfo(name, self.date_time)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.external_attr = (0o100755 if executable else 0o100644) << 16
+        self._zip.writestr(info, data)
+        if self.wheel is not None:
+            digest = base64.urlsafe_b64encode(hashlib.sha256(data).digest()).rstrip(b'=').decode('ascii')
+            self._record.append((name, 'sha256=' + digest, len(data)))
+
+    def _add_wheel_metadata(self):
+        distribution, version, tag = self.wheel
+        dist_info = '%s-%s.dist-info' % (distribution, version)
+        self.add(dist_info + '/METADATA', ('Metadata-Version: 2.1\nName: %s\nVersion: %s\n'
+                                            % (distribution, version)).encode('utf8'))
+        self.add(dist_info + '/WHEEL', ('Wheel-Version: 1.0\nGenerator: py3to2\nRoot-Is-Purelib: true\n'
+                                         'Tag: %s\n' % tag).encode('utf8'))
+        record = ''.join('%s,%s,%d\n' % entry for entry in self._record)
+        record += '%s/RECORD,,\n' % dist_info
+        self.add(dist_info + '/RECORD', record.encode('utf8'))
+
+    def close(self):
+        if self.wheel is not None:
+            self._add_wheel_metadata()
+        self._zip.close()
+        mode = os.stat(self.path).st_mode & 0o7777 if os.path.exists(self.path) else None
+        if mode is not None:
+            os.chmod(self.tmp_path, mode)
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self._zip.close()
+        try:
+            os.unlink(self.tmp_path)
+        except OSError:
+            pass
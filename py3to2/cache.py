@@ -0,0 +1,153 @@
+from typing import *
+import functools
+import hashlib
+import os
+
+
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+# 这些包的版本变了，转换结果就可能不一样（py3to2 自己还加上源码的 digest）
+VERSIONED_DISTRIBUTIONS = ('py3to2', 'pytype', 'libcst', '3to2')
+
+# 转换结果的格式变了就加一（2: header 里的 stamp；3: `import typing` 改写成带 as 的 shim import），
+# 旧的条目就不会再被用到
+CACHE_FORMAT = 3
+
+
+def default_cache_dir() -> str:
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'py3to2')
+
+
+@functools.lru_cache(maxsize=None)
+def tool_versions() -> Tuple[Tuple[str, str], ...]:
+    # importlib.metadata 的 import 就要几十毫秒，只在算 cache key 时才需要
+    try:
+        from importlib import metadata as importlib_metadata
+    except ImportError:  # python 3.7
+        importlib_metadata = None
+
+    versions = []
+    for name in VERSIONED_DISTRIBUTIONS:
+        version = 'unknown'
+        if importlib_metadata is not None:
+            try:
+                version = importlib_metadata.version(name)
+            except importlib_metadata.PackageNotFoundError:
+                pass
+        versions.append((name, version))
+    versions.append(('py3to2-sources', package_digest()))
+    return tuple(versions)
+
+
+@functools.lru_cache(maxsize=None)
+def package_digest() -> str:
+    """
+    A digest of the sources of py3to2 itself. Its version stays the same between
+    commits (and is unknown in a checkout), the sources do not.
+    """
+    h = hashlib.sha256()
+    root = os.path.dirname(os.path.abspath(__file__))
+    for folder, folders, files in os.walk(root):
+        folders[:] = sorted(name for name in folders if name != '__pycache__')
+        for file in sorted(files):
+            if not file.endswith('.py'):
+                continue
+            path = os.path.join(folder, file)
+            with open(path, 'rb') as f:
+                data = f.read()
+            h.update(('%s %d\n' % (os.path.relpath(path, root).replace(os.sep, '/'), len(data))).encode('utf8'))
+            h.update(data)
+    return h.hexdigest()[:16]
+
+
+def write_atomic(path: str, data: bytes, mode: Optional[int] = None):
+    import tempfile
+
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix='.tmp-')
+    try:
+        # mkstemp 建的文件是 0600
+        if mode is not None:
+            os.chmod(tmp_path, mode)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class ConversionCache:
+    """
+    An on-disk cache of converted code, keyed on the source bytes, the relative
+    depth of the module and the versions of the tools doing the conversion.
+    Entries are evicted least-recently-used first once the cache exceeds `max_size` bytes.
+    """
+
+    def __init__(self, directory: str, max_size: int = DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+
+    def key(self, source: bytes, relative_dots: int, extra: str = '') -> str:
+        h = hashlib.sha256()
+        h.update(('format=%d\n' % CACHE_FORMAT).encode('utf8'))
+        for name, version in tool_versions():
+            h.update(('%s=%s\n' % (name, version)).encode('utf8'))
+        h.update(('dots=%d\n' % relative_dots).encode('utf8'))
+        # 结果还依赖源文件以外的东西时（比如 project 模式下依赖的 .pyi），由调用者传入
+        h.update(('extra=%s\n' % extra).encode('utf8'))
+        h.update(source)
+        return h.hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            # mtime 作为 LRU 的访问时间
+            os.utime(path)
+        except OSError:
+            pass
+        return data.decode('utf8')
+
+    def put(self, key: str, code: str):
+        write_atomic(self._entry_path(key), code.encode('utf8'))
+
+    def evict(self) -> int:
+        entries = []
+        total_size = 0
+        for folder, _, files in os.walk(self.directory):
+            for file in files:
+                if file.startswith('.tmp-'):
+                    continue
+                path = os.path.join(folder, file)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total_size += st.st_size
+
+        n_removed = 0
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total_size -= size
+            n_removed += 1
+        return n_removed
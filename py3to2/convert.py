@@ -3,14 +3,22 @@ from typing import *
 import libcst as cst
 import libcst.metadata as cstmeta
 import lib2to3.refactor as refactor # yes, lib2to3. It calls fixes defined in lib3to2
+import contextlib
 import sys
 import argparse
 import os
 import base64
+import time
 
-import pytype
-from . import expression_type
-import pytype.pytd.pytd as pytd
+from . import instrument
+from .fixers import FixerSet, resolve_fixer_names
+from .inference import InferenceLimitExceeded, InferenceLimits, create_pytype_session
+from .stamp import Stamp, create_stamp, format_stamp, get_relative_dots
+from .type_index import CodePosition, TypeTag, TypeIndex
+from .typing_shims import BASE64_CONSTS
+
+# expression_type imports pytype, which takes most of the startup time. It is only
+# imported once a module actually needs type inference.
 
 
 def get_latest_comment(node: cst.SimpleStatementLine):
@@ -28,10 +36,18 @@ def get_comment_value(s: str):
     return s[1:].strip()
 
 class AddHeader(cst.CSTTransformer):
+    def __init__(self, stamp: Optional[Stamp] = None):
+        super().__init__()
+        self._stamp = stamp
+
     def leave_Module(
         self, original_node: cst.Module, updated_node: cst.Module
     ):
-        stmt = cst.EmptyLine(indent=False, comment=cst.Comment('# coding: utf8'))
+        # stamp 和 coding 放在同一行，不改变行号
+        comment = '# coding: utf8'
+        if self._stamp is not None:
+            comment += ' ' + format_stamp(self._stamp)
+        stmt = cst.EmptyLine(indent=False, comment=cst.Comment(comment))
         return updated_node.with_changes(header = (stmt, ) + tuple(updated_node.header))
 
 class AddImports(cst.CSTTransformer):
@@ -65,7 +81,7 @@ class RemoveTypehint(cst.CSTTransformer):
         'typing_extensions': '_py3to2_typing_extensions'
     }
 
-    def __init__(self, relative_dots: int, type_info: Dict[expression_type.CodePosition, pytd.Type]):
+    def __init__(self, relative_dots: int, type_info: Mapping[CodePosition, TypeTag]):
         super().__init__()
         self._relative_dots = relative_dots
         self._type_info = type_info
@@ -104,10 +120,13 @@ class RemoveTypehint(cst.CSTTransformer):
                 new_imports.append(import_alias.with_changes(comma=cst.MaybeSentinel.DEFAULT))
                 continue
                 
+            # `import typing` 之后还是用 `typing.X`
+            asname = import_alias.asname or cst.AsName(name=cst.Name(value=str(import_alias.name.value)))
             replaced_imports.append(cst.ImportFrom(
                 module=None,
                 relative=[cst.Dot() for _ in range(self._relative_dots)],
-                names=[import_alias.with_changes(name=cst.Name(value=new_import_name), comma=cst.MaybeSentinel.DEFAULT)],
+                names=[import_alias.with_changes(name=cst.Name(value=new_import_name), asname=asname,
+                                                 comma=cst.MaybeSentinel.DEFAULT)],
                 semicolon=cst.MaybeSentinel.DEFAULT
             ))
 
@@ -172,54 +191,46 @@ class RemoveTypehint(cst.CSTTransformer):
         if not original_node.value:
             return updated_node
 
-        cst_position = self.get_metadata(cstmeta.PositionProvider, original_node.value)
+        cst_position = self.get_metadata(cstmeta.PositionProvider, original_node.value, None)
         if not cst_position:
             return updated_node
 
-        position = expression_type.CodePosition(
+        position = CodePosition(
             cst_position.start.line, cst_position.start.column, 
             cst_position.end.line, cst_position.end.column
         )
 
 
-        pytype_type = self._type_info.get(position, None)
-        if not isinstance(pytype_type, pytd.GenericType):
-            return updated_node
-
-        if not isinstance(pytype_type.base_type, pytd.ClassType):
+        type_tag = self._type_info.get(position, None)
+        if type_tag is None:
             return updated_node
 
-        if pytype_type.base_type.name != 'builtins.type':
+        if type_tag.generic_base != 'builtins.type':
             return updated_node
 
         return updated_node.value
 
     def leave_ClassDef(self, original_node: cst.ClassDef, updated_node: cst.ClassDef) -> cst.ClassDef:
-        assert(len(original_node.bases) == len(updated_node.bases))
-        
+        if len(original_node.bases) != len(updated_node.bases):
+            # --strip-typing 已经去掉了 Generic 的基类
+            return updated_node
+
         new_bases = []
         for base, new_base in zip(original_node.bases, updated_node.bases):
-            cst_position = self.get_metadata(cstmeta.PositionProvider, base.value)
+            cst_position = self.get_metadata(cstmeta.PositionProvider, base.value, None)
             if not cst_position:
                 new_bases.append(new_base)
                 continue
-            position = expression_type.CodePosition(
+            position = CodePosition(
                 cst_position.start.line, cst_position.start.column, 
                 cst_position.end.line, cst_position.end.column
             )
-            pytype_type = self._type_info.get(position, None)
+            type_tag = self._type_info.get(position, None)
   
-            if (not pytype_type or 
-                not isinstance(pytype_type, pytd.GenericType) or 
-                not isinstance(pytype_type.base_type, pytd.ClassType) or 
-                not pytype_type.base_type.name == 'builtins.type' or 
-                not pytype_type.parameters):
+            if (type_tag is None or 
+                not type_tag.generic_base == 'builtins.type' or 
+                not type_tag.first_parameter == 'typing.Generic'):
 
-                new_bases.append(new_base)
-                continue
-
-            real_type = pytype_type.parameters[0]
-            if not real_type.name == 'typing.Generic':
                 new_bases.append(new_base)
                 continue 
         
@@ -258,39 +269,260 @@ class RemoveName(cst.CSTTransformer):
 
 
 
-def pretty_code(module: cst.Module) -> str:
-    return module.code
+class TypeInferenceCandidates(cst.CSTVisitor):
+    """
+    Looks for expressions whose pytype type `RemoveTypehint` may act on: subscripts that
+    survive the removal of annotations and that could be over a class, i.e. `Generic[T]`,
+    `Box[int]`, `deque[int]`, `typing.List[int]`. If a module has none, its type map is
+    never consulted and pytype need not run.
 
+    A subscripted name could be a class if it is imported, is the name of a class of the
+    module or is assigned another name or subscript outside of a function (an alias);
+    a dotted name if its first part is. Subscripts of other names (locals, parameters)
+    and of calls or other subscripts are not candidates.
 
-def get_relative_dots(code_path: str, directory: str) -> int:
-    relpath = os.path.relpath(os.path.abspath(code_path), os.path.abspath(directory))
-    n_dots = len(relpath.replace('\\', '/').split('/'))
-    return n_dots
+    `positions` collects the positions `RemoveTypehint` looks up: the values of the
+    subscripts outside of annotations and the class bases.
+    """
 
+    METADATA_DEPENDENCIES = (cstmeta.PositionProvider, )
 
-def apply_libcst_change(code: str, code_path: str, module_directory: str) -> str:
+    # list[int] 之类，python 3.9 以后可以在运行时下标
+    BUILTIN_GENERICS = frozenset(['type', 'tuple', 'list', 'dict', 'set', 'frozenset'])
 
-    relative_dots = get_relative_dots(code_path, module_directory)
-    types = expression_type.get_expression_types(code)
+    def __init__(self):
+        super().__init__()
+        self._annotation_depth = 0
+        self._function_depth = 0
+        self._star_import = False
+        # 可能是类的名字：import 进来的、class 定义的、别名
+        self._class_names: Set[str] = set(self.BUILTIN_GENERICS)
+        self._subscripted: List[List[str]] = []
+        self.has_subscripted_base = False
+        self.positions: Set[CodePosition] = set()
+
+    def _add_position(self, node: cst.CSTNode):
+        cst_position = self.get_metadata(cstmeta.PositionProvider, node, None)
+        if cst_position:
+            self.positions.add(CodePosition(
+                cst_position.start.line, cst_position.start.column,
+                cst_position.end.line, cst_position.end.column
+            ))
+
+    def visit_Annotation(self, node: cst.Annotation):
+        self._annotation_depth += 1
+
+    def leave_Annotation(self, original_node: cst.Annotation):
+        self._annotation_depth -= 1
+
+    def visit_FunctionDef(self, node: cst.FunctionDef):
+        self._function_depth += 1
+
+    def leave_FunctionDef(self, original_node: cst.FunctionDef):
+        self._function_depth -= 1
+
+    def visit_Import(self, node: cst.Import):
+        for alias in node.names:
+            # import a.b 绑定的是 a
+            self._class_names.add(alias.evaluated_alias or alias.evaluated_name.split('.')[0])
+
+    def visit_ImportFrom(self, node: cst.ImportFrom):
+        if isinstance(node.names, cst.ImportStar):
+            self._star_import = True
+            return
+        for alias in node.names:
+            self._class_names.add(alias.evaluated_alias or alias.evaluated_name)
+
+    def _add_alias(self, target: cst.BaseExpression, value: Optional[cst.BaseExpression]):
+        if self._function_depth or not isinstance(target, cst.Name):
+            return
+        if isinstance(value, (cst.Name, cst.Attribute, cst.Subscript)):
+            self._class_names.add(target.value)
+
+    def visit_Assign(self, node: cst.Assign):
+        for target in node.targets:
+            self._add_alias(target.target, node.value)
+
+    def visit_AnnAssign(self, node: cst.AnnAssign):
+        self._add_alias(node.target, node.value)
+
+    def visit_ClassDef(self, node: cst.ClassDef):
+        self._class_names.add(node.name.value)
+        for base in node.bases:
+            self._add_position(base.value)
+            if isinstance(base.value, cst.Subscript):
+                self.has_subscripted_base = True
+
+    def visit_Subscript(self, node: cst.Subscript):
+        if self._annotation_depth:
+            return
+        self._add_position(node.value)
+        name = get_dotted_name(node.value)
+        # 调用的结果、下标的结果之类不是 Name / Attribute 的，不会是类
+        if name:
+            self._subscripted.append(name.split('.'))
+
+    def _is_candidate(self, parts: List[str]) -> bool:
+        return self._star_import or parts[0] in self._class_names
+
+    @property
+    def found(self) -> bool:
+        return self.has_subscripted_base or any(self._is_candidate(parts) for parts in self._subscripted)
+
+
+def get_dotted_name(node: cst.CSTNode) -> Optional[str]:
+    if isinstance(node, cst.Name):
+        return node.value
+    if isinstance(node, cst.Attribute):
+        value = get_dotted_name(node.value)
+        if value is None:
+            return None
+        return value + '.' + node.attr.value
+    return None
+
+
+def find_type_queries(wrapper: cstmeta.MetadataWrapper) -> TypeInferenceCandidates:
+    finder = TypeInferenceCandidates()
+    wrapper.visit(finder)
+    return finder
+
+
+def needs_type_inference(module: cst.Module) -> bool:
+    return find_type_queries(cst.MetadataWrapper(module)).found
+
+
+class ChainTransformer(cst.CSTTransformer):
+    """
+    Applies several transformers in a single depth-first traversal, with the same result
+    as visiting the tree with each of them in turn.
+
+    When a node is left, each transformer's `leave_*` method is applied, in order, to the
+    result of the previous one. If a transformer replaces a node with one of another type,
+    the transformers after it dispatch on the new node. This matches running them one pass
+    after the other only while the transformers make local changes: a `leave_*` method may
+    look at the node it is given, but not at its ancestors or at state from other nodes.
+
+    With `timings`, the time spent in each transformer is added to `timings[class name]`.
+    """
+
+    def __init__(self, transformers: Sequence[cst.CSTTransformer], timings: Optional[Dict[str, float]] = None):
+        super().__init__()
+        self._transformers = tuple(transformers)
+        self._timings = timings
+        if timings is not None:
+            for transformer in self._transformers:
+                timings.setdefault(type(transformer).__name__, 0.0)
+        self.METADATA_DEPENDENCIES = tuple(
+            dependency
+            for transformer in self._transformers
+            for dependency in transformer.get_inherited_dependencies()
+        )
+
+    @contextlib.contextmanager
+    def resolve(self, wrapper: cstmeta.MetadataWrapper) -> Iterator[None]:
+        with contextlib.ExitStack() as stack:
+            for transformer in self._transformers:
+                stack.enter_context(transformer.resolve(wrapper))
+            yield
+
+    def on_visit(self, node: cst.CSTNode) -> bool:
+        timings = self._timings
+        for transformer in self._transformers:
+            if timings is None:
+                transformer.on_visit(node)
+            else:
+                start = time.perf_counter()
+                transformer.on_visit(node)
+                timings[type(transformer).__name__] += time.perf_counter() - start
+        return True
+
+    def on_leave(self, original_node, updated_node):
+        timings = self._timings
+        results = [updated_node]
+        for transformer in self._transformers:
+            if timings is not None:
+                start = time.perf_counter()
+            new_results = []
+            for result in results:
+                # 节点类型变了，就按新的节点类型分派 leave_*
+                node = original_node if type(result) is type(original_node) else result
+                result = transformer.on_leave(node, result)
+                if isinstance(result, cst.FlattenSentinel):
+                    new_results.extend(result)
+                elif isinstance(result, cst.RemovalSentinel):
+                    continue
+                else:
+                    new_results.append(result)
+            results = new_results
+            if timings is not None:
+                timings[type(transformer).__name__] += time.perf_counter() - start
+
+        if len(results) == 1:
+            return results[0]
+        if not results:
+            return cst.RemovalSentinel.REMOVE
+        return cst.FlattenSentinel(results)
+
+
+def create_libcst_transformer(relative_dots: int, types: Mapping[CodePosition, TypeTag],
+                              timings: Optional[Dict[str, float]] = None,
+                              stamp: Optional[Stamp] = None, typing_removals=None) -> ChainTransformer:
+    transformers = [
+        RemoveTypehint(relative_dots=relative_dots, type_info=types),
+        AddHeader(stamp),
+        AddImports(),
+        Annotate(),
+        RemoveName(),
+    ]
+    if typing_removals is not None:
+        from .strip_typing import StripTyping, UnwrapTyping
+        # StripTyping 要在 RemoveTypehint 改写 typing 的 import 之前；
+        # UnwrapTyping 换掉节点的类型，放在最后，后面的 transformer 就不会拿到没有 metadata 的节点
+        transformers.insert(0, StripTyping(typing_removals))
+        transformers.append(UnwrapTyping(typing_removals))
+    return ChainTransformer(transformers, timings)
 
-    cst_tree: Any = cst.parse_module(code)
+
+def pretty_code(module: cst.Module) -> str:
+    return module.code
+
+
+def apply_libcst_change(code: str, code_path: str, module_directory: str,
+                        types: Optional[Mapping[CodePosition, TypeTag]] = None,
+                        wrapper: Optional[cstmeta.MetadataWrapper] = None, strip_typing: bool = False) -> str:
+
+    relative_dots = get_relative_dots(code_path, module_directory)
 
     # 因为要用 pytype 的关系，需要保持语法树和源代码一致
     # 当然。。codegen + parse 都走一遍也不是不可以了。。
-    cst_tree = cst.MetadataWrapper(cst_tree)
-    cst_tree = cst_tree.visit(RemoveTypehint(relative_dots=relative_dots, type_info=types))
-    cst_tree = cst_tree.visit(AddHeader())
-    cst_tree = cst_tree.visit(AddImports())
-    cst_tree = cst_tree.visit(Annotate())
-    cst_tree = cst_tree.visit(RemoveName())
-
-    target_code = pretty_code(cst_tree)
+    if wrapper is None:
+        with instrument.stage('parse'):
+            wrapper = cst.MetadataWrapper(cst.parse_module(code))
+    cst_tree: Any = wrapper
+    if types is None:
+        from . import expression_type
+        with instrument.stage('type_queries'):
+            positions = find_type_queries(cst_tree).positions
+        types = expression_type.get_type_index(code, positions)
+    typing_removals = None
+    if strip_typing:
+        from .strip_typing import find_typing_removals
+        with instrument.stage('strip_typing'):
+            types, typing_removals = find_typing_removals(cst_tree, types)
+
+    # 各个 transformer 的耗时只在记录时统计
+    timings: Optional[Dict[str, float]] = {} if instrument.recording() else None
+    stamp = create_stamp(code, relative_dots)
+    with instrument.stage('libcst'):
+        cst_tree = cst_tree.visit(create_libcst_transformer(relative_dots, types, timings, stamp, typing_removals))
+        target_code = pretty_code(cst_tree)
+    if timings is not None:
+        instrument.add_stages('libcst.', timings)
 
     return target_code
 
 
-def apply_lib3to2_change(code: str) -> str:
-    code = code + '\n'
+def get_lib3to2_fixers() -> List[str]:
     avail_fixes = set(refactor.get_fixers_from_package('lib3to2.fixes'))
     avail_fixes = avail_fixes.difference([
         'lib3to2.fixes.fix_printfunction',
@@ -298,13 +530,188 @@ def apply_lib3to2_change(code: str) -> str:
         'lib3to2.fixes.fix_absimport',
         'lib3to2.fixed.fix_annotations'
     ])
-    rt = refactor.RefactoringTool(sorted(avail_fixes), None, sorted(avail_fixes))
-    tree = rt.refactor_string(code, '<code>')
+    return sorted(avail_fixes)
+
+
+def select_lib3to2_fixers(only: Optional[Iterable[str]] = None, skip: Iterable[str] = ()) -> List[str]:
+    """
+    The default fixers, restricted to `only` and without `skip`. Names may be given
+    as `str`, `fix_str` or `lib3to2.fixes.fix_str`.
+    """
+    available = get_lib3to2_fixers()
+    selected = available if only is None else resolve_fixer_names(only, available)
+    skipped = set(resolve_fixer_names(skip, available))
+    return [name for name in available if name in selected and name not in skipped]
+
+
+def create_refactoring_tool() -> refactor.RefactoringTool:
+    fixers = get_lib3to2_fixers()
+    return refactor.RefactoringTool(fixers, None, fixers)
+
+
+def apply_lib3to2_change(code: str, refactoring_tool: Optional[refactor.RefactoringTool] = None) -> str:
+    code = code + '\n'
+    if refactoring_tool is None:
+        refactoring_tool = create_refactoring_tool()
+    tree = refactoring_tool.refactor_string(code, '<code>')
     return str(tree)
 
 
-class BASE64_CONSTS:
-    PY_TYPING = 'ZGVmIF9mKCk6CiAgICBjbGFzcyBfYyhvYmplY3QpOgogICAgICAgIGRlZiBfX2luaXRfXyhzZWxmLCAqYXJncywgKiprd2FyZ3MpOgogICAgICAgICAgICBwYXNzCiAgICAgICAgZGVmIF9fY2FsbF9fKHNlbGYsICphcmdzLCAqKmt3YXJncyk6CiAgICAgICAgICAgIHJldHVybiBfYwogICAgICAgIGRlZiBfX2dldGl0ZW1fXyhzZWxmLCAqYXJncywgKiprd2FyZ3MpOgogICAgICAgICAgICByZXR1cm4gX2MKICAgIHJldHVybiBfYwpBbm5vdGF0ZWQ9X2YoKQpBbnk9X2YoKQpDYWxsYWJsZT1fZigpCkNsYXNzVmFyPV9mKCkKQ29uY2F0ZW5hdGU9X2YoKQpGaW5hbD1fZigpCkZvcndhcmRSZWY9X2YoKQpHZW5lcmljPV9mKCkKTGl0ZXJhbD1fZigpCk9wdGlvbmFsPV9mKCkKUGFyYW1TcGVjPV9mKCkKUHJvdG9jb2w9X2YoKQpUdXBsZT1fZigpClR5cGU9X2YoKQpUeXBlVmFyPV9mKCkKVW5pb249X2YoKQpBYnN0cmFjdFNldD1fZigpCkJ5dGVTdHJpbmc9X2YoKQpDb250YWluZXI9X2YoKQpDb250ZXh0TWFuYWdlcj1fZigpCkhhc2hhYmxlPV9mKCkKSXRlbXNWaWV3PV9mKCkKSXRlcmFibGU9X2YoKQpJdGVyYXRvcj1fZigpCktleXNWaWV3PV9mKCkKTWFwcGluZz1fZigpCk1hcHBpbmdWaWV3PV9mKCkKTXV0YWJsZU1hcHBpbmc9X2YoKQpNdXRhYmxlU2VxdWVuY2U9X2YoKQpNdXRhYmxlU2V0PV9mKCkKU2VxdWVuY2U9X2YoKQpTaXplZD1fZigpClZhbHVlc1ZpZXc9X2YoKQpBd2FpdGFibGU9X2YoKQpBc3luY0l0ZXJhdG9yPV9mKCkKQXN5bmNJdGVyYWJsZT1fZigpCkNvcm91dGluZT1fZigpCkNvbGxlY3Rpb249X2YoKQpBc3luY0dlbmVyYXRvcj1fZigpCkFzeW5jQ29udGV4dE1hbmVyPV9mKCkKUmV2ZXJzaWJsZT1fZigpClN1cHBvcnRzQWJzPV9mKCkKU3VwcG9ydHNCeXRlcz1fZigpClN1cHBvcnRzQ29tcGxleD1fZigpClN1cHBvcnRzRmxvYXQ9X2YoKQpTdXBwb3J0c0luZGV4PV9mKCkKU3VwcG9ydHNJbnQ9X2YoKQpTdXBwb3J0c1JvdW5kPV9mKCkKQ2hhaW5NYXA9X2YoKQpDb3VudGVyPV9mKCkKRGVxdWU9X2YoKQpEaWN0PV9mKCkKRGVmYXVsdERpY3Q9X2YoKQpMaXN0PV9mKCkKT3JkZXJlZERpY3Q9X2YoKQpTZXQ9X2YoKQpGcm96ZW5TZXQ9X2YoKQpOYW1lZFR1cGxlPV9mKCkKVHlwZWREaWN0PV9mKCkKR2VuZXJhdG9yPV9mKCkKQmluYXJ5SU89X2YoKQpJTz1fZigpCk1hdGNoPV9mKCkKUGF0dGVybj1fZigpClRleHRJTz1fZigpCkFueVN0cj1fZigpCmNhc3Q9X2YoKQpmaW5hbD1fZigpCmdldF9hcmdzPV9mKCkKZ2V0X29yaWdpbj1fZigpCmdldF90eXBlX2hpbnRzPV9mKCkKaXNfdHlwZWRkaWN0PV9mKCkKTmV3VHlwZT1fZigpCm5vX3R5cGVfY2hlY2s9X2YoKQpub190eXBlX2NoZWNrX2RvcmF0bz1fZigpCk5vUmV0dXJuPV9mKCkKb3ZlcmxvYWQ9X2YoKQpQYXJhbVNwZWNBcmdzPV9mKCkKUGFyYW1TcGVjS3dhcmdzPV9mKCkKcnVudGltZV9jaGVja2FiPV9mKCkKVGV4dD1fZigpClRZUEVfQ0hFQ0tJTkc9X2YoKQpUeXBlQWxpYXM9X2YoKQpUeXBlR3VhcmQ9X2YoKQ=='
-    PY_TYPING_EXTENSION = 'ZGVmIF9mKCk6CiAgICBjbGFzcyBfYyhvYmplY3QpOgogICAgICAgIGRlZiBfX2luaXRfXyhzZWxmLCAqYXJncywgKiprd2FyZ3MpOgogICAgICAgICAgICBwYXNzCiAgICAgICAgZGVmIF9fY2FsbF9fKHNlbGYsICphcmdzLCAqKmt3YXJncyk6CiAgICAgICAgICAgIHJldHVybiBfYwogICAgICAgIGRlZiBfX2dldGl0ZW1fXyhzZWxmLCAqYXJncywgKiprd2FyZ3MpOgogICAgICAgICAgICByZXR1cm4gX2MKICAgIHJldHVybiBfYwpDbGFzc1Zhcj1fZigpCkNvbmNhdGVuYXRlPV9mKCkKRmluYWw9X2YoKQpMaXRlcmFsU3RyaW5nPV9mKCkKUGFyYW1TcGVjPV9mKCkKUGFyYW1TcGVjQXJncz1fZigpClBhcmFtU3BlY0t3YXJncz1fZigpClNlbGY9X2YoKQpUeXBlPV9mKCkKVHlwZVZhclR1cGxlPV9mKCkKVW5wYWNrPV9mKCkKQXdhaXRhYmxlPV9mKCkKQXN5bmNJdGVyYXRvcj1fZigpCkFzeW5jSXRlcmFibGU9X2YoKQpDb3JvdXRpbmU9X2YoKQpBc3luY0dlbmVyYXRvcj1fZigpCkFzeW5jQ29udGV4dE1hbj1fZigpCkNoYWluTWFwPV9mKCkKQ29udGV4dE1hbmFnZXI9X2YoKQpDb3VudGVyPV9mKCkKRGVxdWU9X2YoKQpEZWZhdWx0RGljdD1fZigpCk9yZGVyZWREaWN0PV9mKCkKVHlwZWREaWN0PV9mKCkKU3VwcG9ydHNJbmRleD1fZigpCkFubm90YXRlZD1fZigpCmFzc2VydF9uZXZlcj1fZigpCmFzc2VydF90eXBlPV9mKCkKY2xlYXJfb3ZlcmxvYWRzPV9mKCkKZGF0YWNsYXNzX3RyYW5zPV9mKCkKZ2V0X292ZXJsb2Fkcz1fZigpCmZpbmFsPV9mKCkKZ2V0X2FyZ3M9X2YoKQpnZXRfb3JpZ2luPV9mKCkKZ2V0X3R5cGVfaGludHM9X2YoKQpJbnRWYXI9X2YoKQppc190eXBlZGRpY3Q9X2YoKQpMaXRlcmFsPV9mKCkKTmV3VHlwZT1fZigpCm92ZXJsb2FkPV9mKCkKUHJvdG9jb2w9X2YoKQpyZXZlYWxfdHlwZT1fZigpCnJ1bnRpbWU9X2YoKQpydW50aW1lX2NoZWNrYWI9X2YoKQpUZXh0PV9mKCkKVHlwZUFsaWFzPV9mKCkKVHlwZUd1YXJkPV9mKCkKVFlQRV9DSEVDS0lORz1fZigpCk5ldmVyPV9mKCkKTm9SZXR1cm49X2YoKQpSZXF1aXJlZD1fZigpCk5vdFJlcXVpcmVkPV9mKCk='
+FALLBACK_CACHE_TAG = 'types=none\n'
+
+RESOLVERS = ('pytype', 'syntactic')
+
+
+class Converter:
+    """
+    A conversion session. The lib3to2 fixers (and their compiled patterns) are set up
+    in the constructor, the pytype options and the builtins/typeshed loader on the
+    first module that needs type inference, and all of them are reused by every later
+    `convert` call.
+
+    With `prefilter`, pytype only runs on modules that `needs_type_inference`; without
+    `infer`, it never runs (and is never imported). `n_inference_skipped` counts the
+    modules it was skipped for.
+
+    With `stub_directory`, pytype resolves imports against the `.pyi` stubs in that
+    directory (see `py3to2.project`), and the module name passed to `get_expression_types`
+    is used to resolve relative imports.
+
+    `fixers` selects the lib3to2 fixers (default: `get_lib3to2_fixers()`). Each file
+    only runs the fixers its tokens can trigger (see `py3to2.fixers.FixerSet`); with
+    `fixer_stats`, `fixers.stats` counts how often each one changed something.
+
+    With `limits`, pytype runs in a child process and a module whose inference goes
+    over them is converted with an empty type map instead. `fallbacks` maps the
+    absolute paths of the modules to convert that way right away to the reason; the
+    modules that fall back are added to it, and `n_fallbacks` counts them.
+
+    With `resolver='syntactic'`, pytype is replaced by `py3to2.resolver`: a subscript is
+    over a class when its name is bound to one in the module, in `typing` or builtins,
+    or in `class_index` (by default, the classes of `module_directory`). The converted
+    code then depends on the other modules, so the cache tag includes the index digest.
+
+    With `strip_typing`, the code only type checkers need is removed as well (see
+    `py3to2.strip_typing`), so fewer converted modules import the typing shims.
+    """
+
+    def __init__(self, module_directory: str = '.', pytype_options=None, prefilter: bool = True,
+                 stub_directory: Optional[str] = None, fixers: Optional[Sequence[str]] = None,
+                 fixer_stats: bool = False, infer: bool = True, limits: Optional[InferenceLimits] = None,
+                 fallbacks: Optional[Mapping[str, str]] = None, resolver: str = 'pytype', class_index=None,
+                 strip_typing: bool = False):
+        if resolver not in RESOLVERS:
+            raise ValueError('unknown resolver %r (expected one of %s)' % (resolver, ', '.join(RESOLVERS)))
+        self.module_directory = module_directory
+        self.prefilter = prefilter
+        self.infer = infer
+        self.n_inference_skipped = 0
+        default_fixers = get_lib3to2_fixers()
+        if fixers is None:
+            fixers = default_fixers
+        self.fixers = FixerSet(fixers, collect_stats=fixer_stats)
+        # 结果依赖于 fixers 的选择；默认选择时为空，以保留已有的缓存
+        self._cache_tag = '' if list(fixers) == default_fixers else 'fixers=%s\n' % ','.join(fixers)
+        if not infer:
+            self._cache_tag += 'infer=0\n'
+        self.strip_typing = strip_typing
+        if strip_typing:
+            self._cache_tag += 'strip-typing\n'
+        self.resolver = resolver
+        self.class_index = None
+        if resolver == 'syntactic':
+            from .resolver import ClassIndex
+            self.class_index = class_index if class_index is not None else ClassIndex.build(module_directory)
+        self.pytype = create_pytype_session(limits, stub_directory, pytype_options)
+        self.fallbacks: Dict[str, str] = dict(fallbacks or {})
+        self.n_fallbacks = 0
+
+    @property
+    def cache_tag(self) -> str:
+        # 索引可能在转换之间更新 (watch)，每次都重新算
+        if self.resolver == 'syntactic' and self.infer:
+            return self._cache_tag + 'resolver=syntactic %s\n' % self.class_index.digest()
+        return self._cache_tag
+
+    def warm_up(self):
+        """
+        Sets up pytype now rather than on the first module that needs it.
+        """
+        if self.infer and self.resolver == 'pytype':
+            self.pytype.load()
+
+    def fallback_tag(self, path: str) -> str:
+        # 没有类型信息的转换结果要和正常的结果分开缓存
+        return FALLBACK_CACHE_TAG if os.path.abspath(path) in self.fallbacks else ''
+
+    def _infer(self, method: str, code: str, positions: Collection[CodePosition],
+               path: Optional[str], module_name: Optional[str]):
+        # 返回 None 表示退回到没有类型信息的转换
+        key = os.path.abspath(path) if path is not None else None
+        if key in self.fallbacks:
+            sys.stderr.write('py3to2: warning: type inference of %s went over the limits in an earlier run, '
+                             'converting it without type information\n' % path)
+            self.n_fallbacks += 1
+            return None
+        try:
+            return getattr(self.pytype, method)(code, positions, path, module_name)
+        except InferenceLimitExceeded as e:
+            sys.stderr.write('py3to2: warning: type inference of %s %s, converting it without type information\n'
+                             % (path or '<code>', e))
+            self.fallbacks[key] = e.reason
+            self.n_fallbacks += 1
+            return None
+
+    def get_type_index(self, code: str, positions: Collection[CodePosition],
+                       path: Optional[str] = None, module_name: Optional[str] = None) -> TypeIndex:
+        types = self._infer('get_type_index', code, positions, path, module_name)
+        return TypeIndex() if types is None else types
+
+    def get_type_index_and_stub(self, code: str, positions: Collection[CodePosition],
+                                path: Optional[str] = None, module_name: Optional[str] = None
+                                ) -> Tuple[TypeIndex, Optional[str]]:
+        """
+        The stub is None if the module fell back to an empty type map.
+        """
+        result = self._infer('get_type_index_and_stub', code, positions, path, module_name)
+        return (TypeIndex(), None) if result is None else result
+
+    def needs_type_inference(self, queries: TypeInferenceCandidates) -> bool:
+        if not self.infer or not queries.positions:
+            return False
+        return not self.prefilter or queries.found
+
+    def rewrite(self, code: str, path: str, types: Mapping[CodePosition, TypeTag],
+                wrapper: Optional[cstmeta.MetadataWrapper] = None, module_directory: Optional[str] = None) -> str:
+        if module_directory is None:
+            module_directory = self.module_directory
+        code = apply_libcst_change(code, path, module_directory, types, wrapper, self.strip_typing)
+        with instrument.stage('lib3to2'):
+            code = self.fixers.refactor(code)
+        return code
+
+    def convert(self, code: str, path: str, module_directory: Optional[str] = None) -> str:
+        with instrument.stage('parse'):
+            wrapper = cst.MetadataWrapper(cst.parse_module(code))
+        with instrument.stage('type_queries'):
+            queries = find_type_queries(wrapper)
+        if not self.needs_type_inference(queries):
+            self.n_inference_skipped += 1
+            types = TypeIndex()
+        elif self.resolver == 'syntactic':
+            types = self.resolve_type_index(wrapper, code, queries.positions, path, module_directory)
+        else:
+            types = self.get_type_index(code, queries.positions, path)
+        return self.rewrite(code, path, types, wrapper, module_directory)
+
+    def resolve_type_index(self, wrapper: cstmeta.MetadataWrapper, code: str, positions: Collection[CodePosition],
+                           path: str, module_directory: Optional[str] = None) -> TypeIndex:
+        from .resolver import resolve_type_index
 
+        with instrument.stage('resolve'):
+            return resolve_type_index(wrapper, code, positions, self.class_index, path,
+                                      module_directory or self.module_directory)
 
+    def convert_many(self, items: Iterable[Tuple[str, str]]) -> Iterator[str]:
+        for path, code in items:
+            yield self.convert(code, path)
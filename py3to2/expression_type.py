@@ -1,27 +1,85 @@
-from collections import namedtuple
 import pytype
 import pytype.io
 import pytype.config
+import pytype.analyze
+import pytype.load_pytd
 import pytype.pytd.pytd as pytd
 import pytype.tools.traces
 import pytype.tools.traces.traces
+import pytype.tools.traces.source
 import pytype.pytd.pytd_utils
+import pytype.pytd.optimize
 import pytype.tools.annotate_ast.annotate_ast as aast
 import ast
 from typing import *
 
+from . import instrument
+from .type_index import CodePosition, TypeTag, TypeIndex, get_position, intern_type_tag
 
-def full_annotate_source(source, ast_module, pytype_options):
-    with pytype.io.wrap_pytype_exceptions(Exception, filename=pytype_options.input):
-        source_code = pytype.tools.traces.traces.trace(source, pytype_options)
 
+def create_options(**kwargs) -> pytype.config.Options:
+    return pytype.config.Options.create(**kwargs)
+
+
+def create_loader(pytype_options: pytype.config.Options) -> pytype.load_pytd.Loader:
+    return pytype.load_pytd.create_loader(pytype_options)
+
+
+def infer_and_trace(source, pytype_options, loader):
+    # 同 pytype.tools.traces.traces.trace，但复用已经加载好 builtins / typeshed 的 loader，
+    # 并且把 analyze.infer_types 的结果也返回
+    with pytype.config.verbosity_from(pytype_options):
+        ret = pytype.analyze.infer_types(src=source, options=pytype_options, loader=loader)
+        pytd_module = ret.ast
+        raw_traces = []
+        for op, symbol, data in ret.context.vm.opcode_traces:
+            raw_traces.append(
+                (op, symbol, tuple(pytype.tools.traces.traces._to_pytd(d, loader, pytd_module) for d in data)))
+    source_code = pytype.tools.traces.source.Code(
+        source, raw_traces, pytype.tools.traces.traces.TypeTrace, pytype_options.input)
+    return source_code, ret
+
+
+def trace(source, pytype_options, loader=None):
+    if loader is None:
+        return pytype.tools.traces.traces.trace(source, pytype_options)
+    return infer_and_trace(source, pytype_options, loader)[0]
+
+
+def generate_stub(ret, pytype_options) -> str:
+    # 同 pytype.io.generate_pyi
+    with pytype.config.verbosity_from(pytype_options):
+        stub = ret.ast
+        stub = pytype.pytd.optimize.Optimize(stub, ret.ast_deps, lossy=False, use_abcs=False,
+                                             max_union=7, remove_mutable=False)
+        stub = pytype.pytd.pytd_utils.CanonicalOrdering(stub)
+        return pytype.pytd.pytd_utils.Print(stub) + '\n'
+
+
+def full_annotate_source(source, ast_module, pytype_options, loader=None, positions=None):
+    with instrument.stage('pytype_trace'):
+        with pytype.io.wrap_pytype_exceptions(Exception, filename=pytype_options.input):
+            source_code = trace(source, pytype_options, loader)
+    with instrument.stage('annotation_map'):
+        return annotate_source(source, source_code, ast_module, pytype_options, positions)
+
+
+def annotate_source(source, source_code, ast_module, pytype_options, positions=None):
     module = ast_module.parse(source, pytype_options.input)
-    visitor = FullAnnotateAstVisitor(source_code, ast_module)
+    visitor = FullAnnotateAstVisitor(source_code, ast_module, positions)
     visitor.visit(module)
     return module
 
 
 class FullAnnotateAstVisitor(pytype.tools.traces.traces.MatchAstVisitor):
+    """
+    Annotates the nodes of an AST with their pytype types. If `positions` is given,
+    only the nodes at those positions are matched against the trace.
+    """
+
+    def __init__(self, src_code, ast_module, positions=None):
+        super().__init__(src_code, ast_module)
+        self._positions = positions
 
     def _maybe_annotate(self, node):
         """Annotates a node."""
@@ -41,10 +99,26 @@ class FullAnnotateAstVisitor(pytype.tools.traces.traces.MatchAstVisitor):
         node.resolved_annotation = pytype.pytd.pytd_utils.Print(trace.types[-1])
 
     def _call_visitor(self, node):
+        if self._positions is not None and get_position(node) not in self._positions:
+            return
         self._maybe_annotate(node)
 
 
-CodePosition = namedtuple('CodePosition', ['lineno', 'col_offset', 'end_lineno', 'end_col_offset'])
+def get_type_tag(resolved_type: pytd.Type) -> Optional[TypeTag]:
+    if not isinstance(resolved_type, pytd.GenericType):
+        return None
+    if not isinstance(resolved_type.base_type, pytd.ClassType):
+        return None
+    first_parameter = None
+    if resolved_type.parameters:
+        first_parameter = getattr(resolved_type.parameters[0], 'name', None)
+    tag = TypeTag(resolved_type.base_type.name, first_parameter)
+    return intern_type_tag(tag)
+
+
+def type_index_from_types(types: Mapping[CodePosition, pytd.Type]) -> TypeIndex:
+    items = ((position, get_type_tag(resolved_type)) for position, resolved_type in types.items())
+    return TypeIndex((position, tag) for position, tag in items if tag is not None)
 
 
 def generate_annotation_map(module: ast.AST) -> Dict[CodePosition, pytd.Type]:
@@ -62,13 +136,48 @@ def generate_annotation_map(module: ast.AST) -> Dict[CodePosition, pytd.Type]:
     return mapping
 
 
-def get_expression_types(source: str, config=None) -> Dict[CodePosition, pytd.Type]:
+def get_expression_types(source: str, config=None, loader=None) -> Dict[CodePosition, pytd.Type]:
     # 目前不会分析 relative import... 
     # 更改 Options 或可 ~
 
     if config is None:
-        config = pytype.config.Options.create()
+        config = create_options()
     
-    module = full_annotate_source(source, ast, pytype.config.Options.create())
+    module = full_annotate_source(source, ast, config, loader)
     return generate_annotation_map(module)
 
+
+def get_type_index(source: str, positions: Collection[CodePosition], config=None, loader=None) -> TypeIndex:
+    """
+    Returns the `TypeTag`s of the expressions at `positions`. Only those nodes are
+    matched against the pytype trace; the annotated AST and the trace are dropped
+    before returning.
+    """
+    if config is None:
+        config = create_options()
+
+    module = full_annotate_source(source, ast, config, loader, frozenset(positions))
+    with instrument.stage('annotation_map'):
+        return type_index_from_types(generate_annotation_map(module))
+
+
+def get_type_index_and_stub(source: str, positions: Collection[CodePosition],
+                            config=None, loader=None) -> Tuple[TypeIndex, str]:
+    """
+    Like `get_type_index`, but also returns the `.pyi` stub of the module, produced by
+    the same pytype run.
+    """
+    if config is None:
+        config = create_options()
+    if loader is None:
+        loader = create_loader(config)
+
+    with instrument.stage('pytype_trace'):
+        with pytype.io.wrap_pytype_exceptions(Exception, filename=config.input):
+            source_code, ret = infer_and_trace(source, config, loader)
+            stub = generate_stub(ret, config)
+        del ret
+    with instrument.stage('annotation_map'):
+        module = annotate_source(source, source_code, ast, config, frozenset(positions))
+        return type_index_from_types(generate_annotation_map(module)), stub
+
@@ -0,0 +1,275 @@
+from typing import *
+import collections
+import itertools
+import re
+import lib2to3.refactor as refactor
+from lib2to3 import fixer_base, pytree
+from lib2to3.pgen2 import grammar, token
+
+
+# ==========================================
+# 每个 fixer 的触发条件
+#
+# A trigger is a conjunction of clauses, and a clause is a set of token contents
+# ('class', '.') or token kinds ('<NUMBER>') of which at least one must occur in the
+# file. An empty trigger means the fixer always runs.
+
+Trigger = Tuple[FrozenSet[str], ...]
+
+# fixers that do not match through PATTERN, or whose pattern is too loose
+FIXER_TRIGGERS: Dict[str, Trigger] = {
+    'lib3to2.fixes.fix_division': (frozenset(['/']),),
+    'lib3to2.fixes.fix_numliterals': (frozenset(['<NUMBER>']),),
+    'lib3to2.fixes.fix_metaclass': (frozenset(['metaclass']),),
+    'lib3to2.fixes.fix_with': (frozenset(['with']),),
+}
+
+# distributing an alternative over a conjunction multiplies the clauses
+MAX_CLAUSES = 16
+
+
+def token_kind(type: int) -> str:
+    return '<%s>' % token.tok_name[type]
+
+
+def _sequence_trigger(patterns: Iterable[pytree.BasePattern]) -> Trigger:
+    clauses = []
+    for pattern in patterns:
+        # 可以不出现的部分不能作为条件
+        if isinstance(pattern, pytree.NegatedPattern):
+            continue
+        if isinstance(pattern, pytree.WildcardPattern) and pattern.min == 0:
+            continue
+        for clause in pattern_trigger(pattern):
+            if clause not in clauses:
+                clauses.append(clause)
+    return tuple(clauses)
+
+
+def pattern_trigger(pattern: pytree.BasePattern) -> Trigger:
+    """
+    Returns the tokens a node must contain to match the compiled lib2to3 `pattern`.
+    """
+    if isinstance(pattern, pytree.LeafPattern):
+        if pattern.content is not None:
+            return (frozenset([pattern.content]),)
+        if pattern.type is not None:
+            return (frozenset([token_kind(pattern.type)]),)
+        return ()
+    if isinstance(pattern, pytree.NodePattern):
+        if pattern.content is None:
+            return ()
+        return _sequence_trigger(pattern.content)
+    if isinstance(pattern, pytree.WildcardPattern):
+        if pattern.content is None or pattern.min == 0:
+            return ()
+        alternatives = [_sequence_trigger(alternative) for alternative in pattern.content]
+        if not all(alternatives):
+            return ()
+        if _product_size(alternatives) > MAX_CLAUSES:
+            # 每个分支只保留最小的一个 clause
+            alternatives = [(min(alternative, key=len),) for alternative in alternatives]
+        clauses = []
+        for combination in itertools.product(*alternatives):
+            clause = frozenset().union(*combination)
+            if clause not in clauses:
+                clauses.append(clause)
+        return tuple(clauses)
+    return ()
+
+
+def _product_size(alternatives: Sequence[Trigger]) -> int:
+    size = 1
+    for alternative in alternatives:
+        size *= len(alternative)
+    return size
+
+
+def fixer_trigger(fixer: fixer_base.BaseFix) -> Trigger:
+    name = type(fixer).__module__
+    if name in FIXER_TRIGGERS:
+        return FIXER_TRIGGERS[name]
+    if fixer.pattern is None:
+        return ()
+    return pattern_trigger(fixer.pattern)
+
+
+# ==========================================
+# 每个文件的 token 索引
+
+_WORD_RE = re.compile(r'\w+')
+
+_OPERATORS = {type: op for op, type in grammar.opmap.items()}
+
+
+class TokenIndex:
+    """
+    An over-approximation of the tokens of `code`: every word and operator
+    substring counts as present, including those in strings and comments.
+    """
+
+    def __init__(self, code: str):
+        self.code = code
+        self.words = set(_WORD_RE.findall(code))
+
+    def __contains__(self, item: str) -> bool:
+        if item.startswith('<') and item.endswith('>') and len(item) > 2:
+            return self._has_kind(item[1:-1])
+        if _WORD_RE.fullmatch(item):
+            return item in self.words
+        return item in self.code
+
+    def _has_kind(self, kind: str) -> bool:
+        type = getattr(token, kind, None)
+        if type in _OPERATORS:
+            return _OPERATORS[type] in self.code
+        if kind == 'NAME':
+            return any(not word[0].isdigit() for word in self.words)
+        if kind == 'NUMBER':
+            return any(word[0].isdigit() for word in self.words)
+        if kind == 'STRING':
+            return '"' in self.code or "'" in self.code
+        return True
+
+    def matches(self, trigger: Trigger) -> bool:
+        return all(any(item in self for item in clause) for clause in trigger)
+
+
+# ==========================================
+# 只运行可能匹配的 fixers
+
+def short_fixer_name(name: str) -> str:
+    return name.rsplit('.', 1)[-1]
+
+
+def clear_changed(node: pytree.Base):
+    # 标记过的节点总是包含它们的祖先，所以只需要往下走标记过的节点
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if node.was_changed:
+            node.was_changed = False
+            stack.extend(node.children)
+
+
+class _FixerSubsetTool(refactor.RefactoringTool):
+    # 复用已经实例化（并编译好 pattern）的 fixers
+    def __init__(self, pre_order, post_order):
+        self._fixer_lists = (pre_order, post_order)
+        super().__init__([], None, [])
+
+    def get_fixers(self):
+        return self._fixer_lists
+
+
+class FixerSet:
+    """
+    The lib3to2 fixers of one conversion session. `refactor` only runs the fixers
+    whose trigger tokens occur in the code, and skips the lib2to3 parse if there are
+    none. If the output of the selected fixers triggers another fixer, the code is
+    refactored again with that fixer added, so the result is the same as running
+    every fixer.
+
+    With `collect_stats`, `stats` counts for each fixer the files it ran on and the
+    files it changed.
+    """
+
+    MAX_TOOLS = 64
+
+    def __init__(self, fixer_names: Sequence[str], prescreen: bool = True, collect_stats: bool = False):
+        self.fixer_names = list(fixer_names)
+        self.prescreen = prescreen
+        self.collect_stats = collect_stats
+        self.stats: Dict[str, Dict[str, int]] = collections.defaultdict(lambda: {'run': 0, 'changed': 0})
+        self.last_run: Tuple[str, ...] = ()
+        self.last_changed: Tuple[str, ...] = ()
+
+        self._tool = refactor.RefactoringTool(self.fixer_names, None, self.fixer_names)
+        self._pre_order = self._tool.pre_order
+        self._post_order = self._tool.post_order
+        self.triggers: Dict[str, Trigger] = {}
+        for fixer in self._pre_order + self._post_order:
+            name = short_fixer_name(type(fixer).__module__)
+            self.triggers[name] = fixer_trigger(fixer)
+            if collect_stats:
+                fixer.transform = self._recording_transform(name, fixer.transform)
+        self._tools: Dict[FrozenSet[str], refactor.RefactoringTool] = collections.OrderedDict()
+        self._changed: Set[str] = set()
+
+    def _recording_transform(self, name: str, transform):
+        def recording_transform(node, results):
+            if name in self._changed:
+                return transform(node, results)
+            root = node
+            while root.parent is not None:
+                root = root.parent
+            # pytree 的修改会把 was_changed 一直标记到根上，除非中途遇到已经标记过的节点
+            clear_changed(root)
+            before = str(node)
+            new = transform(node, results)
+            # 有些 fixer 直接改 leaf.value，不会标记
+            if root.was_changed or str(node) != before or (new is not None and str(new) != before):
+                self._changed.add(name)
+            return new
+        return recording_transform
+
+    def applicable(self, code: str) -> Set[str]:
+        if not self.prescreen:
+            return set(self.triggers)
+        index = TokenIndex(code)
+        return {name for name, trigger in self.triggers.items() if index.matches(trigger)}
+
+    def _get_tool(self, names: FrozenSet[str]) -> refactor.RefactoringTool:
+        if len(names) == len(self.triggers):
+            return self._tool
+        tool = self._tools.pop(names, None)
+        if tool is None:
+            tool = _FixerSubsetTool(
+                [fixer for fixer in self._pre_order if short_fixer_name(type(fixer).__module__) in names],
+                [fixer for fixer in self._post_order if short_fixer_name(type(fixer).__module__) in names])
+            if len(self._tools) >= FixerSet.MAX_TOOLS:
+                self._tools.popitem(last=False)
+        self._tools[names] = tool
+        return tool
+
+    def refactor(self, code: str) -> str:
+        code = code + '\n'
+        names = frozenset(self.applicable(code))
+        while True:
+            self._changed = set()
+            if names:
+                result = str(self._get_tool(names).refactor_string(code, '<code>'))
+            else:
+                result = code
+            if not self.prescreen or result == code:
+                break
+            more = names.union(self.applicable(result))
+            if more == names:
+                break
+            names = more
+
+        self.last_run = tuple(sorted(names))
+        self.last_changed = tuple(sorted(self._changed))
+        if self.collect_stats:
+            for name in self.last_run:
+                self.stats[name]['run'] += 1
+            for name in self.last_changed:
+                self.stats[name]['changed'] += 1
+        return result
+
+
+def resolve_fixer_names(names: Iterable[str], available: Sequence[str]) -> List[str]:
+    """
+    Maps `str`, `fix_str` or `lib3to2.fixes.fix_str` to the name in `available`.
+    Raises ValueError for an unknown fixer.
+    """
+    by_short_name = {short_fixer_name(name): name for name in available}
+    resolved = []
+    for name in names:
+        short_name = short_fixer_name(name)
+        if not short_name.startswith('fix_'):
+            short_name = 'fix_' + short_name
+        if short_name not in by_short_name:
+            raise ValueError('unknown fixer: %s' % name)
+        resolved.append(by_short_name[short_name])
+    return resolved
@@ -0,0 +1,281 @@
+from typing import *
+from collections import namedtuple
+import json
+import os
+import pickle
+import struct
+import subprocess
+import sys
+import time
+import traceback
+
+from . import instrument
+from .type_index import CodePosition, TypeIndex
+
+
+# ==========================================
+# pytype 的会话：同一个进程里，或者在有时间 / 内存限制的子进程里
+
+# 每个文件的类型推断的限制，秒和字节，None 表示不限制
+InferenceLimits = namedtuple('InferenceLimits', ['timeout', 'max_memory'], defaults=(None, None))
+
+
+class InferenceLimitExceeded(Exception):
+    def __init__(self, reason: str, limit: float):
+        super().__init__(reason, limit)
+        self.reason = reason
+        self.limit = limit
+
+    def __str__(self):
+        if self.reason == 'timeout':
+            return 'took longer than %gs' % self.limit
+        return 'used more than %d MiB' % (self.limit // (1024 * 1024))
+
+
+class PytypeSession:
+    """
+    The pytype options and the builtins/typeshed loader of a process, created on the
+    first module that needs type inference and reused by the later ones.
+
+    With `stub_directory`, pytype resolves imports against the `.pyi` stubs in that
+    directory (see `py3to2.project`), and each module is analyzed under its own path and
+    module name.
+    """
+
+    def __init__(self, stub_directory: Optional[str] = None, pytype_options=None):
+        self.stub_directory = stub_directory
+        self.options = pytype_options
+        self.loader = None
+
+    def load(self):
+        if self.loader is None:
+            with instrument.stage('pytype_setup'):
+                return self._create()
+        from . import expression_type
+        return expression_type
+
+    def _create(self):
+        # expression_type imports pytype, which takes most of the startup time
+        from . import expression_type
+        if self.options is None:
+            if self.stub_directory is not None:
+                self.options = expression_type.create_options(pythonpath=self.stub_directory)
+            else:
+                self.options = expression_type.create_options()
+        self.loader = expression_type.create_loader(self.options)
+        return expression_type
+
+    def _set_module(self, path: Optional[str], module_name: Optional[str]):
+        if self.stub_directory is not None:
+            self.options.tweak(input=path, module_name=module_name)
+
+    def get_type_index(self, code: str, positions: Collection[CodePosition],
+                       path: Optional[str] = None, module_name: Optional[str] = None) -> TypeIndex:
+        expression_type = self.load()
+        self._set_module(path, module_name)
+        return expression_type.get_type_index(code, positions, self.options, self.loader)
+
+    def get_type_index_and_stub(self, code: str, positions: Collection[CodePosition],
+                                path: Optional[str] = None, module_name: Optional[str] = None
+                                ) -> Tuple[TypeIndex, str]:
+        expression_type = self.load()
+        self._set_module(path, module_name)
+        return expression_type.get_type_index_and_stub(code, positions, self.options, self.loader)
+
+
+def write_frame(output: BinaryIO, value: Any):
+    data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    output.write(struct.pack('>Q', len(data)) + data)
+    output.flush()
+
+
+def read_frame(input: BinaryIO) -> Optional[Any]:
+    header = input.read(8)
+    if len(header) < 8:
+        return None
+    size, = struct.unpack('>Q', header)
+    data = input.read(size)
+    if len(data) < size:
+        return None
+    return pickle.loads(data)
+
+
+def process_rss(pid: int) -> Optional[int]:
+    try:
+        with open('/proc/%d/status' % pid) as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class SandboxedPytypeSession:
+    """
+    A `PytypeSession` in a child process (`python -m py3to2.inference`), so that the
+    inference of a module can be stopped once it goes over `limits`: the child is
+    killed and `InferenceLimitExceeded` is raised. The next module starts a new child.
+
+    The time limit counts from the request to the answer, without the setup of the
+    child. The memory limit is on the RSS of the child, which is polled through
+    /proc (so it is only enforced on Linux).
+    """
+
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, limits: InferenceLimits, stub_directory: Optional[str] = None):
+        self.limits = limits
+        self.stub_directory = stub_directory
+        self._process: Optional[subprocess.Popen] = None
+
+    def _start(self):
+        args = [sys.executable, '-m', 'py3to2.inference']
+        if self.stub_directory is not None:
+            args += ['--stub-dir', self.stub_directory]
+        # 子进程要能 import 到同一个 py3to2
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get('PYTHONPATH')])))
+        with instrument.stage('pytype_setup'):
+            self._process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env)
+            if read_frame(self._process.stdout) is None:
+                self.close()
+                raise RuntimeError('the pytype process exited during its setup')
+
+    def load(self):
+        # 子进程在这里就完成 pytype 的初始化
+        if self._process is None:
+            self._start()
+
+    def close(self):
+        process, self._process = self._process, None
+        if process is not None:
+            process.kill()
+            process.wait()
+            process.stdin.close()
+            process.stdout.close()
+
+    def _wait(self):
+        import select
+
+        process = self._process
+        timeout, max_memory = self.limits
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.POLL_INTERVAL if max_memory is not None else None
+            if deadline is not None:
+                wait = max(0.0, min(wait or timeout, deadline - time.monotonic()))
+            if select.select([process.stdout], [], [], wait)[0]:
+                return
+            if deadline is not None and time.monotonic() >= deadline:
+                self.close()
+                raise InferenceLimitExceeded('timeout', timeout)
+            if max_memory is not None and (process_rss(process.pid) or 0) > max_memory:
+                self.close()
+                raise InferenceLimitExceeded('memory', max_memory)
+
+    def _request(self, method: str, *args):
+        if self._process is None:
+            self._start()
+        with instrument.stage('pytype_trace'):
+            write_frame(self._process.stdin, (method, args))
+            self._wait()
+            response = read_frame(self._process.stdout)
+        if response is None:
+            self.close()
+            if self.limits.max_memory is not None:
+                # 多半是内存不够被杀掉了
+                raise InferenceLimitExceeded('memory', self.limits.max_memory)
+            raise RuntimeError('the pytype process exited unexpectedly')
+        status, value = response
+        if status == 'error':
+            raise RuntimeError('type inference failed in the pytype process:\n%s' % value)
+        return value
+
+    def get_type_index(self, code: str, positions: Collection[CodePosition],
+                       path: Optional[str] = None, module_name: Optional[str] = None) -> TypeIndex:
+        return self._request('get_type_index', code, list(positions), path, module_name)
+
+    def get_type_index_and_stub(self, code: str, positions: Collection[CodePosition],
+                                path: Optional[str] = None, module_name: Optional[str] = None
+                                ) -> Tuple[TypeIndex, str]:
+        return self._request('get_type_index_and_stub', code, list(positions), path, module_name)
+
+
+def create_pytype_session(limits: Optional[InferenceLimits] = None, stub_directory: Optional[str] = None,
+                          pytype_options=None) -> Union[PytypeSession, SandboxedPytypeSession]:
+    if limits is not None and (limits.timeout is not None or limits.max_memory is not None):
+        return SandboxedPytypeSession(limits, stub_directory)
+    return PytypeSession(stub_directory, pytype_options)
+
+
+# ==========================================
+# 超过限制的文件，下次直接跳过类型推断
+
+class FallbackRegistry:
+    """
+    The files whose type inference went over the limits, stored in the JSON file `path`
+    so that later runs convert them without type inference right away. A file is tried
+    again once the limit it went over is raised (or removed).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        try:
+            with open(path, 'r', encoding='utf8') as f:
+                self.entries: Dict[str, Dict[str, Any]] = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def skipped(self, limits: InferenceLimits) -> Dict[str, str]:
+        """
+        Returns {absolute path: reason} of the files that would go over `limits` again.
+        """
+        skipped = {}
+        for path, entry in self.entries.items():
+            limit = limits.timeout if entry['reason'] == 'timeout' else limits.max_memory
+            if limit is not None and limit <= entry['limit']:
+                skipped[path] = entry['reason']
+        return skipped
+
+    def record(self, path: str, reason: str, limits: InferenceLimits):
+        limit = limits.timeout if reason == 'timeout' else limits.max_memory
+        self.entries[os.path.abspath(path)] = {'reason': reason, 'limit': limit}
+
+    def save(self):
+        from .cache import write_atomic
+        write_atomic(self.path, json.dumps(self.entries, indent=1, sort_keys=True).encode('utf8'))
+
+
+# ==========================================
+# python -m py3to2.inference: SandboxedPytypeSession 的子进程
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser('py3to2.inference')
+    parser.add_argument('--stub-dir', type=str, default=None)
+    args = parser.parse_args()
+
+    # 协议走原来的 stdout，pytype 打印的东西都去 stderr
+    output = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    input = sys.stdin.buffer
+
+    session = PytypeSession(args.stub_dir)
+    session.load()
+    write_frame(output, ('ready', None))
+    while True:
+        request = read_frame(input)
+        if request is None:
+            return
+        method, method_args = request
+        try:
+            response = ('ok', getattr(session, method)(*method_args))
+        except Exception:
+            response = ('error', traceback.format_exc())
+        write_frame(output, response)
+
+
+if __name__ == '__main__':
+    main()
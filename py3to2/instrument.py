@@ -0,0 +1,212 @@
+from typing import *
+import contextlib
+import os
+import time
+
+
+# ==========================================
+# 每个文件、每个阶段的耗时
+#
+# The conversion code calls `stage(name)` around each of its stages and
+# `count_read` / `count_written` for its file I/O. Outside of `Instrumentation.record`
+# they do nothing. Stages:
+#
+#   read, write         reading the source and writing the output
+#   cache               looking up and storing the converted code
+#   parse               cst.parse_module
+#   type_queries        looking for the expressions pytype has to type
+#   pytype_setup        the pytype options and loader, once per process
+#   pytype_trace        pytype inference and opcode trace (and the .pyi stub)
+#   annotation_map      matching the trace against the AST
+#   resolve             the syntactic resolver, instead of pytype (--resolver=syntactic)
+#   strip_typing        finding the typing-only code to remove (--strip-typing)
+#   libcst              the fused libcst pass, split by transformer into
+#                       libcst.RemoveTypehint, libcst.AddHeader, ...
+#   lib3to2             the lib3to2 fixers
+
+_current: Optional['FileStats'] = None
+
+
+class FileStats:
+    def __init__(self, path: str):
+        self.path = path
+        self.stages: Dict[str, float] = {}
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak_rss = 0
+        self.profile: Optional[str] = None
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'path': self.path,
+            'wall': self.wall,
+            'cpu': self.cpu,
+            'peak_rss': self.peak_rss,
+            'bytes_read': self.bytes_read,
+            'bytes_written': self.bytes_written,
+            'stages': dict(self.stages),
+            'profile': self.profile,
+        }
+
+
+def recording() -> bool:
+    return _current is not None
+
+
+@contextlib.contextmanager
+def stage(name: str) -> Iterator[None]:
+    stats = _current
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.add(name, time.perf_counter() - start)
+
+
+def add_stages(prefix: str, timings: Mapping[str, float]):
+    if _current is not None:
+        for name, seconds in timings.items():
+            _current.add(prefix + name, seconds)
+
+
+def count_read(n_bytes: int):
+    if _current is not None:
+        _current.bytes_read += n_bytes
+
+
+def count_written(n_bytes: int):
+    if _current is not None:
+        _current.bytes_written += n_bytes
+
+
+def reset_peak_rss():
+    # Linux: 把 VmHWM 重置为当前的 RSS
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss() -> int:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # 重置不了的时候只能拿到整个进程的峰值
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def profile_path(directory: str, path: str) -> str:
+    name = os.path.normpath(path).replace(os.sep, '__').replace(':', '_').lstrip('._')
+    return os.path.join(directory, name + '.prof')
+
+
+class Instrumentation:
+    """
+    Records a `FileStats` per converted file. With `profile_directory`, every file is
+    also converted under cProfile and its profile is dumped to that directory (see
+    `prune_profiles`). Instances are passed to the worker processes.
+    """
+
+    def __init__(self, profile_directory: Optional[str] = None):
+        self.profile_directory = profile_directory
+
+    @contextlib.contextmanager
+    def record(self, path: str) -> Iterator[FileStats]:
+        global _current
+
+        stats = FileStats(path)
+        profiler = None
+        if self.profile_directory is not None:
+            import cProfile
+            profiler = cProfile.Profile()
+        reset_peak_rss()
+        previous, _current = _current, stats
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield stats
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            stats.wall = time.perf_counter() - wall
+            stats.cpu = time.process_time() - cpu
+            stats.peak_rss = peak_rss()
+            _current = previous
+            if profiler is not None:
+                os.makedirs(self.profile_directory, exist_ok=True)
+                stats.profile = profile_path(self.profile_directory, path)
+                profiler.dump_stats(stats.profile)
+
+
+# ==========================================
+# 报告
+
+STATS_COLUMNS = ('path', 'cached', 'error', 'wall', 'cpu', 'peak_rss', 'bytes_read', 'bytes_written')
+
+
+def slowest(records: Sequence[Dict[str, Any]], n: int) -> List[Dict[str, Any]]:
+    return sorted(records, key=lambda record: -record['wall'])[:n]
+
+
+def write_stats(path: str, records: Sequence[Dict[str, Any]]):
+    """
+    Writes the per-file records to `path`, as CSV if it ends with `.csv` (one column per
+    stage) and as JSON otherwise.
+    """
+    stage_names = sorted({name for record in records for name in record['stages']})
+    if path.endswith('.csv'):
+        import csv
+        with open(path, 'w', newline='', encoding='utf8') as f:
+            writer = csv.writer(f)
+            writer.writerow(list(STATS_COLUMNS) + stage_names)
+            for record in records:
+                writer.writerow([record[column] for column in STATS_COLUMNS] +
+                                [record['stages'].get(name, 0.0) for name in stage_names])
+        return
+
+    import json
+    totals: Dict[str, Any] = {column: sum(record[column] for record in records)
+                              for column in ('wall', 'cpu', 'bytes_read', 'bytes_written')}
+    totals['peak_rss'] = max((record['peak_rss'] for record in records), default=0)
+    totals['stages'] = {name: sum(record['stages'].get(name, 0.0) for record in records) for name in stage_names}
+    with open(path, 'w', encoding='utf8') as f:
+        json.dump({'files': list(records), 'totals': totals}, f, indent=2)
+
+
+def format_slowest(records: Sequence[Dict[str, Any]], n: int) -> str:
+    lines = ['%d slowest file(s):' % min(n, len(records))]
+    for record in slowest(records, n):
+        stages = sorted(((seconds, name) for name, seconds in record['stages'].items() if '.' not in name),
+                        reverse=True)[:3]
+        lines.append('  %8.3fs wall %8.3fs cpu %7.1f MiB  %s  (%s)' % (
+            record['wall'], record['cpu'], record['peak_rss'] / 2 ** 20, record['path'],
+            ', '.join('%s %.3fs' % (name, seconds) for seconds, name in stages) or 'no stages'))
+    return '\n'.join(lines) + '\n'
+
+
+def prune_profiles(records: Sequence[Dict[str, Any]], n: int):
+    """
+    Keeps the profiles of the `n` slowest files and deletes the others.
+    """
+    keep = {record['profile'] for record in slowest(records, n)}
+    for record in records:
+        if record['profile'] is not None and record['profile'] not in keep:
+            with contextlib.suppress(OSError):
+                os.unlink(record['profile'])
+            record['profile'] = None
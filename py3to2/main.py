@@ -1,22 +1,120 @@
-from .convert import *
+from typing import *
+from . import instrument
+from .cache import ConversionCache, DEFAULT_MAX_SIZE, default_cache_dir
+from .project import ModuleGraph, StubCache, default_stub_dir, is_package_path, write_stub
+from .tree import SHIM_NAMES, mirror_file, plan_tree, prune_files, referenced_shims, write_if_changed
+from .type_index import TypeIndex
+from .typing_shims import BASE64_CONSTS
+from collections import namedtuple
+import argparse
+import base64
+import itertools
+import os
+import sys
+import traceback
 
-def convert_path(source_path: str, target_path: str, module_directory: str):
-    with open(source_path, 'r', encoding='utf8') as source_f:
-        code = source_f.read()
+# libcst, lib2to3 和 pytype 都很慢，只在需要转换的子命令里 import，
+# 这样 `initialize` 和 `--help` 可以很快返回
+if TYPE_CHECKING:
+    from .convert import Converter
 
-    code = apply_libcst_change(code, target_path, module_directory)
-    code = apply_lib3to2_change(code)
 
-    if target_path is None:
-        sys.stdout.write(code)
-    else:
-        with open(target_path, 'w', encoding='utf8') as target_f:
-            target_f.write(code)
+# fixers_run / fixers_changed 只在 --fixer-stats 时记录，stats 只在 --stats / --profile 时记录，
+# written 只在 convert-tree 时记录。fallback 是类型推断超过限制的原因。
+# output 是 --output-archive 时转换结果的字节，shims 是转换结果 import 的 shim 文件名
+ConvertResult = namedtuple('ConvertResult', ['path', 'cached', 'error', 'inference_skipped', 'interface',
+                                             'fixers_run', 'fixers_changed', 'stats', 'written', 'fallback',
+                                             'output', 'shims'],
+                           defaults=(False, None, None, None, None, None, None, None, ()))
+
+# project 模式下一个模块的转换任务。stub_path 为 None 时不需要（重新）生成 .pyi
+ProjectTask = namedtuple('ProjectTask', ['path', 'module_name', 'stub_key', 'stub_path'])
+
+
+def decode_source(source: bytes) -> str:
+    # 和 open(..., 'r') 的 universal newlines 保持一致
+    return source.decode('utf8').replace('\r\n', '\n').replace('\r', '\n')
+
+
+def convert_path(source_path: str, target_path: str, module_directory: str,
+                 cache: Optional[ConversionCache] = None,
+                 converter: Optional['Converter'] = None) -> Tuple[str, bool]:
+    """
+    Converts `source_path` into `target_path` (stdout if None).
+    Returns the converted code and whether it came from `cache`.
+    """
+    source = read_source(source_path)
+    code, cached = convert_source(source, target_path, module_directory, cache, converter)
+    write_target(target_path, code)
+    return code, cached
+
+
+def convert_source(source: bytes, target_path: str, module_directory: str,
+                   cache: Optional[ConversionCache] = None,
+                   converter: Optional['Converter'] = None) -> Tuple[str, bool]:
+    """
+    Returns the converted code of `source`, which will live at `target_path`, and
+    whether it came from `cache`.
+    """
+    from .convert import Converter, get_relative_dots
+
+    if converter is None:
+        converter = Converter(module_directory)
+    relative_dots = get_relative_dots(target_path, module_directory)
+
+    code = None
+    if cache is not None:
+        with instrument.stage('cache'):
+            key = cache.key(source, relative_dots, converter.cache_tag + converter.fallback_tag(target_path))
+            code = cache.get(key)
+    cached = code is not None
+
+    if code is None:
+        n_fallbacks = converter.n_fallbacks
+        code = converter.convert(decode_source(source), target_path, module_directory)
+        if cache is not None:
+            with instrument.stage('cache'):
+                if converter.n_fallbacks > n_fallbacks:
+                    key = cache.key(source, relative_dots, converter.cache_tag + converter.fallback_tag(target_path))
+                cache.put(key, code)
+    return code, cached
+
+
+def read_source(source_path: str) -> bytes:
+    with instrument.stage('read'):
+        with open(source_path, 'rb') as source_f:
+            source = source_f.read()
+    instrument.count_read(len(source))
+    return source
+
+
+def write_target(target_path: Optional[str], code: str):
+    with instrument.stage('write'):
+        if target_path is None:
+            sys.stdout.write(code)
+        else:
+            with open(target_path, 'w', encoding='utf8') as target_f:
+                target_f.write(code)
+    if instrument.recording():
+        instrument.count_written(len(code.encode('utf8')))
+
+
+def write_target_if_changed(target_path: str, code: str) -> bool:
+    data = code.encode('utf8')
+    with instrument.stage('write'):
+        written = write_if_changed(target_path, data)
+    if written:
+        instrument.count_written(len(data))
+    return written
+
 
+SHIMS = {'_py3to2_typing.py': BASE64_CONSTS.PY_TYPING,
+         '_py3to2_typing_extensions.py': BASE64_CONSTS.PY_TYPING_EXTENSION}
 
-def initialize_directory(target_dir: str):
-    write_base64(BASE64_CONSTS.PY_TYPING, os.path.join(target_dir, '_py3to2_typing.py'))
-    write_base64(BASE64_CONSTS.PY_TYPING_EXTENSION, os.path.join(target_dir, '_py3to2_typing_extensions.py'))
+
+def initialize_directory(target_dir: str, shims: Iterable[str] = SHIM_NAMES):
+    for name in shims:
+        write_base64(SHIMS[name], os.path.join(target_dir, name))
 
 
 def convert(args):
@@ -24,26 +122,720 @@ def convert(args):
     target_path = args.output
     module_directory = getattr(args, 'module-directory')
 
-    convert_path(source_path, target_path, module_directory)
+    from .convert import Converter
 
+    converter = Converter(module_directory, fixers=get_fixer_names(args), fixer_stats=args.fixer_stats,
+                          infer=not args.no_infer, resolver=args.resolver, strip_typing=args.strip_typing)
+    convert_path(source_path, target_path, module_directory, converter=converter)
+    if args.fixer_stats:
+        write_fixer_stats(converter.fixers.stats, 1)
 
-def convert_all(args):
-    directory = args.directory
 
+def iter_python_files(directory: str) -> Iterator[str]:
     for folder, _, files in os.walk(directory):
         for file in files:
             file: str
             if file.endswith('.py'):
-                io_path = os.path.join(folder, file)
-                convert_path(io_path, io_path, directory)    
+                yield os.path.join(folder, file)
+
+
+def convert_path_safe(source_path: str, target_path: str, module_directory: str,
+                      cache: Optional[ConversionCache] = None,
+                      converter: Optional['Converter'] = None) -> ConvertResult:
+    # 出错时返回 traceback，而不是让整个 batch 挂掉
+    try:
+        code, cached = convert_path(source_path, target_path, module_directory, cache, converter)
+    except Exception:
+        return ConvertResult(source_path, False, traceback.format_exc())
+    return ConvertResult(source_path, cached, None, shims=referenced_shims(code))
+
+
+# 每个进程一个 Converter，fixers 和 pytype 的状态在多个文件之间复用
+_worker_converter: Optional['Converter'] = None
+
+
+def _init_convert_all_worker(directory: str, prefilter: bool = True, stub_directory: Optional[str] = None,
+                             fixers: Optional[Sequence[str]] = None, fixer_stats: bool = False,
+                             infer: bool = True, limits=None, fallbacks: Optional[Mapping[str, str]] = None,
+                             resolver: str = 'pytype', class_index=None, strip_typing: bool = False):
+    from .convert import Converter
+
+    global _worker_converter
+    _worker_converter = Converter(directory, prefilter=prefilter, stub_directory=stub_directory,
+                                  fixers=fixers, fixer_stats=fixer_stats, infer=infer, limits=limits,
+                                  fallbacks=fallbacks, resolver=resolver, class_index=class_index,
+                                  strip_typing=strip_typing)
+
+
+def with_fallback(result: ConvertResult, converter: 'Converter', n_fallbacks: int,
+                  path: Optional[str] = None) -> ConvertResult:
+    if converter.n_fallbacks == n_fallbacks:
+        return result
+    return result._replace(fallback=converter.fallbacks.get(os.path.abspath(path or result.path)))
+
+
+def with_fixer_stats(result: ConvertResult, converter: 'Converter') -> ConvertResult:
+    if result.cached or result.error is not None or not converter.fixers.collect_stats:
+        return result
+    return result._replace(fixers_run=converter.fixers.last_run, fixers_changed=converter.fixers.last_changed)
+
+
+def recorded(instrumentation: Optional[instrument.Instrumentation], path: str,
+             func: Callable[..., ConvertResult], *args) -> ConvertResult:
+    if instrumentation is None:
+        return func(*args)
+    with instrumentation.record(path) as file_stats:
+        result = func(*args)
+    return result._replace(stats=file_stats.as_dict())
+
+
+def run_worker(instrumentation: Optional[instrument.Instrumentation], path: str,
+               func: Callable[..., ConvertResult], *args, fallback_path: Optional[str] = None) -> ConvertResult:
+    """
+    Runs `func(*args, converter)` with the converter of this worker and adds to the
+    result what the converter counted meanwhile: skipped inference, a fallback (recorded
+    under `fallback_path`, by default the result's path) and the fixer stats.
+    """
+    converter = _worker_converter
+    n_skipped = converter.n_inference_skipped
+    n_fallbacks = converter.n_fallbacks
+    result = recorded(instrumentation, path, func, *args, converter)
+    result = result._replace(inference_skipped=converter.n_inference_skipped > n_skipped)
+    result = with_fallback(result, converter, n_fallbacks, fallback_path)
+    return with_fixer_stats(result, converter)
+
+
+def _convert_all_worker(io_path: str, directory: str, cache: Optional[ConversionCache],
+                        instrumentation: Optional[instrument.Instrumentation] = None) -> ConvertResult:
+    return run_worker(instrumentation, io_path, convert_path_safe, io_path, io_path, directory, cache)
+
+
+def convert_tree_file(source_path: str, target_path: str, directory: str, cache: Optional[ConversionCache],
+                      converter: 'Converter') -> ConvertResult:
+    try:
+        source = read_source(source_path)
+        code, cached = convert_source(source, target_path, directory, cache, converter)
+        written = write_target_if_changed(target_path, code)
+    except Exception:
+        return ConvertResult(source_path, False, traceback.format_exc())
+    return ConvertResult(source_path, cached, None, written=written, shims=referenced_shims(code))
+
+
+def _convert_tree_worker(paths: Tuple[str, str], directory: str, cache: Optional[ConversionCache],
+                         instrumentation: Optional[instrument.Instrumentation] = None) -> ConvertResult:
+    source_path, target_path = paths
+    # fallback 按 DST 里的路径记录
+    return run_worker(instrumentation, source_path, convert_tree_file, source_path, target_path, directory, cache,
+                      fallback_path=target_path)
+
+
+def convert_archive_file(source_path: str, directory: str, cache: Optional[ConversionCache],
+                         converter: 'Converter') -> ConvertResult:
+    try:
+        source = read_source(source_path)
+        code, cached = convert_source(source, source_path, directory, cache, converter)
+    except Exception:
+        return ConvertResult(source_path, False, traceback.format_exc())
+    return ConvertResult(source_path, cached, None, output=code.encode('utf8'), shims=referenced_shims(code))
+
+
+def _convert_archive_worker(io_path: str, directory: str, cache: Optional[ConversionCache],
+                            instrumentation: Optional[instrument.Instrumentation] = None) -> ConvertResult:
+    return run_worker(instrumentation, io_path, convert_archive_file, io_path, directory, cache)
+
+
+def archive_package(directory: str) -> str:
+    """
+    The package the entries of `--output-archive` go under: the converted modules
+    import the shims relative to `directory`, so it has to be a package itself.
+    Raises ValueError if its name cannot be imported.
+    """
+    package = os.path.basename(os.path.abspath(directory))
+    if not package.isidentifier():
+        raise ValueError('the converted modules import %s as a package, so its name must be a Python identifier '
+                         'to be imported from an archive' % directory)
+    return package
+
+
+def write_archive(archive: 'ArchiveWriter', directory: str, python_files: Sequence[str],
+                  other_files: Sequence[str], results: Iterable[ConvertResult],
+                  all_shims: bool = True) -> Iterator[ConvertResult]:
+    """
+    Adds the converted modules and `other_files` to `archive` under `archive_package`
+    in the order of their names, as `results` (in the order of `python_files`) come
+    in, and passes the results on. The package's `__init__.py` is added if
+    `directory` has none. The typing shims come last: all of them, or without
+    `all_shims`, those the converted modules import. The archive is closed if every
+    module converted, and aborted otherwise.
+    """
+    package = archive_package(directory)
+    python_names = set(python_files)
+    names = sorted(set(python_files).union(other_files, ['__init__.py']), key=lambda name: name.replace(os.sep, '/'))
+    results = iter(results)
+    shims = set(SHIM_NAMES) if all_shims else set()
+    failed = False
+    try:
+        for name in names:
+            arcname = package + '/' + name.replace(os.sep, '/')
+            path = os.path.join(directory, name)
+            if name in python_names:
+                result = next(results)
+                failed = failed or result.error is not None
+                if not failed:
+                    archive.add(arcname, result.output, executable=os.access(path, os.X_OK))
+                    shims.update(result.shims)
+                yield result._replace(output=None)
+            elif name == '__init__.py' and not failed:
+                archive.add(arcname, b'')
+            elif not failed:
+                with open(path, 'rb') as f:
+                    archive.add(arcname, f.read(), executable=os.access(path, os.X_OK))
+        if not failed:
+            for name in sorted(shims):
+                archive.add(package + '/' + name, base64.standard_b64decode(SHIMS[name]))
+    except BaseException:
+        archive.abort()
+        raise
+    if failed:
+        archive.abort()
+    else:
+        archive.close()
+
+
+def map_workers(worker: Callable[..., ConvertResult], worker_args: Sequence[Iterable], n_items: int, jobs: int,
+                worker_init_args: tuple) -> Iterator[ConvertResult]:
+    """
+    Runs `worker` over `worker_args` in this process or in a pool of `jobs` processes,
+    each with its own `Converter`.
+    """
+    if jobs <= 1 or n_items <= 1:
+        _init_convert_all_worker(*worker_init_args)
+        yield from map(worker, *worker_args)
+    else:
+        import concurrent.futures
+        # worker 进程各自只 import 一次 pytype / libcst / lib2to3
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=_init_convert_all_worker,
+                                                    initargs=worker_init_args) as executor:
+            yield from executor.map(worker, *worker_args)
+
+
+def convert_project_module(task: ProjectTask, directory: str, cache: Optional[ConversionCache],
+                           converter: 'Converter') -> ConvertResult:
+    """
+    Converts one module of a project in place. pytype resolves the module's imports
+    against the stubs of the modules already converted, and writes the module's own
+    stub to `task.stub_path` if it is set.
+    """
+    import libcst as cst
+    from .convert import find_type_queries, get_relative_dots
+
+    source = read_source(task.path)
+
+    def cache_key() -> str:
+        return cache.key(source, get_relative_dots(task.path, directory),
+                         task.stub_key + converter.cache_tag + converter.fallback_tag(task.path))
+
+    code = None
+    if cache is not None:
+        with instrument.stage('cache'):
+            key = cache_key()
+            code = cache.get(key)
+    cached = code is not None
+    if cached and task.stub_path is None:
+        write_target(task.path, code)
+        return ConvertResult(task.path, True, None, shims=referenced_shims(code))
+
+    text = decode_source(source)
+    with instrument.stage('parse'):
+        wrapper = cst.MetadataWrapper(cst.parse_module(text))
+    with instrument.stage('type_queries'):
+        queries = find_type_queries(wrapper)
+    interface = None
+    inference_skipped = False
+    n_fallbacks = converter.n_fallbacks
+    if task.stub_path is not None:
+        types, stub = converter.get_type_index_and_stub(text, queries.positions, task.path, task.module_name)
+        if stub is not None:
+            interface = write_stub(task.stub_path, stub)
+        elif os.path.exists(task.stub_path):
+            # 没有 stub 的模块，依赖它的模块看到的就是一个找不到的 import
+            os.unlink(task.stub_path)
+    elif converter.needs_type_inference(queries):
+        types = converter.get_type_index(text, queries.positions, task.path, task.module_name)
+    else:
+        types = TypeIndex()
+        inference_skipped = True
+
+    if not cached:
+        code = converter.rewrite(text, task.path, types, wrapper, directory)
+        if cache is not None:
+            with instrument.stage('cache'):
+                if converter.n_fallbacks > n_fallbacks:
+                    key = cache_key()
+                cache.put(key, code)
+    write_target(task.path, code)
+    result = ConvertResult(task.path, cached, None, inference_skipped, interface, shims=referenced_shims(code))
+    return with_fixer_stats(with_fallback(result, converter, n_fallbacks), converter)
+
+
+def _convert_project_worker(task: ProjectTask, directory: str, cache: Optional[ConversionCache],
+                            instrumentation: Optional[instrument.Instrumentation] = None) -> ConvertResult:
+    return recorded(instrumentation, task.path, _convert_project_task, task, directory, cache)
+
+
+def _convert_project_task(task: ProjectTask, directory: str, cache: Optional[ConversionCache]) -> ConvertResult:
+    try:
+        return convert_project_module(task, directory, cache, _worker_converter)
+    except Exception:
+        if task.stub_path is not None and os.path.exists(task.stub_path):
+            os.unlink(task.stub_path)
+        return ConvertResult(task.path, False, traceback.format_exc())
+
+
+def convert_project(directory: str, io_paths: List[str], jobs: int, cache: Optional[ConversionCache],
+                    stub_cache: StubCache, prefilter: bool, fixers: Optional[Sequence[str]] = None,
+                    fixer_stats: Optional[Dict[str, Dict[str, int]]] = None,
+                    instrumentation: Optional[instrument.Instrumentation] = None,
+                    file_stats: Optional[List[Dict[str, Any]]] = None, limits=None,
+                    skipped_fallbacks: Optional[Mapping[str, str]] = None,
+                    fallbacks: Optional[List[Tuple[str, str]]] = None, strip_typing: bool = False,
+                    shims: Optional[Set[str]] = None) -> Tuple[List[str], int, int]:
+    """
+    Converts the modules of `directory` in dependency order, so that every module is
+    analyzed by pytype once and its dependents reuse its `.pyi` stub.
+    """
+    graph = ModuleGraph(directory, io_paths)
+    dependents = graph.dependents()
+    stub_cache.prune(graph.paths)
+
+    def tasks_of(level: List[str]) -> List[ProjectTask]:
+        tasks = []
+        for module_name in level:
+            path = graph.paths[module_name]
+            stub_key = stub_cache.key(module_name, graph.sources[module_name], graph.dependencies[module_name])
+            stub_path = stub_cache.stub_path(module_name, is_package_path(path))
+            if not dependents[module_name] or stub_cache.is_fresh(module_name, stub_key, stub_path):
+                stub_path = None
+            tasks.append(ProjectTask(path, module_name, stub_key, stub_path))
+        return tasks
+
+    def run_level(run_map, level: List[str]) -> List[ConvertResult]:
+        tasks = tasks_of(level)
+        results = list(run_map(_convert_project_worker, tasks, itertools.repeat(directory), itertools.repeat(cache),
+                               itertools.repeat(instrumentation)))
+        for task, result in zip(tasks, results):
+            if task.stub_path is not None or result.error is not None:
+                stub_cache.update(task.module_name, task.stub_key, result.interface)
+        return results
+
+    worker_init_args = (directory, prefilter, stub_cache.directory, fixers, fixer_stats is not None, True,
+                        limits, skipped_fallbacks, 'pytype', None, strip_typing)
+    results = []
+    if jobs <= 1 or len(io_paths) <= 1:
+        _init_convert_all_worker(*worker_init_args)
+        for level in graph.levels():
+            results.extend(run_level(map, level))
+    else:
+        import concurrent.futures
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=_init_convert_all_worker,
+                                                    initargs=worker_init_args) as executor:
+            for level in graph.levels():
+                results.extend(run_level(executor.map, level))
+    stub_cache.save()
+
+    # 按 walk 的顺序报告
+    order = {path: i for i, path in enumerate(io_paths)}
+    results.sort(key=lambda result: order[result.path])
+    return report_results(results, fixer_stats, file_stats, fallbacks, shims)
+
+
+def get_cache(args) -> Optional[ConversionCache]:
+    if args.no_cache:
+        return None
+    return ConversionCache(args.cache_dir or default_cache_dir(), args.cache_size * 1024 * 1024)
+
+
+def convert_all(args):
+    if args.project and args.no_infer:
+        sys.stderr.write('py3to2: --project needs type inference, it cannot be used with --no-infer\n')
+        return 2
+    if args.project and args.output_archive is not None:
+        sys.stderr.write('py3to2: --project converts in place, it cannot be used with --output-archive\n')
+        return 2
+    if args.project and args.resolver != 'pytype':
+        sys.stderr.write('py3to2: --project resolves imports through pytype stubs, '
+                         'it cannot be used with --resolver=%s\n' % args.resolver)
+        return 2
+    directory = args.directory
+    jobs = args.jobs or os.cpu_count() or 1
+    cache = get_cache(args)
+
+    fixers = get_fixer_names(args)
+    fixer_stats = {} if args.fixer_stats else None
+    instrumentation, file_stats = get_instrumentation(args)
+    limits, registry, skipped_fallbacks = get_inference_limits(args)
+    fallbacks = []
+    # --strip-typing 时只写转换结果 import 的 shim
+    shims = set() if args.strip_typing else None
+
+    archive = None
+    if args.output_archive is not None:
+        from .archive import ArchiveWriter
+
+        try:
+            archive_package(directory)
+            archive = ArchiveWriter(args.output_archive)
+        except ValueError as e:
+            sys.stderr.write('py3to2: %s\n' % e)
+            return 2
+        # 目录本身不修改；之前 initialize 过的 shim 由 write_archive 重新写
+        archive_paths = {os.path.realpath(archive.path), os.path.realpath(archive.tmp_path)}
+        plan = plan_tree(directory, args.output_archive)
+        io_paths = [os.path.join(directory, path) for path in plan.python_files if path not in SHIM_NAMES]
+        other_files = [path for path in plan.other_files
+                       if os.path.realpath(os.path.join(directory, path)) not in archive_paths]
+        io_paths.sort(key=lambda path: os.path.relpath(path, directory).replace(os.sep, '/'))
+    else:
+        io_paths = list(iter_python_files(directory))
+    worker_args = (io_paths, itertools.repeat(directory), itertools.repeat(cache), itertools.repeat(instrumentation))
+    worker_init_args = (directory, not args.always_infer, None, fixers, args.fixer_stats, not args.no_infer,
+                        limits, skipped_fallbacks, args.resolver, get_class_index(args, directory, io_paths),
+                        args.strip_typing)
+    if archive is not None:
+        results = map_workers(_convert_archive_worker, worker_args, len(io_paths), jobs, worker_init_args)
+        results = write_archive(archive, directory, [os.path.relpath(path, directory) for path in io_paths],
+                                other_files, results, all_shims=not args.strip_typing)
+        failures, n_cached, n_skipped = report_results(results, fixer_stats, file_stats, fallbacks)
+    elif args.project:
+        stub_cache = StubCache(args.stub_dir or default_stub_dir(args.cache_dir or default_cache_dir(), directory))
+        failures, n_cached, n_skipped = convert_project(directory, io_paths, jobs, cache, stub_cache,
+                                                        not args.always_infer, fixers, fixer_stats,
+                                                        instrumentation, file_stats, limits, skipped_fallbacks,
+                                                        fallbacks, args.strip_typing, shims)
+    else:
+        results = map_workers(_convert_all_worker, worker_args, len(io_paths), jobs, worker_init_args)
+        failures, n_cached, n_skipped = report_results(results, fixer_stats, file_stats, fallbacks, shims)
+
+    if archive is None:
+        initialize_directory(directory, SHIM_NAMES if shims is None else sorted(shims))
+    if cache is not None:
+        cache.evict()
+
+    sys.stderr.write('py3to2: converted %d file(s) (%d from cache, %d without type inference), %d failed\n' % (
+        len(io_paths) - len(failures), n_cached, n_skipped, len(failures)))
+    if archive is not None:
+        if failures:
+            sys.stderr.write('py3to2: %s not written\n' % args.output_archive)
+        else:
+            sys.stderr.write('py3to2: wrote %d entries to %s\n' % (len(archive.names), args.output_archive))
+    for io_path in failures:
+        sys.stderr.write('  failed: %s\n' % io_path)
+    save_fallbacks(registry, limits, skipped_fallbacks, fallbacks)
+    if fixer_stats is not None:
+        write_fixer_stats(fixer_stats, len(io_paths) - len(failures) - n_cached)
+    if file_stats is not None:
+        write_file_stats(file_stats, args.stats, args.top, args.profile)
+    return 1 if failures else 0
+
+
+def convert_tree(args):
+    source_directory = args.source
+    target_directory = args.destination
+    if not os.path.isdir(source_directory):
+        sys.stderr.write('py3to2: %s is not a directory\n' % source_directory)
+        return 2
+    jobs = args.jobs or os.cpu_count() or 1
+    cache = get_cache(args)
+
+    fixers = get_fixer_names(args)
+    fixer_stats = {} if args.fixer_stats else None
+    instrumentation, file_stats = get_instrumentation(args)
+    limits, registry, skipped_fallbacks = get_inference_limits(args)
+    fallbacks = []
+
+    plan = plan_tree(source_directory, target_directory)
+    n_pruned = prune_files(target_directory, plan.stale_files)
+    n_mirrored = 0
+    for path in plan.other_files:
+        n_mirrored += mirror_file(os.path.join(source_directory, path), os.path.join(target_directory, path),
+                                  link=not args.copy)
+
+    # 转换结果按 DST 里的位置计算相对 import 的层数
+    paths = [(os.path.join(source_directory, path), os.path.join(target_directory, path))
+             for path in plan.python_files]
+    for folder in sorted({os.path.dirname(target_path) for _, target_path in paths}):
+        os.makedirs(folder, exist_ok=True)
+    unchanged = []
+
+    def count_unchanged(results: Iterable[ConvertResult]) -> Iterator[ConvertResult]:
+        for result in results:
+            if result.written is False:
+                unchanged.append(result.path)
+            yield result
+
+    worker_args = (paths, itertools.repeat(target_directory), itertools.repeat(cache),
+                   itertools.repeat(instrumentation))
+    # 类的索引从 SRC 建，模块名和 DST 里的一样
+    class_index = get_class_index(args, source_directory,
+                                  [os.path.join(source_directory, path) for path in plan.python_files])
+    worker_init_args = (target_directory, not args.always_infer, None, fixers, args.fixer_stats, not args.no_infer,
+                        limits, skipped_fallbacks, args.resolver, class_index, args.strip_typing)
+    results = map_workers(_convert_tree_worker, worker_args, len(paths), jobs, worker_init_args)
+    shims = set() if args.strip_typing else None
+    failures, n_cached, n_skipped = report_results(count_unchanged(results), fixer_stats, file_stats, fallbacks,
+                                                   shims)
+
+    if shims is None:
+        initialize_directory(target_directory)
+    else:
+        initialize_directory(target_directory, sorted(shims))
+        # 转换失败的文件还是旧的，可能还 import 着 shim
+        if not failures:
+            n_pruned += prune_files(target_directory, [name for name in SHIM_NAMES if name not in shims])
+    if cache is not None:
+        cache.evict()
+
+    sys.stderr.write('py3to2: converted %d file(s) (%d from cache, %d without type inference, %d unchanged), '
+                     '%d failed\n' % (len(paths) - len(failures), n_cached, n_skipped, len(unchanged), len(failures)))
+    sys.stderr.write('py3to2: mirrored %d other file(s) (%d unchanged), pruned %d\n' % (
+        len(plan.other_files), len(plan.other_files) - n_mirrored, n_pruned))
+    for path in failures:
+        sys.stderr.write('  failed: %s\n' % path)
+    # 记录的是 DST 里的路径，和 Converter 看到的一样
+    target_paths = dict(paths)
+    save_fallbacks(registry, limits, skipped_fallbacks,
+                   [(target_paths[path], reason) for path, reason in fallbacks])
+    if fixer_stats is not None:
+        write_fixer_stats(fixer_stats, len(paths) - len(failures) - n_cached)
+    if file_stats is not None:
+        write_file_stats(file_stats, args.stats, args.top, args.profile)
+    return 1 if failures else 0
+
+
+def watch(args):
+    from .convert import Converter
+    from .tree import snapshot_tree
+    from .watch import Watcher
+
+    source_directory = args.source
+    target_directory = args.destination
+    if not os.path.isdir(source_directory):
+        sys.stderr.write('py3to2: %s is not a directory\n' % source_directory)
+        return 2
+    # 在第一遍转换之前取 snapshot，转换的时候改了的文件之后会再转换一次
+    snapshot = snapshot_tree(source_directory, target_directory)
+    convert_tree(args)
+
+    limits, _, skipped_fallbacks = get_inference_limits(args)
+    python_paths = [os.path.join(source_directory, path) for path in snapshot if path.endswith('.py')]
+    converter = Converter(target_directory, prefilter=not args.always_infer, fixers=get_fixer_names(args),
+                          infer=not args.no_infer, limits=limits, fallbacks=skipped_fallbacks,
+                          resolver=args.resolver, class_index=get_class_index(args, source_directory, python_paths),
+                          strip_typing=args.strip_typing)
+    converter.warm_up()
+    watcher = Watcher(source_directory, target_directory, converter, get_cache(args), link=not args.copy,
+                      interval=args.interval, debounce=args.debounce, poll=args.poll)
+    sys.stderr.write('py3to2: watching %s\n' % source_directory)
+    try:
+        watcher.run(snapshot)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def check(args):
+    from .tree import check_tree
+
+    if not os.path.isdir(args.source):
+        sys.stderr.write('py3to2: %s is not a directory\n' % args.source)
+        return 2
+    report = check_tree(args.source, args.destination)
+    for path, reason in report.stale:
+        sys.stdout.write('stale: %s (%s)\n' % (path, reason))
+    for path in report.missing:
+        sys.stdout.write('missing: %s\n' % path)
+    for path in report.orphaned:
+        sys.stdout.write('orphaned: %s\n' % path)
+    n_problems = len(report.stale) + len(report.missing) + len(report.orphaned)
+    sys.stderr.write('py3to2: checked %d file(s): %d stale, %d missing, %d orphaned\n' % (
+        report.n_checked, len(report.stale), len(report.missing), len(report.orphaned)))
+    return 1 if n_problems else 0
+
+
+def get_class_index(args, directory: str, paths: Sequence[str]):
+    """
+    The `ClassIndex` of `directory` for --resolver=syntactic, built once here rather
+    than in every worker. None otherwise.
+    """
+    if args.resolver != 'syntactic' or args.no_infer:
+        return None
+    from .resolver import ClassIndex
+    return ClassIndex.build(directory, paths)
+
+
+def get_inference_limits(args):
+    """
+    Returns the `InferenceLimits` of --timeout / --max-memory (None without them), the
+    registry of the files that went over them and the files to convert without type
+    inference right away.
+    """
+    if args.timeout is None and args.max_memory is None:
+        return None, None, {}
+    from .inference import FallbackRegistry, InferenceLimits
+
+    limits = InferenceLimits(args.timeout, args.max_memory * 1024 * 1024 if args.max_memory is not None else None)
+    registry = FallbackRegistry(os.path.join(args.cache_dir or default_cache_dir(), 'fallbacks.json'))
+    skipped_fallbacks = {} if args.retry_fallbacks else registry.skipped(limits)
+    return limits, registry, skipped_fallbacks
+
+
+def save_fallbacks(registry, limits, skipped_fallbacks: Mapping[str, str], fallbacks: List[Tuple[str, str]]):
+    if not fallbacks:
+        return
+    sys.stderr.write('py3to2: %d file(s) converted without type information, their inference went over '
+                     '--timeout / --max-memory\n' % len(fallbacks))
+    # 这次直接跳过的文件不用再记录
+    new_fallbacks = [(path, reason) for path, reason in fallbacks if os.path.abspath(path) not in skipped_fallbacks]
+    if registry is not None and new_fallbacks:
+        for path, reason in new_fallbacks:
+            registry.record(path, reason, limits)
+        registry.save()
+
+
+def get_instrumentation(args) -> Tuple[Optional[instrument.Instrumentation], Optional[List[Dict[str, Any]]]]:
+    if args.stats or args.profile:
+        return instrument.Instrumentation(args.profile), []
+    return None, None
+
+
+def report_results(results: Iterable[ConvertResult],
+                   fixer_stats: Optional[Dict[str, Dict[str, int]]] = None,
+                   file_stats: Optional[List[Dict[str, Any]]] = None,
+                   fallbacks: Optional[List[Tuple[str, str]]] = None,
+                   shims: Optional[Set[str]] = None) -> Tuple[List[str], int, int]:
+    failures = []
+    n_cached = 0
+    n_skipped = 0
+    for result in results:
+        if result.error is not None:
+            sys.stderr.write('py3to2: error converting %s\n%s' % (result.path, result.error))
+            failures.append(result.path)
+        elif result.cached:
+            n_cached += 1
+        elif result.inference_skipped:
+            n_skipped += 1
+        if fixer_stats is not None and result.fixers_run is not None:
+            for name in result.fixers_run:
+                fixer_stats.setdefault(name, {'run': 0, 'changed': 0})['run'] += 1
+            for name in result.fixers_changed:
+                fixer_stats.setdefault(name, {'run': 0, 'changed': 0})['changed'] += 1
+        if file_stats is not None and result.stats is not None:
+            # 报告里只保留异常的最后一行
+            error = result.error.strip().splitlines()[-1] if result.error else None
+            file_stats.append(dict(result.stats, cached=result.cached, error=error))
+        if fallbacks is not None and result.fallback is not None:
+            fallbacks.append((result.path, result.fallback))
+        if shims is not None:
+            shims.update(result.shims)
+    return failures, n_cached, n_skipped
+
+
+def write_fixer_stats(fixer_stats: Mapping[str, Mapping[str, int]], n_files: int):
+    sys.stderr.write('py3to2: lib3to2 fixers over %d converted file(s)\n' % n_files)
+    sys.stderr.write('  %-20s %8s %8s\n' % ('fixer', 'run', 'changed'))
+    for name in sorted(fixer_stats, key=lambda name: (-fixer_stats[name]['changed'], -fixer_stats[name]['run'], name)):
+        sys.stderr.write('  %-20s %8d %8d\n' % (name, fixer_stats[name]['run'], fixer_stats[name]['changed']))
+
+
+def write_file_stats(file_stats: List[Dict[str, Any]], stats_path: Optional[str], top: int,
+                     profile_directory: Optional[str]):
+    if profile_directory is not None:
+        instrument.prune_profiles(file_stats, top)
+    if stats_path is not None:
+        instrument.write_stats(stats_path, file_stats)
+    sys.stderr.write('py3to2: ' + instrument.format_slowest(file_stats, top))
+    if profile_directory is not None:
+        sys.stderr.write('py3to2: cProfile data of the %d slowest file(s) in %s\n' % (
+            min(top, len(file_stats)), profile_directory))
+
+
+def fixer_list(value: str) -> List[str]:
+    from .convert import get_lib3to2_fixers
+    from .fixers import resolve_fixer_names
+
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    try:
+        resolve_fixer_names(names, get_lib3to2_fixers())
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return names
+
+
+def get_fixer_names(args) -> List[str]:
+    from .convert import select_lib3to2_fixers
+
+    return select_lib3to2_fixers(args.fixers, args.skip_fixers or ())
+
+
+def add_fixer_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--fixers', type=fixer_list, default=None,
+                        help='comma-separated lib3to2 fixers to run, e.g. str,bytes (default: all)')
+    parser.add_argument('--skip-fixers', type=fixer_list, default=None,
+                        help='comma-separated lib3to2 fixers not to run')
+    parser.add_argument('--fixer-stats', action='store_true',
+                        help='report how many files each lib3to2 fixer ran on and changed')
+
+
+def add_resolver_argument(parser: argparse.ArgumentParser):
+    parser.add_argument('--resolver', choices=('pytype', 'syntactic'), default='pytype',
+                        help='how to tell which subscripts are over a class: pytype inference, or the '
+                             'bindings of the names and the classes of the directory (default: pytype)')
+
+
+def add_strip_typing_argument(parser: argparse.ArgumentParser):
+    parser.add_argument('--strip-typing', action='store_true',
+                        help='also remove cast(), TypeVar and @overload declarations, if TYPE_CHECKING: blocks '
+                             'and the typing imports left unused, and only write the typing shims that are imported')
+
+
+def add_batch_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes (default: cpu count)')
+    parser.add_argument('--cache-dir', type=str, default=None,
+                        help='directory of the conversion cache (default: ~/.cache/py3to2)')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_MAX_SIZE // (1024 * 1024),
+                        help='maximum size of the conversion cache in MiB')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='do not read or write the conversion cache')
+    inference = parser.add_mutually_exclusive_group()
+    inference.add_argument('--always-infer', action='store_true',
+                           help='run pytype on every file with subscripts or class bases, '
+                                'not only those the pre-filter selects')
+    inference.add_argument('--no-infer', action='store_true',
+                           help='never run pytype; generic subscripts are kept as written')
+    add_resolver_argument(parser)
+    add_strip_typing_argument(parser)
+    parser.add_argument('--timeout', type=float, default=None, metavar='SECONDS',
+                        help='limit the type inference of each file; a file over it is converted without '
+                             'type information, and so are later runs until the limit is raised')
+    parser.add_argument('--max-memory', type=int, default=None, metavar='MIB',
+                        help='limit the RSS of the type inference process (Linux), like --timeout')
+    parser.add_argument('--retry-fallbacks', action='store_true',
+                        help='retry the type inference of the files that went over the limits in earlier runs')
+    parser.add_argument('--stats', type=str, default=None, metavar='FILE',
+                        help='write per-file, per-stage timings, peak RSS and I/O to FILE '
+                             '(CSV if it ends with .csv, JSON otherwise)')
+    parser.add_argument('--profile', type=str, default=None, metavar='DIR',
+                        help='convert every file under cProfile and keep the profiles of the '
+                             '--top slowest files in DIR')
+    parser.add_argument('--top', type=int, default=10,
+                        help='number of slowest files to report with --stats / --profile (default: 10)')
+    add_fixer_arguments(parser)
 
-    initialize_directory(directory)
-    
 
 def write_base64(base64_str, target_path):
     decoded = base64.standard_b64decode(base64_str)
-    with open(target_path, 'wb') as f:
-        f.write(decoded)
+    write_if_changed(target_path, decoded)
 
 
 def initialize(args):
@@ -51,6 +843,20 @@ def initialize(args):
     initialize_directory(target_dir)
 
 
+def serve(args):
+    from .convert import Converter
+    from .serve import serve_forever
+
+    class_index = None
+    if args.resolver == 'syntactic':
+        from .resolver import ClassIndex
+        # 每个请求换成它的 module directory 的索引，见 serve.ClassIndexes
+        class_index = ClassIndex()
+    converter = Converter(prefilter=not args.always_infer, fixers=get_fixer_names(args), infer=not args.no_infer,
+                          resolver=args.resolver, class_index=class_index, strip_typing=args.strip_typing)
+    serve_forever(converter, sys.stdin, sys.stdout)
+
+
 def main():
     parser = argparse.ArgumentParser('py3to2')
     subparsers = parser.add_subparsers(required=True)
@@ -59,16 +865,74 @@ def main():
     parser_convert.add_argument('module-directory', type=str)
     parser_convert.add_argument('source', type=str)
     parser_convert.add_argument('output', type=str)
+    parser_convert.add_argument('--no-infer', action='store_true',
+                                help='never run pytype; generic subscripts are kept as written')
+    add_resolver_argument(parser_convert)
+    add_strip_typing_argument(parser_convert)
+    add_fixer_arguments(parser_convert)
     parser_convert.set_defaults(func=convert)
     
     parser_convert_all = subparsers.add_parser('convert-all')
     parser_convert_all.add_argument('directory', type=str)
+    add_batch_arguments(parser_convert_all)
+    parser_convert_all.add_argument('--project', action='store_true',
+                                    help='analyze modules in import order, resolving imports through cached .pyi stubs')
+    parser_convert_all.add_argument('--stub-dir', type=str, default=None,
+                                    help='directory of the .pyi stubs of --project (default: under the cache directory)')
+    parser_convert_all.add_argument('--output-archive', type=str, default=None, metavar='ARCHIVE',
+                                    help='write the converted directory, with the typing shims, to this zip '
+                                         '(or NAME-VERSION-py2-none-any.whl wheel) instead of converting in place')
     parser_convert_all.set_defaults(func=convert_all)
+
+    parser_convert_tree = subparsers.add_parser('convert-tree', help='convert SOURCE into DESTINATION, '
+                                                'mirroring the other files and pruning deleted ones')
+    parser_convert_tree.add_argument('source', type=str)
+    parser_convert_tree.add_argument('destination', type=str)
+    add_batch_arguments(parser_convert_tree)
+    parser_convert_tree.add_argument('--copy', action='store_true',
+                                     help='copy the files that are not converted instead of hardlinking them')
+    parser_convert_tree.set_defaults(func=convert_tree)
     
+    parser_watch = subparsers.add_parser('watch', help='convert SOURCE into DESTINATION like convert-tree, '
+                                         'then reconvert the files that change')
+    parser_watch.add_argument('source', type=str)
+    parser_watch.add_argument('destination', type=str)
+    add_batch_arguments(parser_watch)
+    parser_watch.add_argument('--copy', action='store_true',
+                              help='copy the files that are not converted instead of hardlinking them')
+    parser_watch.add_argument('--debounce', type=float, default=0.1, metavar='SECONDS',
+                              help='wait until SOURCE has not changed for this long before converting (default: 0.1)')
+    parser_watch.add_argument('--poll', action='store_true',
+                              help='poll SOURCE instead of using inotify')
+    parser_watch.add_argument('--interval', type=float, default=0.25, metavar='SECONDS',
+                              help='polling interval, without inotify (default: 0.25)')
+    parser_watch.set_defaults(func=watch)
+
+    parser_check = subparsers.add_parser('check', help='report the files of DESTINATION that are stale, missing '
+                                         'or orphaned with respect to SOURCE, without converting anything')
+    parser_check.add_argument('source', type=str)
+    parser_check.add_argument('destination', type=str)
+    parser_check.set_defaults(func=check)
+
+    parser_serve = subparsers.add_parser('serve', help='convert the JSON-lines requests read from stdin')
+    inference_serve = parser_serve.add_mutually_exclusive_group()
+    inference_serve.add_argument('--always-infer', action='store_true',
+                                 help='run pytype on every file with subscripts or class bases')
+    inference_serve.add_argument('--no-infer', action='store_true',
+                                 help='never run pytype; generic subscripts are kept as written')
+    parser_serve.add_argument('--persistent_worker', action='store_true',
+                              help='accepted for Bazel persistent workers; requests are always read from stdin')
+    add_resolver_argument(parser_serve)
+    add_strip_typing_argument(parser_serve)
+    add_fixer_arguments(parser_serve)
+    parser_serve.set_defaults(func=serve)
+
     parser_initialize = subparsers.add_parser('initialize')
     parser_initialize.set_defaults(func=initialize)
     parser_initialize.add_argument('directory', type=str)
 
     args = parser.parse_args()
-    args.func(args)
+    ret = args.func(args)
+    if ret:
+        sys.exit(ret)
 
@@ -0,0 +1,202 @@
+from typing import *
+import ast
+import hashlib
+import json
+import os
+
+from .cache import tool_versions, write_atomic
+
+
+# ==========================================
+# 目录内的 import graph
+
+def get_module_name(path: str, directory: str) -> str:
+    relpath = os.path.relpath(os.path.abspath(path), os.path.abspath(directory))
+    parts = relpath.replace('\\', '/').split('/')
+    parts[-1] = parts[-1][:-len('.py')]
+    if parts[-1] == '__init__':
+        parts.pop()
+    return '.'.join(parts)
+
+
+def is_package_path(path: str) -> bool:
+    return os.path.basename(path) == '__init__.py'
+
+
+def find_imports(source: bytes, module_name: str, is_package: bool) -> Set[str]:
+    """
+    Returns the absolute names of every module `source` may import, including the
+    parents of dotted names and `from X import Y` as both `X` and `X.Y`.
+    """
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return set()
+
+    package = module_name if is_package else module_name.rpartition('.')[0]
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                names.add(alias.name)
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                parts = package.split('.') if package else []
+                if node.level - 1 > len(parts):
+                    continue
+                base = parts[:len(parts) - (node.level - 1)]
+                if node.module:
+                    base.append(node.module)
+                base_name = '.'.join(base)
+            else:
+                base_name = node.module or ''
+            if base_name:
+                names.add(base_name)
+            for alias in node.names:
+                if alias.name != '*':
+                    names.add(base_name + '.' + alias.name if base_name else alias.name)
+
+    imports = set()
+    for name in names:
+        parts = name.split('.')
+        for i in range(1, len(parts) + 1):
+            imports.add('.'.join(parts[:i]))
+    return imports
+
+
+class ModuleGraph:
+    """
+    The modules under `directory`, keyed by dotted name, and the project modules each
+    one imports. The directory itself is the import root.
+    """
+
+    def __init__(self, directory: str, paths: Iterable[str]):
+        self.directory = directory
+        self.paths: Dict[str, str] = {}
+        self.sources: Dict[str, bytes] = {}
+        for path in paths:
+            self.paths[get_module_name(path, directory)] = path
+
+        self.dependencies: Dict[str, Set[str]] = {}
+        for module_name, path in self.paths.items():
+            with open(path, 'rb') as f:
+                source = f.read()
+            self.sources[module_name] = source
+            imports = find_imports(source, module_name, is_package_path(path))
+            self.dependencies[module_name] = {
+                name for name in imports if name in self.paths and name != module_name
+            }
+
+    def dependents(self) -> Dict[str, Set[str]]:
+        dependents: Dict[str, Set[str]] = {module_name: set() for module_name in self.paths}
+        for module_name, dependencies in self.dependencies.items():
+            for dependency in dependencies:
+                dependents[dependency].add(module_name)
+        return dependents
+
+    def levels(self) -> List[List[str]]:
+        """
+        Groups the modules so that every module comes after the modules it imports.
+        Modules in the same group do not depend on each other. Import cycles are broken
+        by taking the modules with the fewest unresolved imports first.
+        """
+        remaining = {module_name: set(dependencies) for module_name, dependencies in self.dependencies.items()}
+        levels = []
+        while remaining:
+            ready = sorted(module_name for module_name, dependencies in remaining.items() if not dependencies)
+            if not ready:
+                fewest = min(len(dependencies) for dependencies in remaining.values())
+                ready = sorted(module_name for module_name, dependencies in remaining.items()
+                               if len(dependencies) == fewest)
+            for module_name in ready:
+                del remaining[module_name]
+            for dependencies in remaining.values():
+                dependencies.difference_update(ready)
+            levels.append(ready)
+        return levels
+
+
+# ==========================================
+# 缓存 pytype 生成的 .pyi
+
+class StubCache:
+    """
+    `.pyi` stubs of the modules of one project, laid out as a pythonpath entry for
+    pytype. A stub is keyed on the source of its module and on the interface (stub
+    hash) of every project module it imports, so a module is only re-stubbed when it
+    changed or when the interface of one of its imports changed.
+    """
+
+    MANIFEST = 'manifest.json'
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._manifest_path = os.path.join(directory, StubCache.MANIFEST)
+        try:
+            with open(self._manifest_path, 'r', encoding='utf8') as f:
+                self.manifest: Dict[str, Dict[str, str]] = json.load(f)
+        except (OSError, ValueError):
+            self.manifest = {}
+
+    def stub_path(self, module_name: str, is_package: bool) -> str:
+        parts = module_name.split('.')
+        if is_package:
+            parts.append('__init__')
+        return os.path.join(self.directory, *parts) + '.pyi'
+
+    def key(self, module_name: str, source: bytes, dependencies: Iterable[str]) -> str:
+        h = hashlib.sha256()
+        for name, version in tool_versions():
+            h.update(('%s=%s\n' % (name, version)).encode('utf8'))
+        h.update(('module=%s\n' % module_name).encode('utf8'))
+        for dependency in sorted(dependencies):
+            h.update(('%s=%s\n' % (dependency, self.interface(dependency))).encode('utf8'))
+        h.update(source)
+        return h.hexdigest()
+
+    def interface(self, module_name: str) -> str:
+        return self.manifest.get(module_name, {}).get('interface', '')
+
+    def is_fresh(self, module_name: str, key: str, stub_path: str) -> bool:
+        return self.manifest.get(module_name, {}).get('key') == key and os.path.exists(stub_path)
+
+    def update(self, module_name: str, key: Optional[str], interface: Optional[str]):
+        if interface is None:
+            self.manifest.pop(module_name, None)
+        else:
+            self.manifest[module_name] = {'key': key, 'interface': interface}
+
+    def prune(self, module_names: Iterable[str]):
+        """
+        Forgets the modules not in `module_names` and removes their stubs.
+        """
+        module_names = set(module_names)
+        for module_name in list(self.manifest):
+            if module_name not in module_names:
+                del self.manifest[module_name]
+        for folder, _, files in os.walk(self.directory):
+            for file in files:
+                if not file.endswith('.pyi'):
+                    continue
+                path = os.path.join(folder, file)
+                module_name = get_module_name(path[:-len('.pyi')] + '.py', self.directory)
+                if module_name not in module_names:
+                    os.unlink(path)
+
+    def save(self):
+        write_atomic(self._manifest_path, json.dumps(self.manifest, indent=1, sort_keys=True).encode('utf8'))
+
+
+def default_stub_dir(cache_dir: str, directory: str) -> str:
+    project = hashlib.sha256(os.path.abspath(directory).encode('utf8')).hexdigest()[:16]
+    return os.path.join(cache_dir, 'stubs', project)
+
+
+def write_stub(stub_path: str, stub: str) -> str:
+    """
+    Writes `stub` to `stub_path` and returns its interface hash.
+    """
+    data = stub.encode('utf8')
+    write_atomic(stub_path, data)
+    return hashlib.sha256(data).hexdigest()
+
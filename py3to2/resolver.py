@@ -0,0 +1,293 @@
+from typing import *
+import ast
+import builtins
+import contextlib
+import hashlib
+import os
+
+import libcst as cst
+import libcst.metadata as cstmeta
+
+from .project import get_module_name, is_package_path
+from .type_index import CodePosition, TypeIndex, TypeTag, intern_type_tag
+
+
+# ==========================================
+# --resolver=syntactic: 不跑 pytype，只根据名字的绑定判断下标是不是在类上
+#
+# `RemoveTypehint` only asks one question of the type map: is the expression at this
+# position a class (`type[X]`), and is that class `typing.Generic`? A name can answer
+# it without inference when it is bound to a `class` statement, to a builtin class,
+# to a name of `typing` / `typing_extensions`, or is imported from a module of the
+# directory that defines (or re-exports) a class under that name. Everything else,
+# such as the subscript of a variable or of a call, is left without a tag, so the
+# subscript is kept as written.
+
+TYPING_MODULES = ('typing', 'typing_extensions')
+
+# 别名的链最多跟这么多层，防止循环的 re-export
+MAX_ALIAS_DEPTH = 16
+
+
+def resolve_relative_name(name: str, module_name: str, is_package: bool) -> Optional[str]:
+    """
+    Turns a name of `QualifiedNameProvider` such as `..mod.X` into an absolute name,
+    as seen from `module_name`. Returns None if it goes above the import root.
+    """
+    level = len(name) - len(name.lstrip('.'))
+    if not level:
+        return name
+    package = module_name if is_package else module_name.rpartition('.')[0]
+    parts = package.split('.') if package else []
+    if level - 1 > len(parts):
+        return None
+    base = parts[:len(parts) - (level - 1)]
+    rest = name[level:]
+    if rest:
+        base.append(rest)
+    return '.'.join(base) or None
+
+
+def _dotted_name(node: ast.AST) -> Optional[str]:
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        value = _dotted_name(node.value)
+        return None if value is None else value + '.' + node.attr
+    return None
+
+
+def scan_module(source: Union[str, bytes], module_name: str, is_package: bool
+                ) -> Tuple[Set[str], Dict[str, str]]:
+    """
+    Returns the classes a module defines at its top level (nested classes as
+    `Outer.Inner`) and its other top-level names that may stand for a class:
+    {name: absolute dotted name} for imports and for assignments of a dotted name.
+    """
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return set(), {}
+
+    classes: Set[str] = set()
+    aliases: Dict[str, str] = {}
+
+    def add_classes(body: Sequence[ast.stmt], prefix: str):
+        for node in body:
+            if isinstance(node, ast.ClassDef):
+                classes.add(prefix + node.name)
+                add_classes(node.body, prefix + node.name + '.')
+
+    add_classes(tree.body, '')
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.asname:
+                    aliases[alias.asname] = alias.name
+                else:
+                    head = alias.name.split('.')[0]
+                    aliases[head] = head
+        elif isinstance(node, ast.ImportFrom):
+            base = resolve_relative_name('.' * node.level + (node.module or ''), module_name, is_package)
+            if base is None:
+                continue
+            for alias in node.names:
+                if alias.name != '*':
+                    aliases[alias.asname or alias.name] = base + '.' + alias.name
+        elif isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            value = _dotted_name(node.value)
+            if value is not None:
+                aliases[node.targets[0].id] = module_name + '.' + value if module_name else value
+    # 同一个名字又被赋值成别的东西的话，就不算了
+    rebound = {target.id for node in tree.body if isinstance(node, (ast.Assign, ast.AnnAssign, ast.AugAssign))
+               for target in (node.targets if isinstance(node, ast.Assign) else [node.target])
+               if isinstance(target, ast.Name) and target.id not in aliases}
+    classes.difference_update(rebound)
+    return classes, aliases
+
+
+class ClassIndex:
+    """
+    The classes and the top-level imports and aliases of every module under a
+    directory, keyed by dotted module name (see `scan_module`). It is built with `ast`
+    alone and is cheap to pickle to the worker processes.
+    """
+
+    def __init__(self, modules: Optional[Dict[str, Tuple[Set[str], Dict[str, str]]]] = None):
+        self.modules: Dict[str, Tuple[Set[str], Dict[str, str]]] = dict(modules or {})
+        self._digest: Optional[str] = None
+
+    @classmethod
+    def build(cls, directory: str, paths: Optional[Iterable[str]] = None) -> 'ClassIndex':
+        if paths is None:
+            paths = [os.path.join(folder, file) for folder, _, files in os.walk(directory)
+                     for file in files if file.endswith('.py')]
+        index = cls()
+        for path in paths:
+            try:
+                with open(path, 'rb') as f:
+                    source = f.read()
+            except OSError:
+                continue
+            index.add(get_module_name(path, directory), source, is_package_path(path))
+        return index
+
+    def add(self, module_name: str, source: Union[str, bytes], is_package: bool):
+        self.modules[module_name] = scan_module(source, module_name, is_package)
+        self._digest = None
+
+    def remove(self, module_name: str):
+        self.modules.pop(module_name, None)
+        self._digest = None
+
+    @contextlib.contextmanager
+    def overlay(self, module_name: str, source: Union[str, bytes], is_package: bool) -> Iterator[None]:
+        """
+        Replaces the entry of `module_name` with a scan of `source` until exit. The
+        digest is left alone.
+        """
+        previous = self.modules.get(module_name)
+        digest = self._digest
+        self.modules[module_name] = scan_module(source, module_name, is_package)
+        try:
+            yield
+        finally:
+            if previous is None:
+                del self.modules[module_name]
+            else:
+                self.modules[module_name] = previous
+            self._digest = digest
+
+    def digest(self) -> str:
+        # 转换结果依赖于整个目录的类，缓存的 key 要包含它
+        if self._digest is None:
+            h = hashlib.sha1()
+            for module_name in sorted(self.modules):
+                classes, aliases = self.modules[module_name]
+                h.update(repr((module_name, sorted(classes), sorted(aliases.items()))).encode('utf8'))
+            self._digest = h.hexdigest()
+        return self._digest
+
+    def _split(self, name: str) -> Tuple[Optional[str], str]:
+        # 最长的、在索引里的模块前缀
+        parts = name.split('.')
+        for i in range(len(parts), 0, -1):
+            module_name = '.'.join(parts[:i])
+            if module_name in self.modules:
+                return module_name, '.'.join(parts[i:])
+        if '' in self.modules:
+            # 目录本身是一个包
+            return '', name
+        return None, name
+
+    def resolve_class(self, name: str, depth: int = 0) -> Optional[str]:
+        """
+        Returns the class the absolute dotted `name` stands for, as pytype names it
+        (`typing.Generic`, `builtins.list`, `pkg.a.Box`), or None if it is not a class
+        or cannot be told without inference.
+        """
+        if depth > MAX_ALIAS_DEPTH:
+            return None
+        head, _, rest = name.partition('.')
+        if head in TYPING_MODULES:
+            # typing 里大写开头的都是类或者 special form，pytype 都当作 type[...]
+            return 'typing.' + rest if rest and '.' not in rest and rest[:1].isupper() else None
+        if head == 'builtins':
+            return name if isinstance(getattr(builtins, rest, None), type) else None
+
+        module_name, attr = self._split(name)
+        if module_name is None or not attr:
+            return None
+        classes, aliases = self.modules[module_name]
+        if attr in classes:
+            return module_name + '.' + attr if module_name else attr
+        head, _, rest = attr.partition('.')
+        target = aliases.get(head)
+        if target is None or target == name:
+            return None
+        return self.resolve_class(target + '.' + rest if rest else target, depth + 1)
+
+
+class SyntacticResolver(cst.CSTVisitor):
+    """
+    Tags the expressions at `positions` that `ClassIndex` resolves to a class with
+    the `TypeTag` pytype would give them, `type[<class>]`. A subscripted class base
+    such as `Generic[T]` is tagged with the class of its value.
+    """
+
+    METADATA_DEPENDENCIES = (cstmeta.PositionProvider, cstmeta.QualifiedNameProvider, cstmeta.ScopeProvider)
+
+    def __init__(self, index: ClassIndex, module_name: str, is_package: bool,
+                 positions: Collection[CodePosition]):
+        super().__init__()
+        self._index = index
+        self._module_name = module_name
+        self._is_package = is_package
+        self._positions = positions
+        self.tags: Dict[CodePosition, TypeTag] = {}
+
+    def _position(self, node: cst.CSTNode) -> Optional[CodePosition]:
+        cst_position = self.get_metadata(cstmeta.PositionProvider, node, None)
+        if not cst_position:
+            return None
+        return CodePosition(cst_position.start.line, cst_position.start.column,
+                            cst_position.end.line, cst_position.end.column)
+
+    def _is_local_class(self, node: cst.Name) -> bool:
+        # 函数里定义的类不在索引里，看这个名字在作用域里的绑定
+        scope = self.get_metadata(cstmeta.ScopeProvider, node, None)
+        if scope is None:
+            return False
+        assignments = scope[node.value]
+        return bool(assignments) and all(
+            isinstance(assignment, cstmeta.Assignment) and isinstance(assignment.node, cst.ClassDef)
+            for assignment in assignments)
+
+    def class_of(self, node: cst.BaseExpression) -> Optional[str]:
+        if isinstance(node, cst.Subscript):
+            return self.class_of(node.value)
+        names = self.get_metadata(cstmeta.QualifiedNameProvider, node, set())
+        if len(names) != 1:
+            # 没有绑定，或者有好几个可能的绑定
+            return None
+        qualified_name, = names
+        name = qualified_name.name
+        if qualified_name.source == cstmeta.QualifiedNameSource.IMPORT:
+            name = resolve_relative_name(name, self._module_name, self._is_package)
+            return None if name is None else self._index.resolve_class(name)
+        if qualified_name.source == cstmeta.QualifiedNameSource.BUILTIN:
+            return self._index.resolve_class(name)
+        if '<locals>' in name:
+            if isinstance(node, cst.Name) and self._is_local_class(node):
+                return self._module_name + '.' + name if self._module_name else name
+            return None
+        return self._index.resolve_class(self._module_name + '.' + name if self._module_name else name)
+
+    def _tag(self, node: cst.BaseExpression):
+        position = self._position(node)
+        if position is None or position not in self._positions:
+            return
+        class_name = self.class_of(node)
+        if class_name is not None:
+            self.tags[position] = intern_type_tag(TypeTag('builtins.type', class_name))
+
+    def visit_Subscript(self, node: cst.Subscript):
+        self._tag(node.value)
+
+    def visit_ClassDef(self, node: cst.ClassDef):
+        for base in node.bases:
+            self._tag(base.value)
+
+
+def resolve_type_index(wrapper: cstmeta.MetadataWrapper, code: str, positions: Collection[CodePosition],
+                       index: ClassIndex, path: str, module_directory: str) -> TypeIndex:
+    """
+    The syntactic counterpart of `expression_type.get_type_index`. The module itself is
+    rescanned from `code`, which may be newer than the index.
+    """
+    module_name = get_module_name(path, module_directory)
+    is_package = is_package_path(path)
+    resolver = SyntacticResolver(index, module_name, is_package, frozenset(positions))
+    with index.overlay(module_name, code, is_package):
+        wrapper.visit(resolver)
+    return TypeIndex(resolver.tags.items())
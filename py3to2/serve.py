@@ -0,0 +1,187 @@
+from typing import *
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+import traceback
+
+from .convert import Converter
+from .main import decode_source, read_source, write_target
+from .project import get_module_name, is_package_path
+
+
+# ==========================================
+# py3to2 serve: 常驻进程，stdin/stdout 上一行一个 JSON
+#
+# Two request formats are accepted on the same stream:
+#
+# * {"id": ..., "module_directory": DIR, "source": PATH | "code": TEXT,
+#    "output": PATH, "path": PATH}
+#   answered with {"id": ..., "ok": bool, "output": PATH | "code": TEXT,
+#   "error": TEXT | null, "timings": {"read": s, "convert": s, "write": s, "total": s}}.
+#   "path" is where the module lives relative to DIR and defaults to "output" (or
+#   "source"); without "output" the converted code is returned inline.
+#
+# * a Bazel JSON work request, {"arguments": [...], "requestId": N}, whose arguments
+#   are those of `py3to2 convert`, answered with {"requestId": N, "exitCode": 0 | 1,
+#   "output": TEXT}.
+#
+# With --resolver=syntactic, each module directory named by a request gets its own
+# `ClassIndex`, brought up to date before every request from the mtimes and sizes of
+# its modules.
+
+
+class ServeError(Exception):
+    pass
+
+
+def create_work_request_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser('py3to2 convert', add_help=False, fromfile_prefix_chars='@')
+    parser.add_argument('module_directory', type=str)
+    parser.add_argument('source', type=str)
+    parser.add_argument('output', type=str)
+    return parser
+
+
+def parse_work_request_arguments(arguments: Any) -> argparse.Namespace:
+    if not isinstance(arguments, list) or not all(isinstance(argument, str) for argument in arguments):
+        raise ServeError('"arguments" must be a list of strings, not %r' % (arguments,))
+    parser = create_work_request_parser()
+
+    def error(message):
+        raise ServeError('invalid arguments %r: %s' % (arguments, message))
+    parser.error = error
+    return parser.parse_args(arguments)
+
+
+class ClassIndexes:
+    """
+    The `ClassIndex` of every module directory, for a converter with
+    `resolver='syntactic'`. Only the modules whose mtime or size changed since the
+    previous request on their directory are scanned again.
+    """
+
+    def __init__(self):
+        self._indexes: Dict[str, Tuple[Any, Dict[str, Tuple[int, int]]]] = {}
+
+    def get(self, module_directory: str):
+        from .resolver import ClassIndex
+
+        directory = os.path.abspath(module_directory)
+        index, stats = self._indexes.get(directory) or (ClassIndex(), {})
+        current = {}
+        for folder, _, files in os.walk(directory):
+            for file in files:
+                if not file.endswith('.py'):
+                    continue
+                path = os.path.join(folder, file)
+                try:
+                    st = os.stat(path)
+                    if stats.get(path) != (st.st_mtime_ns, st.st_size):
+                        with open(path, 'rb') as f:
+                            index.add(get_module_name(path, directory), f.read(), is_package_path(path))
+                except OSError:
+                    continue
+                current[path] = (st.st_mtime_ns, st.st_size)
+        for path in stats.keys() - current.keys():
+            index.remove(get_module_name(path, directory))
+        self._indexes[directory] = (index, current)
+        return index
+
+
+def convert_request(request: Mapping[str, Any], converter: Converter,
+                    class_indexes: Optional[ClassIndexes] = None) -> Dict[str, Any]:
+    """
+    Converts one request in the first format above. Raises ServeError for a malformed
+    request; conversion errors propagate.
+    """
+    module_directory = request.get('module_directory')
+    if not isinstance(module_directory, str):
+        raise ServeError('"module_directory" is required')
+    for key in ('source', 'code', 'output', 'path'):
+        if request.get(key) is not None and not isinstance(request[key], str):
+            raise ServeError('"%s" must be a string' % key)
+    source_path = request.get('source')
+    code = request.get('code')
+    if (source_path is None) == (code is None):
+        raise ServeError('exactly one of "source" and "code" is required')
+    output_path = request.get('output')
+    path = request.get('path') or output_path or source_path
+    if path is None:
+        raise ServeError('"path" or "output" is required with "code"')
+
+    timings = {}
+    start = time.perf_counter()
+    if code is None:
+        code = decode_source(read_source(source_path))
+    timings['read'] = time.perf_counter() - start
+
+    t = time.perf_counter()
+    if class_indexes is not None:
+        converter.class_index = class_indexes.get(module_directory)
+    converted = converter.convert(code, path, module_directory)
+    timings['convert'] = time.perf_counter() - t
+
+    response: Dict[str, Any] = {'ok': True, 'error': None}
+    t = time.perf_counter()
+    if output_path is not None:
+        write_target(output_path, converted)
+        response['output'] = output_path
+    else:
+        response['code'] = converted
+    timings['write'] = time.perf_counter() - t
+    timings['total'] = time.perf_counter() - start
+    response['timings'] = timings
+    return response
+
+
+def handle_request(line: str, converter: Converter, class_indexes: Optional[ClassIndexes] = None) -> Dict[str, Any]:
+    try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ServeError('a request must be a JSON object')
+    except (ValueError, ServeError) as e:
+        return {'id': None, 'ok': False, 'error': 'invalid request: %s' % e}
+
+    if 'arguments' in request:
+        response = {'requestId': request.get('requestId', 0)}
+        # 参数本身可能就解析不了，出错信息不能依赖 args
+        source = request['arguments']
+        try:
+            args = parse_work_request_arguments(request['arguments'])
+            source = args.source
+            convert_request({'module_directory': args.module_directory, 'source': args.source,
+                             'output': args.output}, converter, class_indexes)
+        except ServeError as e:
+            response.update(exitCode=1, output='py3to2: %s\n' % e)
+        except Exception:
+            response.update(exitCode=1, output='py3to2: error converting %s\n%s' % (source, traceback.format_exc()))
+        else:
+            response.update(exitCode=0, output='')
+        return response
+
+    response = {'id': request.get('id')}
+    try:
+        response.update(convert_request(request, converter, class_indexes))
+    except ServeError as e:
+        response.update(ok=False, error='invalid request: %s' % e)
+    except Exception:
+        response.update(ok=False, error=traceback.format_exc())
+    return response
+
+
+def serve_forever(converter: Converter, input: TextIO, output: TextIO):
+    """
+    Answers the requests read from `input` until it is closed. Anything the converter
+    prints goes to stderr, so that `output` only carries responses.
+    """
+    class_indexes = ClassIndexes() if converter.resolver == 'syntactic' and converter.infer else None
+    for line in input:
+        if not line.strip():
+            continue
+        with contextlib.redirect_stdout(sys.stderr):
+            response = handle_request(line, converter, class_indexes)
+        output.write(json.dumps(response) + '\n')
+        output.flush()
@@ -0,0 +1,72 @@
+from typing import *
+from collections import namedtuple
+import hashlib
+import os
+import re
+
+from .cache import tool_versions
+
+
+# ==========================================
+# 转换结果第一行里的 stamp，`py3to2 check` 只读这一行就知道输出是不是最新的
+#
+# The stamp follows the coding declaration on the first line of every converted
+# module, so line numbers are unchanged and Python 2 still reads the encoding:
+#
+#   # coding: utf8 py3to2-stamp=1,dots=2,tools=1f2e3d4c,source=9a8b7c6d5e4f3a2b1c0d9e8f
+#
+# `dots` is the depth of the module below the module directory, `tools` a digest of
+# the versions of py3to2, pytype, libcst and 3to2 and of the sources of py3to2, and `source` a digest of the
+# source text (decoded as utf8, with universal newlines). This module imports
+# neither libcst nor pytype.
+
+STAMP_VERSION = 1
+
+Stamp = namedtuple('Stamp', ['dots', 'tools', 'source'])
+
+_STAMP_RE = re.compile(r'py3to2-stamp=(\d+),dots=(\d+),tools=([0-9a-f]+),source=([0-9a-f]+)')
+
+
+def get_relative_dots(code_path: str, directory: str) -> int:
+    relpath = os.path.relpath(os.path.abspath(code_path), os.path.abspath(directory))
+    n_dots = len(relpath.replace('\\', '/').split('/'))
+    return n_dots
+
+
+def tools_digest() -> str:
+    text = ''.join('%s=%s\n' % item for item in tool_versions())
+    return hashlib.sha256(text.encode('utf8')).hexdigest()[:8]
+
+
+def source_digest(source: bytes) -> str:
+    # 和转换时读到的文本一致：universal newlines（utf8 的多字节字符里不会有 \r / \n）
+    source = source.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+    return hashlib.sha256(source).hexdigest()[:24]
+
+
+def create_stamp(code: str, relative_dots: int) -> Stamp:
+    return Stamp(relative_dots, tools_digest(), source_digest(code.encode('utf8')))
+
+
+def format_stamp(stamp: Stamp) -> str:
+    return 'py3to2-stamp=%d,dots=%d,tools=%s,source=%s' % (STAMP_VERSION, stamp.dots, stamp.tools, stamp.source)
+
+
+def parse_stamp(line: str) -> Optional[Stamp]:
+    """
+    The stamp in the first line of a converted module, or None if it has none (or
+    one of another version).
+    """
+    match = _STAMP_RE.search(line)
+    if match is None or int(match.group(1)) != STAMP_VERSION:
+        return None
+    return Stamp(int(match.group(2)), match.group(3), match.group(4))
+
+
+def read_stamp(path: str) -> Optional[Stamp]:
+    """
+    Reads only the first line of `path`. Raises OSError if it cannot be read.
+    """
+    with open(path, 'rb') as f:
+        line = f.readline(512)
+    return parse_stamp(line.decode('utf8', 'replace'))
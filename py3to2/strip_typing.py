@@ -0,0 +1,343 @@
+from typing import *
+from collections import namedtuple
+
+import libcst as cst
+import libcst.metadata as cstmeta
+
+from .resolver import TYPING_MODULES
+from .type_index import CodePosition, TypeTag, intern_type_tag
+
+
+# ==========================================
+# --strip-typing: 去掉只在类型检查时有用的代码，转换结果尽量不再 import shim
+# __all__ 里的名字不删；名字按 libcst 的 scope 解析，不是 typing.cast 的 cast 不动
+
+# 这些声明在没有其他用处的时候整行删除
+DECLARATIONS = frozenset(['TypeVar', 'ParamSpec', 'TypeVarTuple', 'NewType'])
+
+# 这个区域里的代码总会被删除；否则是 TypeVar 之类的声明语句，删不删要看名字的用处
+_REMOVED = None
+
+# 都按原来的节点查。imports 是 import 语句 -> 要删掉的 alias 的下标
+TypingRemovals = namedtuple('TypingRemovals', ['casts', 'type_checking', 'statements', 'imports', 'bases'])
+
+
+def _position(cst_position) -> CodePosition:
+    return CodePosition(cst_position.start.line, cst_position.start.column,
+                        cst_position.end.line, cst_position.end.column)
+
+
+def _all_names(module: cst.Module) -> Set[str]:
+    # 模块级的 __all__ = [...] / (...) 里的字符串
+    names = set()
+    for statement in module.body:
+        if not isinstance(statement, cst.SimpleStatementLine):
+            continue
+        for small in statement.body:
+            if not isinstance(small, (cst.Assign, cst.AugAssign)):
+                continue
+            targets = [small.target] if isinstance(small, cst.AugAssign) else [t.target for t in small.targets]
+            if not any(isinstance(target, cst.Name) and target.value == '__all__' for target in targets):
+                continue
+            if isinstance(small.value, (cst.List, cst.Tuple)):
+                for element in small.value.elements:
+                    if isinstance(element.value, cst.SimpleString):
+                        names.add(element.value.evaluated_value)
+    return names
+
+
+class TypingUsage(cst.CSTVisitor):
+    """
+    Finds the typing-only code of a module. Every name visited inside code that will be
+    removed is recorded with the regions around it; once the module is left, the
+    declarations and imports that have no use left are known and `removals` is set.
+    """
+
+    METADATA_DEPENDENCIES = (cstmeta.PositionProvider, cstmeta.QualifiedNameProvider, cstmeta.ScopeProvider)
+
+    def __init__(self, types: Mapping[CodePosition, TypeTag]):
+        super().__init__()
+        self.types: Dict[CodePosition, TypeTag] = dict(types)
+        self._roots: Dict[cst.CSTNode, Optional[cst.CSTNode]] = {}
+        self._regions: List[Optional[cst.CSTNode]] = []
+        # 名字 -> 它所在的区域
+        self._enclosing: Dict[cst.CSTNode, Tuple[Optional[cst.CSTNode], ...]] = {}
+        # TypeVar 之类的声明语句 -> 声明的名字
+        self._declarations: Dict[cst.SimpleStatementLine, cst.Name] = {}
+        self._imports: List[cst.CSTNode] = []
+        self.casts: Set[cst.Call] = set()
+        self.type_checking: Set[cst.If] = set()
+        self.overloads: Set[cst.FunctionDef] = set()
+        self.bases: Set[cst.Arg] = set()
+        self.removals: Optional[TypingRemovals] = None
+
+    def typing_name(self, node: cst.CSTNode) -> Optional[str]:
+        """
+        `X` if `node` is bound to `typing.X` or `typing_extensions.X`, None otherwise.
+        """
+        # 调用也有 qualified name（被调用的函数的），`cast(...)[1:]` 不是 typing 的下标
+        if not isinstance(node, (cst.Name, cst.Attribute)):
+            return None
+        names = self.get_metadata(cstmeta.QualifiedNameProvider, node, set())
+        if len(names) != 1:
+            return None
+        qualified_name, = names
+        if qualified_name.source != cstmeta.QualifiedNameSource.IMPORT:
+            return None
+        module, _, name = qualified_name.name.partition('.')
+        if module not in TYPING_MODULES or not name or '.' in name:
+            return None
+        return name
+
+    def _tag(self, node: cst.CSTNode, tag: TypeTag):
+        cst_position = self.get_metadata(cstmeta.PositionProvider, node, None)
+        if cst_position:
+            self.types.setdefault(_position(cst_position), intern_type_tag(tag))
+
+    def _tag_of(self, node: cst.CSTNode) -> Optional[TypeTag]:
+        cst_position = self.get_metadata(cstmeta.PositionProvider, node, None)
+        if not cst_position:
+            return None
+        return self.types.get(_position(cst_position))
+
+    def on_visit(self, node: cst.CSTNode) -> bool:
+        if node in self._roots:
+            self._regions.append(self._roots[node])
+        elif isinstance(node, cst.Annotation):
+            self._regions.append(_REMOVED)
+        # 字符串里的类型（'Box[T]'）的 access 落在字符串节点上
+        if self._regions and isinstance(node, (cst.Name, cst.Attribute, cst.SimpleString, cst.Import,
+                                               cst.ImportFrom)):
+            self._enclosing[node] = tuple(self._regions)
+        return super().on_visit(node)
+
+    def on_leave(self, original_node: cst.CSTNode):
+        super().on_leave(original_node)
+        if original_node in self._roots or isinstance(original_node, cst.Annotation):
+            self._regions.pop()
+
+    def _visit_body(self, body: Sequence[cst.CSTNode]):
+        for i, statement in enumerate(body):
+            if isinstance(statement, cst.FunctionDef) and self._is_overload(statement):
+                # 后面要有同名的实现，否则运行时这个名字就没了
+                if any(isinstance(later, cst.FunctionDef) and later.name.value == statement.name.value
+                       and not self._is_overload(later) for later in body[i + 1:]):
+                    self.overloads.add(statement)
+                    self._roots[statement] = _REMOVED
+            elif isinstance(statement, cst.SimpleStatementLine) and len(statement.body) == 1:
+                small = statement.body[0]
+                if (isinstance(small, cst.Assign) and len(small.targets) == 1
+                        and isinstance(small.targets[0].target, cst.Name)
+                        and isinstance(small.value, cst.Call)
+                        and self.typing_name(small.value.func) in DECLARATIONS):
+                    self._declarations[statement] = small.targets[0].target
+                    self._roots[statement] = statement
+
+    def _is_overload(self, node: cst.FunctionDef) -> bool:
+        return any(self.typing_name(decorator.decorator) == 'overload' for decorator in node.decorators)
+
+    def visit_Module(self, node: cst.Module):
+        self._visit_body(node.body)
+
+    def visit_IndentedBlock(self, node: cst.IndentedBlock):
+        self._visit_body(node.body)
+
+    def visit_Import(self, node: cst.Import):
+        self._imports.append(node)
+
+    def visit_ImportFrom(self, node: cst.ImportFrom):
+        if node.relative or node.module is None or isinstance(node.names, cst.ImportStar):
+            return
+        if isinstance(node.module, cst.Name) and node.module.value in TYPING_MODULES:
+            self._imports.append(node)
+
+    def visit_ClassDef(self, node: cst.ClassDef):
+        for base in node.bases:
+            value = base.value.value if isinstance(base.value, cst.Subscript) else base.value
+            if base.keyword is None and self.typing_name(value) == 'Generic':
+                self._tag(base.value, TypeTag('builtins.type', 'typing.Generic'))
+            tag = self._tag_of(base.value)
+            if tag is not None and tag.generic_base == 'builtins.type' and tag.first_parameter == 'typing.Generic':
+                self.bases.add(base)
+                self._roots[base] = _REMOVED
+
+    def visit_Subscript(self, node: cst.Subscript):
+        name = self.typing_name(node.value)
+        if name is not None:
+            self._tag(node.value, TypeTag('builtins.type', 'typing.' + name))
+        tag = self._tag_of(node.value)
+        if tag is not None and tag.generic_base == 'builtins.type':
+            for element in node.slice:
+                self._roots[element] = _REMOVED
+
+    def visit_Call(self, node: cst.Call):
+        if self.typing_name(node.func) != 'cast':
+            return
+        if len(node.args) != 2 or any(arg.keyword is not None or arg.star for arg in node.args):
+            return
+        self.casts.add(node)
+        self._roots[node.func] = _REMOVED
+        self._roots[node.args[0]] = _REMOVED
+
+    def visit_If(self, node: cst.If):
+        if self.typing_name(node.test) == 'TYPE_CHECKING':
+            self.type_checking.add(node)
+            self._roots[node.test] = _REMOVED
+            self._roots[node.body] = _REMOVED
+
+    # ==========================================
+    # 哪些声明和 import 没有用处了
+
+    def _is_removed(self, node: cst.CSTNode, declarations: Set[cst.CSTNode]) -> bool:
+        return any(region is _REMOVED or region in declarations for region in self._enclosing.get(node, ()))
+
+    def _unused(self, scope: cstmeta.Scope, name: str, assignment_node: cst.CSTNode,
+                declarations: Set[cst.CSTNode]) -> bool:
+        for assignment in scope.assignments[name]:
+            if isinstance(assignment, cstmeta.Assignment) and assignment.node is assignment_node:
+                return all(self._is_removed(access.node, declarations) for access in assignment.references)
+        return False
+
+    def leave_Module(self, original_node: cst.Module):
+        # scope 的 metadata 只在遍历的时候有
+        self.removals = self._find_removals(original_node)
+
+    def _find_removals(self, module: cst.Module) -> TypingRemovals:
+        exported = _all_names(module)
+
+        # TypeVar 的声明可能只被另一个要删除的声明用到
+        declarations: Set[cst.CSTNode] = set()
+        changed = True
+        while changed:
+            changed = False
+            for statement, target in self._declarations.items():
+                if statement in declarations or target.value in exported:
+                    continue
+                scope = self.get_metadata(cstmeta.ScopeProvider, target, None)
+                if scope is None or isinstance(scope, cstmeta.ClassScope) or len(scope.assignments[target.value]) != 1:
+                    # 类里的名字还可以通过属性访问
+                    continue
+                if self._unused(scope, target.value, target, declarations):
+                    declarations.add(statement)
+                    changed = True
+
+        imports: Dict[cst.CSTNode, Set[int]] = {}
+        for node in self._imports:
+            scope = self.get_metadata(cstmeta.ScopeProvider, node, None)
+            if scope is None or self._is_removed(node, declarations):
+                continue
+            removed = set()
+            for i, alias in enumerate(node.names):
+                if isinstance(node, cst.Import) and alias.evaluated_name not in TYPING_MODULES:
+                    continue
+                name = alias.evaluated_alias or alias.evaluated_name
+                if name not in exported and self._unused(scope, name, node, declarations):
+                    removed.add(i)
+            if removed:
+                imports[node] = removed
+
+        statements: Set[cst.CSTNode] = set(self.overloads)
+        statements.update(declarations)
+        return TypingRemovals(self.casts, self.type_checking, statements, imports, self.bases)
+
+
+def find_typing_removals(wrapper: cstmeta.MetadataWrapper, types: Mapping[CodePosition, TypeTag]
+                         ) -> Tuple[Dict[CodePosition, TypeTag], TypingRemovals]:
+    """
+    Returns the type map with the `Generic[...]` bases and the subscripts of `typing`
+    names added, and what `StripTyping` removes.
+    """
+    usage = TypingUsage(types)
+    wrapper.visit(usage)
+    return usage.types, usage.removals
+
+
+# 不用加括号的表达式
+_ATOMS = (cst.Name, cst.Attribute, cst.Call, cst.Subscript, cst.Integer, cst.Float, cst.Imaginary,
+          cst.SimpleString, cst.ConcatenatedString, cst.FormattedString, cst.List, cst.Tuple, cst.Set,
+          cst.Dict, cst.ListComp, cst.SetComp, cst.DictComp, cst.GeneratorExp, cst.Ellipsis)
+
+
+class StripTyping(cst.CSTTransformer):
+    """
+    Removes the statements, `Generic[...]` bases and import names of `TypingRemovals`.
+    Runs before `RemoveTypehint` in the chain, so it sees the `typing` imports before
+    they are rewritten to the shims.
+    """
+
+    def __init__(self, removals: TypingRemovals):
+        super().__init__()
+        self._removals = removals
+
+    def leave_SimpleStatementLine(self, original_node: cst.SimpleStatementLine,
+                                  updated_node: cst.SimpleStatementLine):
+        if original_node in self._removals.statements:
+            return cst.RemovalSentinel.REMOVE
+        return updated_node
+
+    def leave_FunctionDef(self, original_node: cst.FunctionDef, updated_node: cst.FunctionDef):
+        if original_node in self._removals.statements:
+            return cst.RemovalSentinel.REMOVE
+        return updated_node
+
+    def leave_Arg(self, original_node: cst.Arg, updated_node: cst.Arg):
+        if original_node in self._removals.bases:
+            return cst.RemovalSentinel.REMOVE
+        return updated_node
+
+    def _leave_import(self, original_node, updated_node):
+        removed = self._removals.imports.get(original_node)
+        if not removed:
+            return updated_node
+        names = [alias for i, alias in enumerate(updated_node.names) if i not in removed]
+        if not names:
+            return cst.RemovalSentinel.REMOVE
+        names[-1] = names[-1].with_changes(comma=cst.MaybeSentinel.DEFAULT)
+        return updated_node.with_changes(names=names)
+
+    def leave_Import(self, original_node: cst.Import, updated_node: cst.Import):
+        return self._leave_import(original_node, updated_node)
+
+    def leave_ImportFrom(self, original_node: cst.ImportFrom, updated_node: cst.ImportFrom):
+        return self._leave_import(original_node, updated_node)
+
+
+class UnwrapTyping(cst.CSTTransformer):
+    """
+    Inlines the casts and replaces the `if TYPE_CHECKING:` blocks of `TypingRemovals`
+    by their `else`. The result is a node of another type, so it runs last in the
+    chain, where no transformer after it needs the metadata of the original node.
+    """
+
+    def __init__(self, removals: TypingRemovals):
+        super().__init__()
+        self._removals = removals
+        self._elifs: Set[cst.If] = set()
+
+    def visit_If(self, node: cst.If):
+        if isinstance(node.orelse, cst.If):
+            self._elifs.add(node.orelse)
+
+    def leave_Call(self, original_node: cst.Call, updated_node: cst.Call) -> cst.BaseExpression:
+        if original_node not in self._removals.casts:
+            return updated_node
+        value = updated_node.args[1].value
+        if not value.lpar and not isinstance(value, _ATOMS):
+            value = value.with_changes(lpar=[cst.LeftParen()], rpar=[cst.RightParen()])
+        return value.with_changes(lpar=list(updated_node.lpar) + list(value.lpar),
+                                  rpar=list(value.rpar) + list(updated_node.rpar))
+
+    def leave_If(self, original_node: cst.If, updated_node: cst.If):
+        if original_node not in self._removals.type_checking:
+            return updated_node
+        orelse = updated_node.orelse
+        if original_node in self._elifs:
+            # `elif TYPE_CHECKING:` 换成它后面的 elif / else
+            return cst.RemovalSentinel.REMOVE if orelse is None else orelse
+        if orelse is None:
+            return cst.RemovalSentinel.REMOVE
+        if isinstance(orelse, cst.If):
+            return orelse.with_changes(leading_lines=updated_node.leading_lines)
+        if isinstance(orelse.body, cst.SimpleStatementSuite):
+            return cst.SimpleStatementLine(body=orelse.body.body)
+        return cst.FlattenSentinel(orelse.body.body)
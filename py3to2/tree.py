@@ -0,0 +1,241 @@
+from typing import *
+from collections import namedtuple
+import os
+import re
+
+from .cache import write_atomic
+from .stamp import get_relative_dots, read_stamp, source_digest, tools_digest
+
+
+# ==========================================
+# convert-tree: SRC 转换到 DST，不修改 SRC
+#
+# Python files are converted to the same relative path under DST; every other file
+# is mirrored, by hardlink when possible. A file of DST is only replaced when its
+# content would change, so unchanged outputs keep their mtime. Files of DST that have
+# no counterpart in SRC any more are pruned, except the typing shims of DST.
+
+SHIM_NAMES = ('_py3to2_typing.py', '_py3to2_typing_extensions.py')
+
+_SHIM_IMPORT_RE = re.compile(r'\b(_py3to2_typing(?:_extensions)?)\b')
+
+# 不需要镜像到 DST 的目录
+SKIPPED_DIRECTORIES = frozenset(['__pycache__'])
+
+# 相对 SRC / DST 的路径
+TreePlan = namedtuple('TreePlan', ['python_files', 'other_files', 'stale_files'])
+
+
+def _walk_files(directory: str, excluded: Optional[str] = None) -> Iterator[str]:
+    for folder, folders, files in os.walk(directory):
+        folders[:] = sorted(
+            name for name in folders
+            if name not in SKIPPED_DIRECTORIES
+            and (excluded is None or os.path.realpath(os.path.join(folder, name)) != excluded))
+        for file in sorted(files):
+            yield os.path.relpath(os.path.join(folder, file), directory)
+
+
+def plan_tree(source_directory: str, target_directory: str) -> TreePlan:
+    """
+    Lists the files to convert and to mirror from `source_directory`, and the files of
+    `target_directory` to prune. If the target lies inside the source, it is not
+    part of the source tree.
+    """
+    excluded = os.path.realpath(target_directory)
+    python_files = []
+    other_files = []
+    for path in _walk_files(source_directory, excluded):
+        (python_files if path.endswith('.py') else other_files).append(path)
+
+    expected = set(python_files).union(other_files, SHIM_NAMES)
+    stale_files = []
+    if os.path.isdir(target_directory):
+        stale_files = [path for path in _walk_files(target_directory) if path not in expected]
+    return TreePlan(python_files, other_files, stale_files)
+
+
+def referenced_shims(code: str) -> Tuple[str, ...]:
+    """
+    The file names of the typing shims converted `code` imports.
+    """
+    return tuple(sorted({name + '.py' for name in _SHIM_IMPORT_RE.findall(code)}))
+
+
+# 文件的 (st_mtime_ns, st_size, st_ino)
+FileState = Tuple[int, int, int]
+
+
+def snapshot_tree(source_directory: str, target_directory: str) -> Dict[str, FileState]:
+    """
+    The state of every file `plan_tree` would list under `source_directory`, keyed by
+    relative path. Two snapshots differ when a file was added, removed or rewritten.
+    """
+    excluded = os.path.realpath(target_directory)
+    snapshot = {}
+    for path in _walk_files(source_directory, excluded):
+        try:
+            stat = os.stat(os.path.join(source_directory, path))
+        except OSError:
+            continue
+        snapshot[path] = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    return snapshot
+
+
+def is_mirrored(source_path: str, target_path: str) -> bool:
+    try:
+        source_stat = os.stat(source_path)
+        target_stat = os.stat(target_path)
+    except OSError:
+        return False
+    if os.path.samestat(source_stat, target_stat):
+        return True
+    # copy2 保留了 mtime，大小和 mtime 都一样就当作没变
+    return source_stat.st_size == target_stat.st_size and source_stat.st_mtime_ns == target_stat.st_mtime_ns
+
+
+def _temporary_path(target_path: str) -> str:
+    folder, name = os.path.split(target_path)
+    return os.path.join(folder, '.tmp-%d-%s' % (os.getpid(), name))
+
+
+def mirror_file(source_path: str, target_path: str, link: bool = True) -> bool:
+    """
+    Makes `target_path` a hardlink to (or with `link` false, or across file systems, a
+    copy of) `source_path`, unless it already is one. Returns True if it was replaced.
+    """
+    if is_mirrored(source_path, target_path):
+        return False
+    os.makedirs(os.path.dirname(target_path) or '.', exist_ok=True)
+    tmp_path = _temporary_path(target_path)
+    try:
+        try:
+            if not link:
+                raise OSError('hardlinks disabled')
+            os.link(source_path, tmp_path)
+        except OSError:
+            import shutil
+            shutil.copy2(source_path, tmp_path)
+        os.replace(tmp_path, target_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    return True
+
+
+def write_if_changed(path: str, data: bytes) -> bool:
+    """
+    Atomically replaces `path` with `data` unless it already has that content.
+    Returns True if the file was written.
+    """
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return False
+        mode = os.stat(path).st_mode & 0o7777
+    except OSError:
+        mode = default_file_mode()
+    write_atomic(path, data, mode)
+    return True
+
+
+def default_file_mode() -> int:
+    # 和 open(path, 'w') 新建的文件一样
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def prune_files(target_directory: str, paths: Iterable[str]) -> int:
+    """
+    Deletes `paths` (relative to `target_directory`) and the directories they leave empty.
+    """
+    n_removed = 0
+    for path in paths:
+        full_path = os.path.join(target_directory, path)
+        try:
+            os.unlink(full_path)
+        except OSError:
+            continue
+        n_removed += 1
+        folder = os.path.dirname(path)
+        while folder:
+            try:
+                os.rmdir(os.path.join(target_directory, folder))
+            except OSError:
+                break
+            folder = os.path.dirname(folder)
+    return n_removed
+
+
+# ==========================================
+# py3to2 check: 只读输出的第一行和源文件，不 import libcst / pytype
+
+# 相对 DST 的路径；stale 是 (路径, 原因)
+CheckReport = namedtuple('CheckReport', ['n_checked', 'stale', 'missing', 'orphaned'])
+
+
+def check_file(source_path: str, target_path: str, target_directory: str, tools: str) -> Optional[str]:
+    """
+    Returns why the converted `target_path` is not up to date with `source_path`, or
+    None if it is. Raises OSError if the target cannot be read.
+    """
+    stamp = read_stamp(target_path)
+    if stamp is None:
+        return 'no stamp'
+    if stamp.tools != tools:
+        return 'converted by other tool versions'
+    if stamp.dots != get_relative_dots(target_path, target_directory):
+        return 'converted at another depth'
+    with open(source_path, 'rb') as f:
+        if stamp.source != source_digest(f.read()):
+            return 'source changed'
+    return None
+
+
+def _find_referenced_shims(target_directory: str, python_files: Iterable[str]) -> Set[str]:
+    shims = set()
+    for path in python_files:
+        try:
+            with open(os.path.join(target_directory, path), encoding='utf8', errors='replace') as f:
+                shims.update(referenced_shims(f.read()))
+        except OSError:
+            continue
+    return shims
+
+
+def check_tree(source_directory: str, target_directory: str) -> CheckReport:
+    """
+    Compares `target_directory` with what `convert-tree` would make of
+    `source_directory`: converted files whose stamp does not match their source,
+    mirrored files that differ, and missing and orphaned files. A missing typing shim
+    only counts if a converted file imports it.
+    """
+    plan = plan_tree(source_directory, target_directory)
+    tools = tools_digest()
+    stale = []
+    missing = []
+    for path in plan.python_files:
+        target_path = os.path.join(target_directory, path)
+        try:
+            reason = check_file(os.path.join(source_directory, path), target_path, target_directory, tools)
+        except FileNotFoundError:
+            missing.append(path)
+            continue
+        if reason is not None:
+            stale.append((path, reason))
+    for path in plan.other_files:
+        target_path = os.path.join(target_directory, path)
+        if not os.path.exists(target_path):
+            missing.append(path)
+        elif not is_mirrored(os.path.join(source_directory, path), target_path):
+            stale.append((path, 'differs from the source'))
+    # --strip-typing 时只有被 import 的 shim 才会写
+    missing_shims = [name for name in SHIM_NAMES if not os.path.exists(os.path.join(target_directory, name))]
+    if missing_shims:
+        missing.extend(set(missing_shims).intersection(_find_referenced_shims(target_directory, plan.python_files)))
+    n_checked = len(plan.python_files) + len(plan.other_files)
+    return CheckReport(n_checked, stale, sorted(missing), plan.stale_files)
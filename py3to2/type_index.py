@@ -0,0 +1,58 @@
+from collections import namedtuple
+from array import array
+import ast
+import bisect
+from typing import *
+
+
+# pytype 推断出的类型，按位置索引。这里不 import pytype，不做类型推断时也可以用
+
+CodePosition = namedtuple('CodePosition', ['lineno', 'col_offset', 'end_lineno', 'end_col_offset'])
+
+
+def get_position(node: ast.AST) -> Optional[CodePosition]:
+    lineno = getattr(node, 'lineno', None)
+    if lineno is None:
+        return None
+    return CodePosition(lineno, node.col_offset, node.end_lineno, node.end_col_offset)
+
+
+# 转换时只关心 `type[X]` 这一类类型：GenericType 的 base_type 和第一个参数的名字
+TypeTag = namedtuple('TypeTag', ['generic_base', 'first_parameter'])
+
+_type_tags: Dict[TypeTag, TypeTag] = {}
+
+
+def intern_type_tag(tag: TypeTag) -> TypeTag:
+    return _type_tags.setdefault(tag, tag)
+
+
+class TypeIndex(Mapping[CodePosition, TypeTag]):
+    """
+    A compact, read-only map from code positions to `TypeTag`s: a sorted list of
+    positions, and an array of indices into a small table of interned tags.
+    """
+
+    def __init__(self, items: Iterable[Tuple[CodePosition, TypeTag]] = ()):
+        items = sorted(dict(items).items())
+        self._positions: List[CodePosition] = [position for position, _ in items]
+        self._tags: List[TypeTag] = []
+        self._tag_ids = array('I')
+        tag_ids: Dict[TypeTag, int] = {}
+        for _, tag in items:
+            if tag not in tag_ids:
+                tag_ids[tag] = len(self._tags)
+                self._tags.append(tag)
+            self._tag_ids.append(tag_ids[tag])
+
+    def __getitem__(self, position: CodePosition) -> TypeTag:
+        i = bisect.bisect_left(self._positions, position)
+        if i == len(self._positions) or self._positions[i] != position:
+            raise KeyError(position)
+        return self._tags[self._tag_ids[i]]
+
+    def __iter__(self) -> Iterator[CodePosition]:
+        return iter(self._positions)
+
+    def __len__(self) -> int:
+        return len(self._positions)
@@ -0,0 +1,7 @@
+# 输出目录里的 _py3to2_typing.py / _py3to2_typing_extensions.py
+
+class BASE64_CONSTS:
+    PY_TYPING = 'IyBSdW50aW1lIHN0YW5kLWlucyBmb3IgdGhlIG5hbWVzIG9mIHR5cGluZywgd3JpdHRlbiBieSBweTN0bzIuIE5vdGhpbmcgaXMgY2hlY2tlZCBoZXJlLgoKCmNsYXNzIF9DbGFzc01ldGEodHlwZSk6CiAgICAjIEdlbmVyaWNbVF0sIERpY3Rbc3RyLCBpbnRdIC4uLiBjYW4gc3RpbGwgYmUgdXNlZCBhcyBiYXNlIGNsYXNzZXMKICAgIGRlZiBfX2dldGl0ZW1fXyhjbHMsIHBhcmFtZXRlcnMpOgogICAgICAgIHJldHVybiBjbHMKCgpkZWYgX2luaXQoc2VsZiwgKmFyZ3MsICoqa3dhcmdzKToKICAgIHBhc3MKCgpkZWYgX25ldyhjbHMsICphcmdzLCAqKmt3YXJncyk6CiAgICAjIE5hbWVkVHVwbGUoJ1AnLCBbLi4uXSkgYW5kIFR5cGVkRGljdCgnRCcsIHsuLi59KSBtYWtlIGEgbmV3IGNsYXNzLAogICAgIyB0aGVpciBzdWJjbGFzc2VzIGFyZSBpbnN0YW50aWF0ZWQgYXMgdXN1YWwKICAgIGlmIGFyZ3MgYW5kICdfZmFjdG9yeScgaW4gY2xzLl9fZGljdF9fOgogICAgICAgIHJldHVybiBfY2xhc3Moc3RyKGFyZ3NbMF0pKQogICAgcmV0dXJuIG9iamVjdC5fX25ld19fKGNscykKCgpkZWYgX2NsYXNzKG5hbWUpOgogICAgcmV0dXJuIF9DbGFzc01ldGEobmFtZSwgKG9iamVjdCwpLCB7J19faW5pdF9fJzogX2luaXR9KQoKCmRlZiBfZmFjdG9yeShuYW1lKToKICAgIHJldHVybiBfQ2xhc3NNZXRhKG5hbWUsIChvYmplY3QsKSwgeydfX2luaXRfXyc6IF9pbml0LCAnX19uZXdfXyc6IF9uZXcsICdfZmFjdG9yeSc6IFRydWV9KQoKCmRlZiBfaWRlbnRpdHkodmFsdWUpOgogICAgcmV0dXJuIHZhbHVlCgoKZGVmIF9kZWNvcmF0b3IoKmFyZ3MsICoqa3dhcmdzKToKICAgIHJldHVybiBfaWRlbnRpdHkKCgpkZWYgY2FzdCh0eXAsIHZhbCk6CiAgICByZXR1cm4gdmFsCgoKZGVmIE5ld1R5cGUobmFtZSwgdHApOgogICAgcmV0dXJuIF9pZGVudGl0eQoKCmRlZiBhc3NlcnRfdHlwZSh2YWwsIHR5cCk6CiAgICByZXR1cm4gdmFsCgoKZGVmIGFzc2VydF9uZXZlcihhcmcpOgogICAgcmFpc2UgQXNzZXJ0aW9uRXJyb3IoJ0V4cGVjdGVkIGNvZGUgdG8gYmUgdW5yZWFjaGFibGUnKQoKCmRlZiBnZXRfdHlwZV9oaW50cyhvYmosIGdsb2JhbG5zPU5vbmUsIGxvY2FsbnM9Tm9uZSwgaW5jbHVkZV9leHRyYXM9RmFsc2UpOgogICAgcmV0dXJuIHt9CgoKZGVmIGdldF9hcmdzKHRwKToKICAgIHJldHVybiAoKQoKCmRlZiBnZXRfb3JpZ2luKHRwKToKICAgIHJldHVybiBOb25lCgoKZGVmIGlzX3R5cGVkZGljdCh0cCk6CiAgICByZXR1cm4gRmFsc2UKCgpkZWYgZ2V0X292ZXJsb2FkcyhmdW5jKToKICAgIHJldHVybiBbXQoKCmRlZiBjbGVhcl9vdmVybG9hZHMoKToKICAgIHBhc3MKCgojIGEgY2xhc3MgbGlrZSBldmVyeSBvdGhlciBuYW1lIGhlcmUsIHNvIGBpZiBUWVBFX0NIRUNLSU5HOmAgYmxvY2tzIHN0aWxsIHJ1biBhcyB0aGV5IGFsd2F5cyBkaWQKVFlQRV9DSEVDS0lORyA9IF9jbGFzcygnVFlQRV9DSEVDS0lORycpClRleHQgPSBfY2xhc3MoJ1RleHQnKQoKQW55ID0gX2NsYXNzKCdBbnknKQpDYWxsYWJsZSA9IF9jbGFzcygnQ2FsbGFibGUnKQpGb3J3YXJkUmVmID0gX2NsYXNzKCdGb3J3YXJkUmVmJykKR2VuZXJpYyA9IF9jbGFzcygnR2VuZXJpYycpClByb3RvY29sID0gX2NsYXNzKCdQcm90b2NvbCcpClR1cGxlID0gX2NsYXNzKCdUdXBsZScpClR5cGUgPSBfY2xhc3MoJ1R5cGUnKQpBYnN0cmFjdFNldCA9IF9jbGFzcygnQWJzdHJhY3RTZXQnKQpCeXRlU3RyaW5nID0gX2NsYXNzKCdCeXRlU3RyaW5nJykKQ29udGFpbmVyID0gX2NsYXNzKCdDb250YWluZXInKQpDb250ZXh0TWFuYWdlciA9IF9jbGFzcygnQ29udGV4dE1hbmFnZXInKQpIYXNoYWJsZSA9IF9jbGFzcygnSGFzaGFibGUnKQpJdGVtc1ZpZXcgPSBfY2xhc3MoJ0l0ZW1zVmlldycpCkl0ZXJhYmxlID0gX2NsYXNzKCdJdGVyYWJsZScpCkl0ZXJhdG9yID0gX2NsYXNzKCdJdGVyYXRvcicpCktleXNWaWV3ID0gX2NsYXNzKCdLZXlzVmlldycpCk1hcHBpbmcgPSBfY2xhc3MoJ01hcHBpbmcnKQpNYXBwaW5nVmlldyA9IF9jbGFzcygnTWFwcGluZ1ZpZXcnKQpNdXRhYmxlTWFwcGluZyA9IF9jbGFzcygnTXV0YWJsZU1hcHBpbmcnKQpNdXRhYmxlU2VxdWVuY2UgPSBfY2xhc3MoJ011dGFibGVTZXF1ZW5jZScpCk11dGFibGVTZXQgPSBfY2xhc3MoJ011dGFibGVTZXQnKQpTZXF1ZW5jZSA9IF9jbGFzcygnU2VxdWVuY2UnKQpTaXplZCA9IF9jbGFzcygnU2l6ZWQnKQpWYWx1ZXNWaWV3ID0gX2NsYXNzKCdWYWx1ZXNWaWV3JykKQXdhaXRhYmxlID0gX2NsYXNzKCdBd2FpdGFibGUnKQpBc3luY0l0ZXJhdG9yID0gX2NsYXNzKCdBc3luY0l0ZXJhdG9yJykKQXN5bmNJdGVyYWJsZSA9IF9jbGFzcygnQXN5bmNJdGVyYWJsZScpCkNvcm91dGluZSA9IF9jbGFzcygnQ29yb3V0aW5lJykKQ29sbGVjdGlvbiA9IF9jbGFzcygnQ29sbGVjdGlvbicpCkFzeW5jR2VuZXJhdG9yID0gX2NsYXNzKCdBc3luY0dlbmVyYXRvcicpCkFzeW5jQ29udGV4dE1hbmFnZXIgPSBfY2xhc3MoJ0FzeW5jQ29udGV4dE1hbmFnZXInKQpSZXZlcnNpYmxlID0gX2NsYXNzKCdSZXZlcnNpYmxlJykKU3VwcG9ydHNBYnMgPSBfY2xhc3MoJ1N1cHBvcnRzQWJzJykKU3VwcG9ydHNCeXRlcyA9IF9jbGFzcygnU3VwcG9ydHNCeXRlcycpClN1cHBvcnRzQ29tcGxleCA9IF9jbGFzcygnU3VwcG9ydHNDb21wbGV4JykKU3VwcG9ydHNGbG9hdCA9IF9jbGFzcygnU3VwcG9ydHNGbG9hdCcpClN1cHBvcnRzSW5kZXggPSBfY2xhc3MoJ1N1cHBvcnRzSW5kZXgnKQpTdXBwb3J0c0ludCA9IF9jbGFzcygnU3VwcG9ydHNJbnQnKQpTdXBwb3J0c1JvdW5kID0gX2NsYXNzKCdTdXBwb3J0c1JvdW5kJykKQ2hhaW5NYXAgPSBfY2xhc3MoJ0NoYWluTWFwJykKQ291bnRlciA9IF9jbGFzcygnQ291bnRlcicpCkRlcXVlID0gX2NsYXNzKCdEZXF1ZScpCkRpY3QgPSBfY2xhc3MoJ0RpY3QnKQpEZWZhdWx0RGljdCA9IF9jbGFzcygnRGVmYXVsdERpY3QnKQpMaXN0ID0gX2NsYXNzKCdMaXN0JykKT3JkZXJlZERpY3QgPSBfY2xhc3MoJ09yZGVyZWREaWN0JykKU2V0ID0gX2NsYXNzKCdTZXQnKQpGcm96ZW5TZXQgPSBfY2xhc3MoJ0Zyb3plblNldCcpCk5hbWVkVHVwbGUgPSBfZmFjdG9yeSgnTmFtZWRUdXBsZScpClR5cGVkRGljdCA9IF9mYWN0b3J5KCdUeXBlZERpY3QnKQpHZW5lcmF0b3IgPSBfY2xhc3MoJ0dlbmVyYXRvcicpCkJpbmFyeUlPID0gX2NsYXNzKCdCaW5hcnlJTycpCklPID0gX2NsYXNzKCdJTycpCk1hdGNoID0gX2NsYXNzKCdNYXRjaCcpClBhdHRlcm4gPSBfY2xhc3MoJ1BhdHRlcm4nKQpUZXh0SU8gPSBfY2xhc3MoJ1RleHRJTycpCmZpbmFsID0gbm9fdHlwZV9jaGVjayA9IG5vX3R5cGVfY2hlY2tfZGVjb3JhdG9yID0gb3ZlcmxvYWQgPSBydW50aW1lX2NoZWNrYWJsZSA9IF9pZGVudGl0eQpkYXRhY2xhc3NfdHJhbnNmb3JtID0gX2RlY29yYXRvcgpBbm5vdGF0ZWQgPSBfY2xhc3MoJ0Fubm90YXRlZCcpCkNsYXNzVmFyID0gX2NsYXNzKCdDbGFzc1ZhcicpCkNvbmNhdGVuYXRlID0gX2NsYXNzKCdDb25jYXRlbmF0ZScpCkZpbmFsID0gX2NsYXNzKCdGaW5hbCcpCkxpdGVyYWwgPSBfY2xhc3MoJ0xpdGVyYWwnKQpPcHRpb25hbCA9IF9jbGFzcygnT3B0aW9uYWwnKQpQYXJhbVNwZWMgPSBfY2xhc3MoJ1BhcmFtU3BlYycpClR5cGVWYXIgPSBfY2xhc3MoJ1R5cGVWYXInKQpVbmlvbiA9IF9jbGFzcygnVW5pb24nKQpBbnlTdHIgPSBfY2xhc3MoJ0FueVN0cicpCk5vUmV0dXJuID0gX2NsYXNzKCdOb1JldHVybicpClBhcmFtU3BlY0FyZ3MgPSBfY2xhc3MoJ1BhcmFtU3BlY0FyZ3MnKQpQYXJhbVNwZWNLd2FyZ3MgPSBfY2xhc3MoJ1BhcmFtU3BlY0t3YXJncycpClR5cGVBbGlhcyA9IF9jbGFzcygnVHlwZUFsaWFzJykKVHlwZUd1YXJkID0gX2NsYXNzKCdUeXBlR3VhcmQnKQpBc3luY0NvbnRleHRNYW5lciA9IEFzeW5jQ29udGV4dE1hbmFnZXIKbm9fdHlwZV9jaGVja19kb3JhdG8gPSBub190eXBlX2NoZWNrX2RlY29yYXRvcgpydW50aW1lX2NoZWNrYWIgPSBydW50aW1lX2NoZWNrYWJsZQo='
+    PY_TYPING_EXTENSION = 'IyBSdW50aW1lIHN0YW5kLWlucyBmb3IgdGhlIG5hbWVzIG9mIHR5cGluZ19leHRlbnNpb25zLCB3cml0dGVuIGJ5IHB5M3RvMi4gTm90aGluZyBpcyBjaGVja2VkIGhlcmUuCgoKY2xhc3MgX0NsYXNzTWV0YSh0eXBlKToKICAgICMgR2VuZXJpY1tUXSwgRGljdFtzdHIsIGludF0gLi4uIGNhbiBzdGlsbCBiZSB1c2VkIGFzIGJhc2UgY2xhc3NlcwogICAgZGVmIF9fZ2V0aXRlbV9fKGNscywgcGFyYW1ldGVycyk6CiAgICAgICAgcmV0dXJuIGNscwoKCmRlZiBfaW5pdChzZWxmLCAqYXJncywgKiprd2FyZ3MpOgogICAgcGFzcwoKCmRlZiBfbmV3KGNscywgKmFyZ3MsICoqa3dhcmdzKToKICAgICMgTmFtZWRUdXBsZSgnUCcsIFsuLi5dKSBhbmQgVHlwZWREaWN0KCdEJywgey4uLn0pIG1ha2UgYSBuZXcgY2xhc3MsCiAgICAjIHRoZWlyIHN1YmNsYXNzZXMgYXJlIGluc3RhbnRpYXRlZCBhcyB1c3VhbAogICAgaWYgYXJncyBhbmQgJ19mYWN0b3J5JyBpbiBjbHMuX19kaWN0X186CiAgICAgICAgcmV0dXJuIF9jbGFzcyhzdHIoYXJnc1swXSkpCiAgICByZXR1cm4gb2JqZWN0Ll9fbmV3X18oY2xzKQoKCmRlZiBfY2xhc3MobmFtZSk6CiAgICByZXR1cm4gX0NsYXNzTWV0YShuYW1lLCAob2JqZWN0LCksIHsnX19pbml0X18nOiBfaW5pdH0pCgoKZGVmIF9mYWN0b3J5KG5hbWUpOgogICAgcmV0dXJuIF9DbGFzc01ldGEobmFtZSwgKG9iamVjdCwpLCB7J19faW5pdF9fJzogX2luaXQsICdfX25ld19fJzogX25ldywgJ19mYWN0b3J5JzogVHJ1ZX0pCgoKZGVmIF9pZGVudGl0eSh2YWx1ZSk6CiAgICByZXR1cm4gdmFsdWUKCgpkZWYgX2RlY29yYXRvcigqYXJncywgKiprd2FyZ3MpOgogICAgcmV0dXJuIF9pZGVudGl0eQoKCmRlZiBjYXN0KHR5cCwgdmFsKToKICAgIHJldHVybiB2YWwKCgpkZWYgTmV3VHlwZShuYW1lLCB0cCk6CiAgICByZXR1cm4gX2lkZW50aXR5CgoKZGVmIGFzc2VydF90eXBlKHZhbCwgdHlwKToKICAgIHJldHVybiB2YWwKCgpkZWYgYXNzZXJ0X25ldmVyKGFyZyk6CiAgICByYWlzZSBBc3NlcnRpb25FcnJvcignRXhwZWN0ZWQgY29kZSB0byBiZSB1bnJlYWNoYWJsZScpCgoKZGVmIGdldF90eXBlX2hpbnRzKG9iaiwgZ2xvYmFsbnM9Tm9uZSwgbG9jYWxucz1Ob25lLCBpbmNsdWRlX2V4dHJhcz1GYWxzZSk6CiAgICByZXR1cm4ge30KCgpkZWYgZ2V0X2FyZ3ModHApOgogICAgcmV0dXJuICgpCgoKZGVmIGdldF9vcmlnaW4odHApOgogICAgcmV0dXJuIE5vbmUKCgpkZWYgaXNfdHlwZWRkaWN0KHRwKToKICAgIHJldHVybiBGYWxzZQoKCmRlZiBnZXRfb3ZlcmxvYWRzKGZ1bmMpOgogICAgcmV0dXJuIFtdCgoKZGVmIGNsZWFyX292ZXJsb2FkcygpOgogICAgcGFzcwoKCiMgYSBjbGFzcyBsaWtlIGV2ZXJ5IG90aGVyIG5hbWUgaGVyZSwgc28gYGlmIFRZUEVfQ0hFQ0tJTkc6YCBibG9ja3Mgc3RpbGwgcnVuIGFzIHRoZXkgYWx3YXlzIGRpZApUWVBFX0NIRUNLSU5HID0gX2NsYXNzKCdUWVBFX0NIRUNLSU5HJykKVGV4dCA9IF9jbGFzcygnVGV4dCcpCgpUeXBlID0gX2NsYXNzKCdUeXBlJykKQXdhaXRhYmxlID0gX2NsYXNzKCdBd2FpdGFibGUnKQpBc3luY0l0ZXJhdG9yID0gX2NsYXNzKCdBc3luY0l0ZXJhdG9yJykKQXN5bmNJdGVyYWJsZSA9IF9jbGFzcygnQXN5bmNJdGVyYWJsZScpCkNvcm91dGluZSA9IF9jbGFzcygnQ29yb3V0aW5lJykKQXN5bmNHZW5lcmF0b3IgPSBfY2xhc3MoJ0FzeW5jR2VuZXJhdG9yJykKQXN5bmNDb250ZXh0TWFuYWdlciA9IF9jbGFzcygnQXN5bmNDb250ZXh0TWFuYWdlcicpCkNoYWluTWFwID0gX2NsYXNzKCdDaGFpbk1hcCcpCkNvbnRleHRNYW5hZ2VyID0gX2NsYXNzKCdDb250ZXh0TWFuYWdlcicpCkNvdW50ZXIgPSBfY2xhc3MoJ0NvdW50ZXInKQpEZXF1ZSA9IF9jbGFzcygnRGVxdWUnKQpEZWZhdWx0RGljdCA9IF9jbGFzcygnRGVmYXVsdERpY3QnKQpPcmRlcmVkRGljdCA9IF9jbGFzcygnT3JkZXJlZERpY3QnKQpUeXBlZERpY3QgPSBfZmFjdG9yeSgnVHlwZWREaWN0JykKU3VwcG9ydHNJbmRleCA9IF9jbGFzcygnU3VwcG9ydHNJbmRleCcpClByb3RvY29sID0gX2NsYXNzKCdQcm90b2NvbCcpCmZpbmFsID0gb3ZlcmxvYWQgPSByZXZlYWxfdHlwZSA9IHJ1bnRpbWUgPSBydW50aW1lX2NoZWNrYWJsZSA9IF9pZGVudGl0eQpkYXRhY2xhc3NfdHJhbnNmb3JtID0gX2RlY29yYXRvcgpDbGFzc1ZhciA9IF9jbGFzcygnQ2xhc3NWYXInKQpDb25jYXRlbmF0ZSA9IF9jbGFzcygnQ29uY2F0ZW5hdGUnKQpGaW5hbCA9IF9jbGFzcygnRmluYWwnKQpMaXRlcmFsU3RyaW5nID0gX2NsYXNzKCdMaXRlcmFsU3RyaW5nJykKUGFyYW1TcGVjID0gX2NsYXNzKCdQYXJhbVNwZWMnKQpQYXJhbVNwZWNBcmdzID0gX2NsYXNzKCdQYXJhbVNwZWNBcmdzJykKUGFyYW1TcGVjS3dhcmdzID0gX2NsYXNzKCdQYXJhbVNwZWNLd2FyZ3MnKQpTZWxmID0gX2NsYXNzKCdTZWxmJykKVHlwZVZhclR1cGxlID0gX2NsYXNzKCdUeXBlVmFyVHVwbGUnKQpVbnBhY2sgPSBfY2xhc3MoJ1VucGFjaycpCkFubm90YXRlZCA9IF9jbGFzcygnQW5ub3RhdGVkJykKSW50VmFyID0gX2NsYXNzKCdJbnRWYXInKQpMaXRlcmFsID0gX2NsYXNzKCdMaXRlcmFsJykKVHlwZUFsaWFzID0gX2NsYXNzKCdUeXBlQWxpYXMnKQpUeXBlR3VhcmQgPSBfY2xhc3MoJ1R5cGVHdWFyZCcpCk5ldmVyID0gX2NsYXNzKCdOZXZlcicpCk5vUmV0dXJuID0gX2NsYXNzKCdOb1JldHVybicpClJlcXVpcmVkID0gX2NsYXNzKCdSZXF1aXJlZCcpCk5vdFJlcXVpcmVkID0gX2NsYXNzKCdOb3RSZXF1aXJlZCcpCkFzeW5jQ29udGV4dE1hbiA9IEFzeW5jQ29udGV4dE1hbmFnZXIKZGF0YWNsYXNzX3RyYW5zID0gZGF0YWNsYXNzX3RyYW5zZm9ybQpydW50aW1lX2NoZWNrYWIgPSBydW50aW1lX2NoZWNrYWJsZQo='
+
+
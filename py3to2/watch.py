@@ -0,0 +1,290 @@
+from typing import *
+from collections import namedtuple
+import os
+import select
+import sys
+import time
+
+from .main import convert_tree_file, initialize_directory
+from .project import ModuleGraph, get_module_name, is_package_path
+from .tree import SKIPPED_DIRECTORIES, FileState, mirror_file, prune_files, snapshot_tree
+
+if TYPE_CHECKING:
+    from .cache import ConversionCache
+    from .convert import Converter
+
+
+# ==========================================
+# py3to2 watch: 先 convert-tree 一遍，之后只重新转换 SRC 里改动过的文件
+#
+# What changed is always found by comparing two snapshots of SRC (see
+# `snapshot_tree`); inotify, when available, only tells when to take the next one, so
+# an idle watch costs nothing. Without inotify SRC is polled every `interval` seconds.
+# A burst of changes (an editor saving several files, a checkout) is handled once SRC
+# has been quiet for `debounce` seconds.
+
+# kind: added, modified, removed, renamed (old_path -> path) 或 dependent
+# (--resolver=syntactic 下，它 import 的模块的类变了)
+WatchEvent = namedtuple('WatchEvent', ['kind', 'path', 'old_path'], defaults=(None,))
+
+
+def diff_snapshots(old: Mapping[str, FileState], new: Mapping[str, FileState]) -> List[WatchEvent]:
+    """
+    The events that turn `old` into `new`. A removed path and an added path with the
+    same inode are reported as a rename.
+    """
+    removed = [path for path in old if path not in new]
+    removed_by_inode = {old[path][2]: path for path in removed}
+    events = []
+    for path in new:
+        if path in old:
+            if new[path] != old[path]:
+                events.append(WatchEvent('modified', path))
+            continue
+        old_path = removed_by_inode.pop(new[path][2], None)
+        if old_path is not None:
+            events.append(WatchEvent('renamed', path, old_path))
+        else:
+            events.append(WatchEvent('added', path))
+    events.extend(WatchEvent('removed', path) for path in removed_by_inode.values())
+    return sorted(events, key=lambda event: event.path)
+
+
+class InotifyWaiter:
+    """
+    Wakes up on any change under `directory` (but not under `excluded`), through a
+    watch on each of its directories. Raises OSError where inotify is not available.
+    """
+
+    # IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    MASK = 0x002 | 0x004 | 0x008 | 0x040 | 0x080 | 0x100 | 0x200
+
+    def __init__(self, directory: str, excluded: str):
+        import ctypes
+
+        if not sys.platform.startswith('linux'):
+            raise OSError('inotify needs Linux')
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self.directory = directory
+        self.excluded = excluded
+        self._watched: Set[str] = set()
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        try:
+            self._add_watches()
+        except OSError:
+            self.close()
+            raise
+
+    def _add_watches(self):
+        import ctypes
+
+        # 新建的目录也要加上
+        for folder, folders, _ in os.walk(self.directory):
+            folders[:] = [name for name in folders if name not in SKIPPED_DIRECTORIES
+                          and os.path.realpath(os.path.join(folder, name)) != self.excluded]
+            if folder in self._watched:
+                continue
+            if self._libc.inotify_add_watch(self.fd, os.fsencode(folder), self.MASK) < 0:
+                errno = ctypes.get_errno()
+                if os.path.isdir(folder):
+                    raise OSError(errno, 'inotify_add_watch failed on %s' % folder)
+                continue
+            self._watched.add(folder)
+
+    def wait(self, timeout: Optional[float]) -> bool:
+        """
+        Returns True once something changed, False if nothing did within `timeout`.
+        """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return False
+        # 事件的内容不用解析，下一个 snapshot 会告诉我们改了什么
+        while True:
+            try:
+                if not os.read(self.fd, 65536):
+                    break
+            except BlockingIOError:
+                break
+        self._watched = {folder for folder in self._watched if os.path.isdir(folder)}
+        self._add_watches()
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Watcher:
+    """
+    Keeps `target_directory` in sync with `source_directory` after a `convert-tree`.
+    Added and modified Python files are converted with `converter`, which stays
+    loaded between events, other files are mirrored, and the outputs of removed files
+    (and the old paths of renamed ones) are pruned. Each event is logged to `log` with
+    its latency, from the time the file was saved (or the removal was seen) to the
+    time its output was written.
+    """
+
+    def __init__(self, source_directory: str, target_directory: str, converter: 'Converter',
+                 cache: Optional['ConversionCache'] = None, link: bool = True, interval: float = 0.25,
+                 debounce: float = 0.1, poll: bool = False, log: TextIO = sys.stderr):
+        self.source_directory = source_directory
+        self.target_directory = target_directory
+        self.converter = converter
+        self.cache = cache
+        self.link = link
+        self.interval = interval
+        self.debounce = debounce
+        self.log = log
+        self.waiter: Optional[InotifyWaiter] = None
+        if not poll:
+            try:
+                self.waiter = InotifyWaiter(source_directory, os.path.realpath(target_directory))
+            except (OSError, AttributeError) as e:
+                log.write('py3to2: watch: inotify is not available (%s), polling every %gs\n' % (e, interval))
+
+    def snapshot(self) -> Dict[str, FileState]:
+        return snapshot_tree(self.source_directory, self.target_directory)
+
+    def _wait(self, timeout: Optional[float]) -> bool:
+        if self.waiter is not None:
+            return self.waiter.wait(timeout)
+        time.sleep(self.interval if timeout is None else timeout)
+        return True
+
+    def wait_for_changes(self, snapshot: Dict[str, FileState]) -> Tuple[Dict[str, FileState], float]:
+        """
+        Waits until the source tree differs from `snapshot` and has been quiet for
+        `debounce` seconds. Returns the new snapshot and the time the change was seen.
+        """
+        while True:
+            self._wait(None)
+            current = self.snapshot()
+            if current != snapshot:
+                break
+        seen = time.time()
+        while self._wait(self.debounce):
+            if self.waiter is not None:
+                continue
+            latest = self.snapshot()
+            if latest == current:
+                break
+            current = latest
+        if self.waiter is not None:
+            current = self.snapshot()
+        return current, seen
+
+    def _source(self, path: str) -> str:
+        return os.path.join(self.source_directory, path)
+
+    def _target(self, path: str) -> str:
+        return os.path.join(self.target_directory, path)
+
+    def _update_class_index(self, events: List[WatchEvent]) -> List[WatchEvent]:
+        # 类的索引变了的话，import 了这些模块的文件（包括间接的）也要重新转换
+        index = self.converter.class_index
+        if index is None or not self.converter.infer:
+            return events
+        digest = index.digest()
+        changed = set()
+        for event in events:
+            if not event.path.endswith('.py'):
+                continue
+            if event.old_path is not None:
+                old_module = get_module_name(self._source(event.old_path), self.source_directory)
+                index.remove(old_module)
+                changed.add(old_module)
+            module_name = get_module_name(self._source(event.path), self.source_directory)
+            source = None
+            if event.kind != 'removed':
+                # 编辑器保存时常常先写临时文件再 rename，读的时候可能已经不在了
+                try:
+                    with open(self._source(event.path), 'rb') as f:
+                        source = f.read()
+                except OSError:
+                    pass
+            if source is None:
+                index.remove(module_name)
+            else:
+                index.add(module_name, source, is_package_path(event.path))
+            changed.add(module_name)
+        if index.digest() == digest:
+            return events
+
+        paths = [self._source(path) for path, _ in sorted(self.snapshot().items()) if path.endswith('.py')]
+        graph = ModuleGraph(self.source_directory, paths)
+        dependents = graph.dependents()
+        queue = [module_name for module_name in changed if module_name in dependents]
+        seen = set(queue)
+        while queue:
+            for dependent in dependents[queue.pop()]:
+                if dependent not in seen:
+                    seen.add(dependent)
+                    queue.append(dependent)
+        event_paths = {event.path for event in events}
+        for module_name in sorted(seen - changed):
+            path = os.path.relpath(graph.paths[module_name], self.source_directory)
+            if path not in event_paths:
+                events.append(WatchEvent('dependent', path))
+        return events
+
+    def apply(self, events: List[WatchEvent], snapshot: Mapping[str, FileState], seen: float,
+              since: Optional[float] = None) -> int:
+        """
+        Reflects `events` in the target directory. Returns the number of files that
+        failed to convert.
+
+        The latency of an event counts from the mtime of the file if it is after
+        `since` (the time of the previous snapshot), and from `seen` otherwise: renames
+        and removals do not change the mtime.
+        """
+        n_failed = 0
+        for event in self._update_class_index(events):
+            start = time.perf_counter()
+            if event.old_path is not None:
+                prune_files(self.target_directory, [event.old_path])
+            if event.kind == 'removed':
+                prune_files(self.target_directory, [event.path])
+                action = 'pruned'
+            elif event.path.endswith('.py'):
+                os.makedirs(os.path.dirname(self._target(event.path)) or '.', exist_ok=True)
+                result = convert_tree_file(self._source(event.path), self._target(event.path),
+                                           self.target_directory, self.cache, self.converter)
+                if result.error is not None:
+                    self.log.write('py3to2: error converting %s\n%s' % (result.path, result.error))
+                    n_failed += 1
+                    action = 'failed'
+                else:
+                    action = 'converted' if result.written else 'unchanged'
+                    # --strip-typing 时 shim 只在有文件 import 的时候才写
+                    shims = [name for name in result.shims if not os.path.exists(self._target(name))]
+                    if shims:
+                        initialize_directory(self.target_directory, shims)
+            else:
+                mirror_file(self._source(event.path), self._target(event.path), link=self.link)
+                action = 'mirrored'
+            elapsed = time.perf_counter() - start
+            changed_at = seen
+            if since is not None and event.path in snapshot and snapshot[event.path][0] / 1e9 > since:
+                changed_at = snapshot[event.path][0] / 1e9
+            name = event.path if event.old_path is None else '%s -> %s' % (event.old_path, event.path)
+            self.log.write('py3to2: watch: %s %s: %s in %.3fs, %.3fs after the change\n' % (
+                event.kind, name, action, elapsed, time.time() - changed_at))
+        self.log.flush()
+        return n_failed
+
+    def run(self, snapshot: Optional[Dict[str, FileState]] = None):
+        """
+        Watches forever. `snapshot` is the state the target directory was converted from.
+        """
+        if snapshot is None:
+            snapshot = self.snapshot()
+        since = time.time()
+        try:
+            while True:
+                current, seen = self.wait_for_changes(snapshot)
+                self.apply(diff_snapshots(snapshot, current), current, seen, since)
+                # current 是在 apply 之前取的
+                snapshot, since = current, seen
+        finally:
+            if self.waiter is not None:
+                self.waiter.close()